@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基准测试语料生成
+生成不同格式（JPEG/PNG/TIFF）、尺寸（百万像素）和模式（RGB/RGBA）的合成图片。
+图片内容为渐变加噪声，压缩率接近真实照片；相同参数的图片已存在时直接复用。
+"""
+
+import os
+import math
+import numpy as np
+from PIL import Image
+
+FORMATS = {
+    'JPEG': '.jpg',
+    'PNG': '.png',
+    'TIFF': '.tif'
+}
+MODES = ('RGB', 'RGBA')
+
+
+def image_size(megapixels):
+    """
+    按 3:2 的宽高比计算指定百万像素数的图片尺寸
+    """
+    width = max(1, int(round(math.sqrt(megapixels * 1000000 * 1.5))))
+    height = max(1, int(round(width / 1.5)))
+    return width, height
+
+
+def synthetic_image(megapixels, mode, seed=0):
+    """
+    生成渐变加噪声的图片，RGBA图片的alpha通道也是渐变
+    """
+    width, height = image_size(megapixels)
+    rng = np.random.default_rng(seed)
+    channels = len(mode)
+
+    # 按行生成，避免大图一次性占用多份临时内存
+    data = np.empty((height, width, channels), dtype=np.uint8)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    for top in range(0, height, 256):
+        rows = min(256, height - top)
+        y = np.linspace(top, top + rows - 1, rows, dtype=np.float32)[:, None] / height * 255
+        noise = rng.integers(0, 48, (rows, width, 3), dtype=np.uint8)
+        data[top:top + rows, :, 0] = (x[None, :] * 0.7 + y * 0.3).astype(np.uint8)
+        data[top:top + rows, :, 1] = (255 - x[None, :] * 0.5 - y * 0.4).astype(np.uint8)
+        data[top:top + rows, :, 2] = (y * 0.8).astype(np.uint8)
+        data[top:top + rows, :, :3] = np.minimum(data[top:top + rows, :, :3].astype(np.uint16) + noise,
+                                                 255).astype(np.uint8)
+        if channels == 4:
+            data[top:top + rows, :, 3] = (128 + x[None, :] / 2).astype(np.uint8)
+    return Image.fromarray(data, mode)
+
+
+def generate_corpus(corpus_dir, sizes, formats=tuple(FORMATS), modes=MODES):
+    """
+    生成语料并返回条目列表，每个条目包含 path、format、megapixels、mode
+    JPEG 不支持透明通道，只生成RGB图片
+    """
+    os.makedirs(corpus_dir, exist_ok=True)
+    entries = []
+    for megapixels in sizes:
+        for mode in modes:
+            image = None
+            for image_format in formats:
+                if image_format == 'JPEG' and mode == 'RGBA':
+                    continue
+                file_name = f"{megapixels:g}mp_{mode.lower()}{FORMATS[image_format]}"
+                path = os.path.join(corpus_dir, file_name)
+                if not os.path.exists(path):
+                    if image is None:
+                        image = synthetic_image(megapixels, mode, seed=int(megapixels * 1000))
+                    temp_path = path + '.tmp'
+                    image.save(temp_path, format=image_format, **({'quality': 90} if image_format == 'JPEG' else {}))
+                    os.replace(temp_path, path)
+                entries.append({'path': path, 'format': image_format,
+                                'megapixels': megapixels, 'mode': mode})
+    return entries
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图像处理热点路径基准测试
+在合成语料上测量各水印接口、调整大小、读写和 BatchProcessor 端到端吞吐量，
+记录每项的耗时和峰值内存（RSS），结果保存为JSON，并可与基线比较，超出容差时以退出码1结束。
+
+用法示例：
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --profile full --save-baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --tolerance 0.15
+
+基线与机器相关，应在同一台（或同规格的）机器上生成和比较。
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+
+# 添加项目根目录到Python路径（TemplateManager 等模块使用 core.* 导入，需要 src 目录）
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (project_root, os.path.join(project_root, 'src')):
+    if path not in sys.path:
+        sys.path.append(path)
+
+import numpy as np
+import PIL
+
+from benchmarks.corpus import FORMATS, MODES, generate_corpus, synthetic_image
+from src.core.image_processor import ImageProcessor
+from src.core.batch_processor import BatchProcessor
+from src.core.watermark import Watermark
+from src.utils.logger import set_console_level
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块
+    resource = None
+
+# 预设的图片尺寸（百万像素）
+PROFILES = {
+    'quick': [1, 4],
+    'full': [1, 12, 24, 50, 100]
+}
+
+IMAGE_BENCHMARKS = ('add_text_watermark', 'add_image_watermark', 'add_tiled_watermark',
+                    'add_tiled_image_watermark', 'watermark_apply', 'prepared_apply', 'resize_image')
+FILE_BENCHMARKS = ('load_image', 'save_image')
+RESULT_VERSION = 1
+
+
+def reset_peak_rss():
+    """
+    重置进程的峰值内存记录（Linux 的 /proc/self/clear_refs），返回是否成功
+    不支持时峰值内存只能统计整个进程生命周期的最大值
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb(children=False):
+    """
+    读取峰值内存（MB），children 为 True 时返回已结束子进程中的最大值
+    """
+    if not children:
+        try:
+            with open('/proc/self/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        return round(int(line.split()[1]) / 1024, 1)
+        except OSError:
+            pass
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # macOS 的单位为字节，Linux 为KB
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(usage.ru_maxrss / divisor, 1)
+
+
+def measure(func, repeat, warmup=1):
+    """
+    执行 warmup 次预热后计时 repeat 次，返回最短、中位耗时和期间的峰值内存
+    """
+    for _ in range(warmup):
+        func()
+    per_case_rss = reset_peak_rss()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return {
+        'repeat': repeat,
+        'min_seconds': round(min(durations), 6),
+        'median_seconds': round(statistics.median(durations), 6),
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_rss_per_case': per_case_rss
+    }
+
+
+def benchmark_id(name, image_format, megapixels, mode):
+    """
+    基准项的唯一标识，用于与基线对应
+    """
+    return f"{name}/{image_format}/{megapixels:g}MP/{mode}"
+
+
+def make_result(name, image_format, megapixels, mode, measurement):
+    """
+    组合一条结果记录
+    """
+    result = {
+        'id': benchmark_id(name, image_format, megapixels, mode),
+        'name': name,
+        'format': image_format,
+        'megapixels': megapixels,
+        'mode': mode
+    }
+    result.update(measurement)
+    if megapixels and measurement['min_seconds'] > 0:
+        result['megapixels_per_second'] = round(megapixels / measurement['min_seconds'], 3)
+    return result
+
+
+def build_watermarks(work_dir):
+    """
+    创建基准测试使用的水印图片和Watermark对象
+    """
+    logo_path = os.path.join(work_dir, 'logo.png')
+    if not os.path.exists(logo_path):
+        synthetic_image(0.08, 'RGBA', seed=1).save(logo_path)
+
+    watermark = Watermark()
+    watermark.set_text_watermark("PhotoWatermark2 Benchmark", font_size=48, opacity=60)
+    watermark.set_style(has_shadow=True, has_stroke=True)
+    watermark.set_rotation(15)
+    watermark.set_position('bottom-right')
+    return logo_path, watermark
+
+
+def image_cases(image, logo_path, watermark, prepared):
+    """
+    与文件格式无关的图片处理基准项
+    """
+    return {
+        'add_text_watermark': lambda: ImageProcessor.add_text_watermark(
+            image, "PhotoWatermark2 Benchmark", 'bottom-right', font_size=48, rotation=15),
+        'add_image_watermark': lambda: ImageProcessor.add_image_watermark(
+            image, logo_path, 'center', 50, 1.0, 15),
+        'add_tiled_watermark': lambda: ImageProcessor.add_tiled_watermark(
+            image, "Benchmark", font_size=32, rotation=30, spacing=80),
+        'add_tiled_image_watermark': lambda: ImageProcessor.add_tiled_image_watermark(
+            image, logo_path, 50, 0.5, 0, 80),
+        'watermark_apply': lambda: watermark.apply_watermark(image),
+        'prepared_apply': lambda: prepared.apply_watermark(image),
+        'resize_image': lambda: ImageProcessor.resize_image(image, percentage=50)
+    }
+
+
+def load_case(path):
+    """
+    读取并完成解码
+    """
+    def run():
+        image = ImageProcessor.load_image(path, keep_native_mode=True)
+        image.load()
+        return image
+    return run
+
+
+def run_image_benchmarks(entries, work_dir, repeat, selected, report):
+    """
+    运行单张图片的基准项
+    图片以原始RGB/RGBA模式加载（区域合成模式），水印接口在每种尺寸和模式上各测一次，
+    读写在每种格式上各测一次
+    """
+    logo_path, watermark = build_watermarks(work_dir)
+    prepared = watermark.prepare()
+    results = []
+
+    for entry in entries:
+        image_format, megapixels, mode = entry['format'], entry['megapixels'], entry['mode']
+
+        if 'load_image' in selected:
+            results.append(report(make_result('load_image', image_format, megapixels, mode,
+                                              measure(load_case(entry['path']), repeat))))
+
+        image = load_case(entry['path'])()
+        if 'save_image' in selected:
+            output_path = os.path.join(work_dir, 'save_output' + FORMATS[image_format])
+            results.append(report(make_result('save_image', image_format, megapixels, mode, measure(
+                lambda: ImageProcessor.save_image(image, output_path, format=image_format, quality=90),
+                repeat))))
+
+        # 水印接口与文件格式无关，只在每种尺寸和模式的第一个文件上测量
+        if any(other['megapixels'] == megapixels and other['mode'] == mode
+               for other in entries[:entries.index(entry)]):
+            continue
+        for name, func in image_cases(image, logo_path, watermark, prepared).items():
+            if name in selected:
+                results.append(report(make_result(name, '-', megapixels, mode, measure(func, repeat))))
+        del image
+    return results
+
+
+def run_batch_once(processor, image_paths, output_dir, watermark):
+    """
+    运行一次批量处理并等待完成，返回完成回调的结果
+    """
+    finished = threading.Event()
+    state = {'result': None, 'errors': []}
+
+    def on_complete(result):
+        state['result'] = result
+        finished.set()
+
+    processor.set_callbacks(complete_callback=on_complete,
+                            error_callback=lambda message, path=None: state['errors'].append(message))
+    processor.start_processing(image_paths, output_dir, watermark, output_format='JPEG', quality=90)
+    finished.wait()
+    if state['errors']:
+        raise RuntimeError(f"批量处理出错: {state['errors'][0]}")
+    return state['result']
+
+
+def run_batch_benchmarks(source_path, megapixels, work_dir, image_count, execution_modes,
+                         repeat, report):
+    """
+    端到端批量处理吞吐量：将同一张JPEG复制为 image_count 个文件，按各执行模式处理
+    """
+    batch_dir = os.path.join(work_dir, f"batch_{megapixels:g}mp")
+    os.makedirs(batch_dir, exist_ok=True)
+    image_paths = []
+    for i in range(image_count):
+        path = os.path.join(batch_dir, f"image_{i:04d}.jpg")
+        if not os.path.exists(path):
+            shutil.copyfile(source_path, path)
+        image_paths.append(path)
+    input_megabytes = sum(os.path.getsize(path) for path in image_paths) / 1024 / 1024
+
+    _, watermark = build_watermarks(work_dir)
+    results = []
+    for execution_mode in execution_modes:
+        output_dir = os.path.join(work_dir, f"batch_output_{execution_mode}")
+
+        def run():
+            shutil.rmtree(output_dir, ignore_errors=True)
+            return run_batch_once(BatchProcessor(execution_mode=execution_mode), image_paths,
+                                  output_dir, watermark)
+
+        measurement = measure(run, repeat)
+        result = make_result(f"batch_{execution_mode}", 'JPEG', megapixels, 'RGB', measurement)
+        seconds = measurement['min_seconds']
+        result.update({
+            'images': image_count,
+            'images_per_second': round(image_count / seconds, 3) if seconds > 0 else None,
+            'megabytes_per_second': round(input_megabytes / seconds, 3) if seconds > 0 else None,
+            'megapixels_per_second': round(megapixels * image_count / seconds, 3) if seconds > 0 else None,
+            'children_peak_rss_mb': peak_rss_mb(children=True)
+        })
+        results.append(report(result))
+    return results
+
+
+def compare_results(current, baseline, tolerance=0.15, memory_tolerance=0.25):
+    """
+    与基线比较，返回回归列表
+    耗时比较最短耗时（受系统噪声影响最小），峰值内存只在两次运行都能按项统计时比较
+    """
+    baseline_results = {result['id']: result for result in baseline.get('results', [])}
+    regressions = []
+    for result in current.get('results', []):
+        reference = baseline_results.get(result['id'])
+        if reference is None:
+            continue
+        checks = [('min_seconds', tolerance)]
+        if result.get('peak_rss_per_case') and reference.get('peak_rss_per_case'):
+            checks.append(('peak_rss_mb', memory_tolerance))
+        for metric, allowed in checks:
+            old_value, new_value = reference.get(metric), result.get(metric)
+            if not old_value or new_value is None:
+                continue
+            ratio = new_value / old_value
+            if ratio > 1 + allowed:
+                regressions.append({'id': result['id'], 'metric': metric, 'baseline': old_value,
+                                    'current': new_value, 'ratio': round(ratio, 3)})
+    return regressions
+
+
+def parse_list(value, cast=str):
+    """
+    解析逗号分隔的参数
+    """
+    return [cast(item.strip()) for item in value.split(',') if item.strip()]
+
+
+def build_parser():
+    """
+    构建命令行参数解析器
+    """
+    parser = argparse.ArgumentParser(description="PhotoWatermark2 图像处理基准测试")
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='quick',
+                        help="预设图片尺寸：quick 为 1/4MP，full 为 1/12/24/50/100MP（默认 quick）")
+    parser.add_argument('--sizes', type=lambda value: parse_list(value, float),
+                        help="逗号分隔的图片尺寸（百万像素），覆盖 --profile")
+    parser.add_argument('--formats', type=lambda value: parse_list(value.upper()), default=list(FORMATS),
+                        help="逗号分隔的文件格式（默认 JPEG,PNG,TIFF）")
+    parser.add_argument('--modes', type=lambda value: parse_list(value.upper()), default=list(MODES),
+                        help="逗号分隔的颜色模式（默认 RGB,RGBA）")
+    parser.add_argument('--benchmarks', type=parse_list,
+                        help="只运行指定的基准项（逗号分隔），可选: "
+                             + ', '.join(IMAGE_BENCHMARKS + FILE_BENCHMARKS + ('batch',)))
+    parser.add_argument('--repeat', type=int, default=3, help="每项计时次数（默认 %(default)s）")
+    parser.add_argument('--corpus-dir', help="语料目录，已生成的图片会被复用（默认使用临时目录）")
+    parser.add_argument('--batch-images', type=int, default=16,
+                        help="批量吞吐量测试的图片数量（默认 %(default)s）")
+    parser.add_argument('--batch-modes', type=parse_list, default=list(BatchProcessor.EXECUTION_MODES),
+                        help="批量吞吐量测试的执行模式（默认 thread,process,pipeline）")
+    parser.add_argument('--output', help="结果JSON文件")
+    parser.add_argument('--baseline', help="基线JSON文件，超出容差时退出码为1")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="允许的耗时增长比例（默认 %(default)s）")
+    parser.add_argument('--memory-tolerance', type=float, default=0.25,
+                        help="允许的峰值内存增长比例（默认 %(default)s）")
+    parser.add_argument('--save-baseline', help="将本次结果保存为基线文件")
+    return parser
+
+
+def main(argv=None):
+    """
+    运行基准测试，返回进程退出码：0 正常，1 存在性能回归，2 参数错误
+    """
+    args = build_parser().parse_args(argv)
+    sizes = args.sizes or PROFILES[args.profile]
+    unknown = [name for name in args.formats if name not in FORMATS] + \
+              [name for name in args.modes if name not in MODES]
+    if unknown or args.repeat < 1:
+        print(f"参数错误: {', '.join(unknown) or '--repeat 必须大于0'}", file=sys.stderr)
+        return 2
+    selected = set(args.benchmarks or IMAGE_BENCHMARKS + FILE_BENCHMARKS + ('batch',))
+
+    set_console_level('ERROR')
+    corpus_dir = args.corpus_dir or os.path.join(tempfile.gettempdir(), 'photowatermark2-bench-corpus')
+    work_dir = tempfile.mkdtemp(prefix='photowatermark2-bench-')
+
+    def report(result):
+        rss = result['peak_rss_mb']
+        print(f"{result['id']:<48} {result['min_seconds'] * 1000:>10.2f} ms"
+              f"{'' if rss is None else f'  {rss:>8.1f} MB'}", flush=True)
+        return result
+
+    try:
+        entries = generate_corpus(corpus_dir, sizes, args.formats, args.modes)
+        results = run_image_benchmarks(entries, work_dir, args.repeat, selected, report)
+        if 'batch' in selected and args.batch_images > 0:
+            batch_source = next((entry for entry in entries
+                                 if entry['format'] == 'JPEG' and entry['megapixels'] == min(sizes)), None)
+            if batch_source is None:
+                batch_source = generate_corpus(corpus_dir, [min(sizes)], ['JPEG'], ['RGB'])[0]
+            results += run_batch_benchmarks(batch_source['path'], batch_source['megapixels'], work_dir,
+                                            args.batch_images, args.batch_modes, args.repeat, report)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = {
+        'version': RESULT_VERSION,
+        'metadata': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'pillow': PIL.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'sizes': sizes,
+            'repeat': args.repeat
+        },
+        'results': results
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(output, f, ensure_ascii=False, indent=2)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare_results(output, baseline, args.tolerance, args.memory_tolerance)
+    for regression in regressions:
+        print(f"性能回归: {regression['id']} {regression['metric']} "
+              f"{regression['baseline']} -> {regression['current']} (x{regression['ratio']})", file=sys.stderr)
+    if not regressions:
+        print(f"与基线相比没有超出容差的回归（耗时容差 {args.tolerance:.0%}）", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
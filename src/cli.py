@@ -0,0 +1,479 @@
+"""
+PhotoWatermark2 命令行入口
+用于无图形界面的服务器上批量添加水印，不依赖 PyQt6
+
+用法示例：
+    python -m src.cli batch photos/ -o output/ --template 公司Logo
+    python -m src.cli batch "photos/**/*.jpg" -o output/ --template 公司Logo --mode pipeline
+    python -m src.cli preflight photos/ -r --workers 8
+
+进度和汇总信息以 NDJSON（每行一个JSON对象）输出到标准输出，日志输出到标准错误。
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import signal
+import argparse
+import threading
+import multiprocessing
+
+# 处理PyInstaller打包后的资源路径
+base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 确保能正确导入项目模块（TemplateManager 使用 core.* 导入，需要 src 目录）
+for path in (base_path, os.path.join(base_path, 'src')):
+    if path not in sys.path:
+        sys.path.append(path)
+
+from src.core.batch_processor import BatchProcessor
+from src.core.batch_stats import percentile
+from src.core.image_processor import ImageProcessor
+from src.core.output_cache import OutputCache
+from src.core.folder_watcher import FolderWatcher
+from src.core.preflight import PreflightScanner, CostModel
+from src.core.watermark import Watermark
+from src.utils.config import ConfigManager
+from src.utils.template_manager import TemplateManager
+from src.utils.logger import info, error, set_console_level
+from src.utils import tracing
+
+
+class NDJSONReporter:
+    """
+    NDJSON事件输出器，每个事件输出为一行JSON
+    批量处理的回调在后台线程中调用，输出时加锁保证每行完整
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        """
+        输出一个事件
+        """
+        record = {'event': event, 'timestamp': round(time.time(), 3)}
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+
+def collect_images(inputs, recursive=False, supported_only=True):
+    """
+    根据输入的文件、目录或通配符收集支持的图片，结果去重并保持输入顺序
+    supported_only 为 False 时收集所有文件（预检需要报告不支持的文件）
+    """
+    image_paths = []
+    seen = set()
+
+    def add(path):
+        path = os.path.abspath(path)
+        if path not in seen and os.path.isfile(path) and (
+                not supported_only or ImageProcessor.is_supported_format(path)):
+            seen.add(path)
+            image_paths.append(path)
+
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            if recursive:
+                for root, dirs, files in os.walk(pattern):
+                    dirs.sort()
+                    for filename in sorted(files):
+                        add(os.path.join(root, filename))
+            else:
+                for filename in sorted(os.listdir(pattern)):
+                    add(os.path.join(pattern, filename))
+        elif os.path.isfile(pattern):
+            add(pattern)
+        else:
+            for path in sorted(glob.glob(pattern, recursive=True)):
+                add(path)
+
+    return image_paths
+
+
+def load_watermark(template_name, templates_dir=None):
+    """
+    从模板加载水印配置
+    模板管理器返回的水印对象经由配置字典重建，确保与批量处理器使用同一个模块
+    """
+    template_manager = TemplateManager(templates_dir)
+    template_watermark, _ = template_manager.load_template(template_name)
+    watermark = Watermark()
+    watermark.from_dict(template_watermark.to_dict())
+    return watermark
+
+
+def resolve_output_settings(args):
+    """
+    解析输出设置：命令行参数优先，其次为配置文件
+    返回 (输出目录, 格式, 质量, 前缀, 后缀)
+    """
+    output_settings = ConfigManager(args.config_dir).get_output_settings()
+    output_format = (args.format or output_settings['format']).upper()
+    if output_format == 'JPG':
+        output_format = 'JPEG'
+    quality = args.quality if args.quality is not None else output_settings['quality']
+    prefix = args.prefix if args.prefix is not None else output_settings['prefix']
+    suffix = args.suffix if args.suffix is not None else output_settings['suffix']
+    output_dir = args.output or output_settings['last_dir']
+    return output_dir, output_format, quality, prefix, suffix
+
+
+def strip_threshold(args):
+    """
+    将 --strip-threshold（百万像素）换算为像素数，未指定时返回 None
+    """
+    return None if args.strip_threshold is None else int(args.strip_threshold * 1000000)
+
+
+def parallel_threshold(args):
+    """
+    将 --parallel-threshold（百万像素）换算为像素数，未指定时使用默认值，0 表示关闭
+    """
+    if args.parallel_threshold is None:
+        return ImageProcessor.PARALLEL_THRESHOLD
+    return int(args.parallel_threshold * 1000000) or None
+
+
+def round_or_none(value, digits=3):
+    """
+    保留指定位数的小数，None 保持不变
+    """
+    return None if value is None else round(value, digits)
+
+
+def run_batch(args, reporter):
+    """
+    执行 batch 子命令，返回进程退出码
+    """
+    try:
+        watermark = load_watermark(args.template, args.templates_dir)
+    except Exception as e:
+        reporter.emit('fatal', message=str(e))
+        return 2
+
+    output_dir, output_format, quality, prefix, suffix = resolve_output_settings(args)
+    if not output_dir:
+        reporter.emit('fatal', message="未指定输出目录，请使用 --output")
+        return 2
+
+    image_paths = collect_images(args.inputs, args.recursive)
+    if not image_paths:
+        reporter.emit('fatal', message="没有找到需要处理的图片")
+        return 2
+
+    processor = BatchProcessor(execution_mode=args.mode, max_workers=args.workers)
+    processor.set_region_compositing(args.region_compositing)
+    processor.set_reduced_decoding(args.fast_resize)
+    processor.set_strip_processing(strip_threshold(args))
+    processor.set_parallel_compositing(parallel_threshold(args))
+    processor.set_memory_budget(args.memory_budget * 1024 * 1024 if args.memory_budget else None)
+    processor.set_journal(args.journal)
+    if args.cache_dir:
+        processor.set_output_cache(args.cache_dir, max_size=args.cache_size * 1024 * 1024)
+
+    finished = threading.Event()
+    state = {'processed': 0, 'failed': 0, 'result': None}
+
+    def on_progress(progress, image_path=None):
+        state['processed'] += 1
+        reporter.emit('progress', progress=progress, processed=state['processed'],
+                      total=len(image_paths), path=image_path)
+
+    def on_error(message, image_path=None):
+        state['failed'] += 1
+        reporter.emit('error', path=image_path, message=message)
+
+    def on_complete(result):
+        state['result'] = result
+        finished.set()
+
+    processor.set_callbacks(progress_callback=on_progress,
+                            complete_callback=on_complete,
+                            error_callback=on_error)
+
+    reporter.emit('start', total=len(image_paths), output_dir=os.path.abspath(output_dir),
+                  template=args.template, mode=args.mode,
+                  workers=processor.get_worker_count(), format=output_format)
+    info(f"命令行批量处理开始: {len(image_paths)} 张图片, 模式 {args.mode}")
+
+    start_time = time.perf_counter()
+    try:
+        processor.start_processing(image_paths, output_dir, watermark,
+                                   output_format=output_format, quality=quality,
+                                   rename_prefix=prefix, rename_suffix=suffix,
+                                   resize_width=args.width, resize_height=args.height,
+                                   resize_percentage=args.percentage)
+        while not finished.wait(timeout=0.5):
+            pass
+    except KeyboardInterrupt:
+        processor.cancel()
+        finished.wait(timeout=5.0)
+    except Exception as e:
+        error(f"命令行批量处理失败: {str(e)}")
+        reporter.emit('fatal', message=str(e))
+        return 2
+    elapsed = time.perf_counter() - start_time
+
+    result = state['result'] or {'processed_count': state['processed'], 'skipped_count': 0,
+                                 'cancelled': True}
+    processed = result['processed_count']
+    # 字节吞吐量只统计实际解码处理的图片，任务日志跳过和输出缓存恢复的图片不计入
+    stats = result.get('stats') or processor.stats.summary()
+    input_megabytes = stats['input_megabytes']
+    reporter.emit('summary',
+                  processed=processed,
+                  skipped=result['skipped_count'],
+                  cached=result.get('cached_count', 0),
+                  failed=state['failed'],
+                  total=len(image_paths),
+                  cancelled=result['cancelled'],
+                  elapsed_seconds=round(elapsed, 3),
+                  images_per_second=round(processed / elapsed, 3) if elapsed > 0 else None,
+                  input_megabytes=input_megabytes,
+                  cached_megabytes=stats['cached_input_megabytes'],
+                  megabytes_per_second=round(input_megabytes / elapsed, 3) if elapsed > 0 else None,
+                  stats=result.get('stats'))
+
+    if args.stats_json:
+        try:
+            processor.export_stats(args.stats_json)
+        except Exception as e:
+            error(str(e))
+
+    if result['cancelled']:
+        return 130
+    return 1 if state['failed'] else 0
+
+
+def run_preflight(args, reporter):
+    """
+    执行 preflight 子命令：只读取文件头，报告不支持、无法读取或过大（无法整图解码也不能分条带处理）的文件，
+    并预测处理时间
+    返回进程退出码：0 全部可以处理，1 存在不能处理的文件，2 参数错误
+    """
+    try:
+        cost_model = CostModel.from_benchmark_results(args.calibration) if args.calibration else CostModel()
+    except Exception as e:
+        reporter.emit('fatal', message=str(e))
+        return 2
+
+    image_paths = collect_images(args.inputs, args.recursive, supported_only=False)
+    if not image_paths:
+        reporter.emit('fatal', message="没有找到需要检查的文件")
+        return 2
+
+    output_format = (args.format or ConfigManager(args.config_dir).get_output_settings()['format']).upper()
+    if output_format == 'JPG':
+        output_format = 'JPEG'
+    workers = args.workers or os.cpu_count() or 1
+
+    summary = PreflightScanner.run(image_paths, cost_model, workers=workers, scan_workers=args.scan_workers,
+                                   output_format=output_format, resize_width=args.width,
+                                   resize_height=args.height, resize_percentage=args.percentage,
+                                   strip_threshold=strip_threshold(args))
+    for image_path in summary['unsupported']:
+        reporter.emit('unsupported', path=image_path)
+    for item in summary['unreadable']:
+        reporter.emit('unreadable', path=item['path'], message=item['error'])
+    for item in summary['too_large']:
+        reporter.emit('too_large', path=item['path'], megapixels=item['megapixels'])
+    reporter.emit('summary', **summary)
+
+    return 1 if summary['unsupported'] or summary['unreadable'] or summary['too_large'] else 0
+
+
+def _raise_interrupt(signum, frame):
+    """
+    将终止信号转换为 KeyboardInterrupt，使监视模式可以正常停止并输出汇总
+    """
+    raise KeyboardInterrupt
+
+
+def run_watch(args, reporter):
+    """
+    执行 watch 子命令：持续监视输入目录，直到收到中断信号，返回进程退出码
+    """
+    try:
+        watermark = load_watermark(args.template, args.templates_dir)
+    except Exception as e:
+        reporter.emit('fatal', message=str(e))
+        return 2
+
+    output_dir, output_format, quality, prefix, suffix = resolve_output_settings(args)
+    if not output_dir:
+        reporter.emit('fatal', message="未指定输出目录，请使用 --output")
+        return 2
+
+    latencies = []
+
+    def on_file(result):
+        latencies.append(result['latency'])
+        reporter.emit('file', path=result['image_path'], output=result['output_path'],
+                      latency_seconds=round(result['latency'], 3),
+                      settle_seconds=round(result['settle'], 3),
+                      processing_seconds=round(result['processing'], 3))
+
+    def on_error(message, image_path=None):
+        reporter.emit('error', path=image_path, message=message)
+
+    try:
+        watcher = FolderWatcher(
+            args.inputs, output_dir, watermark,
+            output_format=output_format, quality=quality,
+            rename_prefix=prefix, rename_suffix=suffix,
+            resize_width=args.width, resize_height=args.height, resize_percentage=args.percentage,
+            recursive=args.recursive, execution_mode=args.mode, max_workers=args.workers,
+            settle_time=args.settle, poll_interval=args.poll_interval,
+            use_native_events=not args.polling, process_existing=args.existing,
+            region_compositing=args.region_compositing, reduced_decoding=args.fast_resize,
+            strip_threshold=strip_threshold(args), parallel_threshold=parallel_threshold(args))
+        watcher.set_callbacks(file_callback=on_file, error_callback=on_error)
+        watcher.start()
+    except Exception as e:
+        reporter.emit('fatal', message=str(e))
+        return 2
+
+    reporter.emit('start', inputs=watcher.input_dirs, output_dir=watcher.output_dir,
+                  template=args.template, mode=args.mode, workers=watcher.max_workers,
+                  events='native' if watcher.use_native_events else 'polling')
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    try:
+        while watcher.is_running:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+
+    reporter.emit('summary',
+                  processed=watcher.processed_count,
+                  failed=watcher.error_count,
+                  latency_p50_seconds=round_or_none(percentile(latencies, 0.5)),
+                  latency_p95_seconds=round_or_none(percentile(latencies, 0.95)),
+                  latency_max_seconds=round_or_none(max(latencies) if latencies else None))
+    return 0
+
+
+def add_output_arguments(parser):
+    """
+    添加各子命令共用的输出和配置参数
+    """
+    parser.add_argument('--region-compositing', action='store_true',
+                        help="使用区域合成模式（RGB图片保持RGB输出，内存占用更低）")
+    parser.add_argument('--format', choices=['PNG', 'JPEG', 'JPG', 'png', 'jpeg', 'jpg'],
+                        help="输出格式（默认使用配置）")
+    parser.add_argument('--quality', type=int, help="输出质量（默认使用配置）")
+    parser.add_argument('--width', type=int, help="输出宽度（只指定宽度时保持比例）")
+    parser.add_argument('--height', type=int, help="输出高度（只指定高度时保持比例）")
+    parser.add_argument('--percentage', type=int, help="按百分比缩放输出图片")
+    parser.add_argument('--fast-resize', action='store_true',
+                        help="缩小输出时按输出尺寸解码（JPEG使用DCT域缩小解码）并在输出尺寸上添加等比缩放的水印")
+    parser.add_argument('--strip-threshold', type=float, metavar='MP',
+                        help="超过该像素数（百万像素）的PNG/TIFF图片分条带处理并输出PNG，峰值内存与图片尺寸无关")
+    parser.add_argument('--parallel-threshold', type=float, metavar='MP',
+                        help=f"需要合成的区域达到该像素数（百万像素）时在多个线程上并行合成水印，"
+                             f"0 表示关闭（默认 {ImageProcessor.PARALLEL_THRESHOLD / 1000000:g}）")
+    parser.add_argument('--prefix', help="输出文件名前缀（默认使用配置）")
+    parser.add_argument('--suffix', help="输出文件名后缀（默认使用配置）")
+    parser.add_argument('--templates-dir', help="模板目录（默认使用应用程序模板目录）")
+    parser.add_argument('--config-dir', help="配置目录（默认使用应用程序配置目录）")
+
+
+def build_parser():
+    """
+    构建命令行参数解析器
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m src.cli',
+        description="PhotoWatermark2 命令行批量水印工具")
+    parser.add_argument('--log-level', default='WARNING', type=str.upper,
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                        help="标准错误上的日志级别（默认 WARNING，日志文件不受影响）")
+    parser.add_argument('--trace', help="将各进程、线程的处理时间线保存为 Chrome trace JSON 文件"
+                                        f"（也可以设置环境变量 {tracing.TRACE_ENV}）")
+    parser.add_argument('--profile-dir', help="为每个进程保存一份 cProfile 统计到该目录"
+                                              f"（也可以设置环境变量 {tracing.PROFILE_ENV}）")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    batch = subparsers.add_parser('batch', help="按模板批量添加水印")
+    batch.add_argument('inputs', nargs='+', help="输入图片、目录或通配符（支持 **）")
+    batch.add_argument('-t', '--template', required=True, help="模板名称")
+    batch.add_argument('-o', '--output', help="输出目录（默认使用配置中的上次输出目录）")
+    batch.add_argument('-r', '--recursive', action='store_true', help="递归扫描输入目录")
+    batch.add_argument('--mode', choices=BatchProcessor.EXECUTION_MODES, default='process',
+                       help="执行模式（默认 process）")
+    batch.add_argument('--workers', type=int, help="工作进程数量（默认CPU核心数）")
+    batch.add_argument('--memory-budget', type=int, metavar='MB',
+                       help="同时处理的图片估算内存之和的上限（MB），大图优先处理，超出预算时等待其他图片完成")
+    batch.add_argument('--journal', help="任务日志文件，中断后使用相同参数重新运行时跳过已完成的图片")
+    batch.add_argument('--cache-dir', help="输出缓存目录，输入和参数都未改变的图片直接复用上次的输出")
+    batch.add_argument('--cache-size', type=int, default=OutputCache.DEFAULT_MAX_SIZE // 1024 // 1024,
+                       help="输出缓存大小上限（MB，默认 %(default)s）")
+    batch.add_argument('--stats-json', help="将分阶段耗时和吞吐量统计导出到JSON文件")
+    add_output_arguments(batch)
+    batch.set_defaults(handler=run_batch)
+
+    preflight = subparsers.add_parser('preflight', help="只读取文件头，检查输入并预测批量处理耗时")
+    preflight.add_argument('inputs', nargs='+', help="输入图片、目录或通配符（支持 **）")
+    preflight.add_argument('-r', '--recursive', action='store_true', help="递归扫描输入目录")
+    preflight.add_argument('--workers', type=int, help="预测时使用的工作进程数量（默认CPU核心数）")
+    preflight.add_argument('--scan-workers', type=int, help="读取文件头的线程数（默认 min(32, CPU核心数+4)）")
+    preflight.add_argument('--calibration', help="基准测试结果JSON（benchmarks/run_benchmarks.py 的输出），"
+                                                 "用于按本机性能校准耗时模型")
+    preflight.add_argument('--format', choices=['PNG', 'JPEG', 'JPG', 'png', 'jpeg', 'jpg'],
+                           help="输出格式（默认使用配置）")
+    preflight.add_argument('--width', type=int, help="输出宽度（只指定宽度时保持比例）")
+    preflight.add_argument('--height', type=int, help="输出高度（只指定高度时保持比例）")
+    preflight.add_argument('--percentage', type=int, help="按百分比缩放输出图片")
+    preflight.add_argument('--strip-threshold', type=float, metavar='MP',
+                           help="与 batch 相同，超过该像素数（百万像素）的PNG/TIFF图片按分条带处理预测")
+    preflight.add_argument('--config-dir', help="配置目录（默认使用应用程序配置目录）")
+    preflight.set_defaults(handler=run_preflight)
+
+    watch = subparsers.add_parser('watch', help="监视目录，持续为新图片添加水印")
+    watch.add_argument('inputs', nargs='+', help="监视的输入目录")
+    watch.add_argument('-t', '--template', required=True, help="模板名称")
+    watch.add_argument('-o', '--output', help="输出目录（不能与输入目录相同）")
+    watch.add_argument('-r', '--recursive', action='store_true', help="同时监视子目录")
+    watch.add_argument('--mode', choices=['process', 'thread'], default='process',
+                       help="执行模式（默认 process）")
+    watch.add_argument('--workers', type=int, help="常驻工作进程数量（默认CPU核心数）")
+    watch.add_argument('--settle', type=float, default=1.0,
+                       help="文件大小和修改时间保持不变多少秒后才处理（默认 %(default)s）")
+    watch.add_argument('--poll-interval', type=float, default=0.5,
+                       help="轮询间隔秒数（默认 %(default)s）")
+    watch.add_argument('--polling', action='store_true', help="不使用文件系统事件，强制轮询")
+    watch.add_argument('--existing', action='store_true', help="启动时处理目录中已有的图片")
+    add_output_arguments(watch)
+    watch.set_defaults(handler=run_watch)
+
+    return parser
+
+
+def main(argv=None):
+    """
+    命令行主入口，返回进程退出码
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    set_console_level(args.log_level)
+    if args.trace or args.profile_dir:
+        tracing.enable(args.trace, args.profile_dir)
+    try:
+        return args.handler(args, NDJSONReporter())
+    finally:
+        # 工作进程已经退出，合并各进程的追踪事件
+        tracing.finish()
+
+
+if __name__ == "__main__":
+    # 打包后的应用使用多进程批量处理时需要
+    multiprocessing.freeze_support()
+    sys.exit(main())
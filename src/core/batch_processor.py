@@ -1,22 +1,243 @@
 import os
+import json
+import time
+import hashlib
 import threading
 import queue
-import os
+import functools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from PIL import Image
 from src.core.image_processor import ImageProcessor
 from src.core.watermark import Watermark
+from src.core.pipeline import PipelineStage, StagedPipeline
+from src.core.job_journal import JobJournal
+from src.core.output_cache import OutputCache
+from src.core.batch_stats import BatchStats
+from src.core.strip_processor import StripProcessor
+from src.core.memory_budget import MemoryEstimator, MemoryBudget
+from src.utils.logger import info, warning
+from src.utils.tracing import span
+
+
+# 工作进程内的全局状态，由 _init_worker 在进程启动时初始化一次
+_worker_watermark = None
+_worker_region_compositing = False
+_worker_reduced_decoding = False
+_worker_strip_threshold = None
+_worker_parallel_threshold = None
+
+
+def _init_worker(watermark_config, region_compositing=False, reduced_decoding=False, strip_threshold=None,
+                 parallel_threshold=None):
+    """
+    进程池工作进程初始化函数
+    每个工作进程只重建一次水印对象并预渲染水印图层（同时预热字体缓存）
+    """
+    global _worker_watermark, _worker_region_compositing, _worker_reduced_decoding, _worker_strip_threshold
+    global _worker_parallel_threshold
+    _worker_region_compositing = region_compositing
+    _worker_reduced_decoding = reduced_decoding
+    _worker_strip_threshold = strip_threshold
+    _worker_parallel_threshold = parallel_threshold
+    watermark = Watermark()
+    watermark.from_dict(watermark_config)
+    _worker_watermark = watermark.prepare()
+
+
+def _process_task(task):
+    """
+    在工作进程中处理单张图片，返回 (输出路径, 分阶段耗时)
+    """
+    (image_path, output_dir, output_format, quality,
+     rename_prefix, rename_suffix,
+     resize_width, resize_height, resize_percentage) = task
+    timings = {}
+    output_path = BatchProcessor._process_single_image(
+        image_path,
+        output_dir,
+        _worker_watermark,
+        output_format,
+        quality,
+        rename_prefix,
+        rename_suffix,
+        resize_width,
+        resize_height,
+        resize_percentage,
+        region_compositing=_worker_region_compositing,
+        reduced_decoding=_worker_reduced_decoding,
+        strip_threshold=_worker_strip_threshold,
+        parallel_threshold=_worker_parallel_threshold,
+        timings=timings
+    )
+    return output_path, timings
+
 
 class BatchProcessor:
     """
     批量处理类，用于批量添加水印到多张图片
+    
+    支持三种执行模式：
+    - 'thread'：单个后台线程顺序处理（默认）
+    - 'process'：多进程并行处理，工作进程数默认为CPU核心数
+    - 'pipeline'：读取、水印合成、写入三个阶段流式重叠执行，
+      阶段之间通过有界队列连接，编码跟不上时会自动限流
+    
+    开启区域合成（set_region_compositing）后，图片以原始RGB/RGBA模式加载，
+    水印直接合成到其覆盖的区域，不再整图转换为RGBA和复制。
+    
+    默认按 (宽, 高, 模式) 对图片分组处理（set_size_grouping），同尺寸的图片相邻处理，
+    可以连续命中预渲染水印中按尺寸缓存的已定位叠加层。
+    
+    设置任务日志（set_journal）后，每完成一张图片都会追加记录到日志文件，
+    中断后使用相同配置重新运行时跳过已完成且未改变的图片。
+    
+    设置输出缓存（set_output_cache）后，输入内容、水印配置和输出参数都相同的图片
+    直接从缓存硬链接或复制输出文件，跨多次运行有效。
+    
+    开启缩小解码（set_reduced_decoding）后，需要缩小输出尺寸时按输出尺寸解码图片
+    （JPEG使用DCT域缩小解码），水印按原图计算后等比缩放，直接在输出尺寸上添加。
+    
+    设置分条带处理阈值（set_strip_processing）后，像素数超过阈值的PNG/TIFF大图
+    按条带读取、合成并写出PNG，峰值内存与图片尺寸无关（见 StripProcessor）。
+    
+    需要合成的像素数达到并行合成阈值（set_parallel_compositing，默认
+    ImageProcessor.PARALLEL_THRESHOLD）的大图，水印按水平条带在线程池中并行合成，
+    缩短少数超大图片拖长的批次尾部耗时；结果与串行合成完全一致。
+    
+    设置内存预算（set_memory_budget）后，开始前读取各图片的文件头估算处理时的内存峰值，
+    按估算值从大到小排序；多进程和流水线模式下只在正在处理的图片估算值之和不超过预算时
+    才开始新的图片，混合大量小图和少数超大图片的批次可以安全地使用更多工作进程。
+    
+    每次运行都会统计各阶段耗时和吞吐量（stats），完成回调的 result['stats'] 为汇总字典，
+    也可以通过 export_stats 导出为JSON文件。
     """
     
-    def __init__(self):
+    EXECUTION_MODES = ('thread', 'process', 'pipeline')
+    
+    def __init__(self, execution_mode='thread', max_workers=None):
         self.is_processing = False
         self.cancel_flag = False
         self.progress_callback = None
         self.complete_callback = None
         self.error_callback = None
         self.thread = None
+        self.execution_mode = 'thread'
+        self.max_workers = None
+        self.set_execution_mode(execution_mode, max_workers)
+        self.reader_workers = 2
+        self.compositor_workers = None
+        self.writer_workers = 2
+        self.pipeline_queue_size = 8
+        self.region_compositing = False
+        self.reduced_decoding = False
+        self.strip_threshold = None
+        self.parallel_threshold = ImageProcessor.PARALLEL_THRESHOLD
+        self.memory_budget = None
+        self._budget = None
+        self._task_costs = {}
+        self._admitted = {}
+        self._budget_lock = threading.Lock()
+        self.size_grouping = True
+        self.journal_path = None
+        self.journal = None
+        self.skipped_count = 0
+        self.output_cache = None
+        self.cached_count = 0
+        self._cache_fingerprint = None
+        self._cache_lock = threading.Lock()
+        self.stats = BatchStats()
+    
+    def set_execution_mode(self, execution_mode='thread', max_workers=None):
+        """
+        设置执行模式和工作进程数量
+        """
+        if execution_mode not in self.EXECUTION_MODES:
+            raise ValueError(f"不支持的执行模式: {execution_mode}")
+        if max_workers is not None and max_workers < 1:
+            raise ValueError("工作进程数量必须大于0")
+        
+        self.execution_mode = execution_mode
+        self.max_workers = max_workers
+    
+    def set_pipeline_workers(self, reader_workers=2, compositor_workers=None,
+                             writer_workers=2, queue_size=8):
+        """
+        设置流水线模式下各阶段的并发数和阶段间队列容量
+        compositor_workers 为 None 时使用CPU核心数
+        """
+        for name, value in (('reader_workers', reader_workers),
+                            ('compositor_workers', compositor_workers),
+                            ('writer_workers', writer_workers),
+                            ('queue_size', queue_size)):
+            if value is not None and value < 1:
+                raise ValueError(f"{name} 必须大于0")
+        
+        self.reader_workers = reader_workers
+        self.compositor_workers = compositor_workers
+        self.writer_workers = writer_workers
+        self.pipeline_queue_size = queue_size
+    
+    def set_region_compositing(self, enabled=True):
+        """
+        设置是否使用区域合成模式
+        """
+        self.region_compositing = enabled
+    
+    def set_reduced_decoding(self, enabled=True):
+        """
+        设置调整大小时是否按输出尺寸解码图片并在输出尺寸上添加水印
+        """
+        self.reduced_decoding = enabled
+    
+    def set_strip_processing(self, pixel_threshold=None):
+        """
+        设置分条带处理的像素数阈值，超过阈值的PNG/TIFF图片分条带处理，None 表示关闭
+        """
+        if pixel_threshold is not None and pixel_threshold < 0:
+            raise ValueError("分条带处理阈值不能为负数")
+        self.strip_threshold = pixel_threshold
+    
+    def set_parallel_compositing(self, pixel_threshold=ImageProcessor.PARALLEL_THRESHOLD):
+        """
+        设置分条带并行合成的像素数阈值，None 表示始终串行合成
+        """
+        if pixel_threshold is not None and pixel_threshold < 0:
+            raise ValueError("并行合成阈值不能为负数")
+        self.parallel_threshold = pixel_threshold
+    
+    def set_memory_budget(self, budget_bytes=None):
+        """
+        设置同时处理的图片估算内存之和的上限（字节），None 表示不限制
+        """
+        if budget_bytes is not None and budget_bytes <= 0:
+            raise ValueError("内存预算必须大于0")
+        self.memory_budget = budget_bytes
+    
+    def set_size_grouping(self, enabled=True):
+        """
+        设置是否按图片尺寸分组处理
+        """
+        self.size_grouping = enabled
+    
+    def set_journal(self, journal_path=None):
+        """
+        设置任务日志文件路径，None 表示不记录
+        """
+        self.journal_path = journal_path
+    
+    def set_output_cache(self, cache_dir=None, max_size=OutputCache.DEFAULT_MAX_SIZE, use_links=True):
+        """
+        设置输出缓存目录和大小上限（字节），cache_dir 为 None 时关闭缓存
+        use_links 为 True 时优先使用硬链接，否则复制文件
+        """
+        self.output_cache = OutputCache(cache_dir, max_size, use_links) if cache_dir else None
+    
+    def get_worker_count(self):
+        """
+        获取实际使用的工作进程数量
+        """
+        return self.max_workers or os.cpu_count() or 1
     
     def start_processing(self, image_paths, output_dir, watermark, 
                         output_format='PNG', quality=95, 
@@ -39,9 +260,73 @@ class BatchProcessor:
         if not image_paths:
             raise ValueError("没有找到需要处理的图片")
         
+        # 水印配置和所有影响输出文件的参数，用于任务日志和输出缓存
+        output_fingerprint = self._output_fingerprint(
+            watermark, output_format, quality, rename_prefix, rename_suffix,
+            resize_width, resize_height, resize_percentage,
+            region_compositing=self.region_compositing,
+            reduced_decoding=self.reduced_decoding)
+        self._cache_fingerprint = output_fingerprint
+        self.cached_count = 0
+        
+        # 打开任务日志，跳过之前已完成的图片
+        self.journal = None
+        self.skipped_count = 0
+        if self.journal_path:
+            fingerprint = self._job_fingerprint(output_fingerprint, output_dir)
+            self.journal = JobJournal(self.journal_path, fingerprint).open()
+            remaining = [path for path in image_paths if not self.journal.is_completed(path)]
+            self.skipped_count = len(image_paths) - len(remaining)
+            image_paths = remaining
+            if self.skipped_count:
+                info(f"根据任务日志跳过 {self.skipped_count} 张已完成的图片")
+        
+        # 按尺寸分组，同尺寸的图片复用同一个已定位叠加层
+        if self.size_grouping:
+            image_paths = self._group_by_size(image_paths)
+        
+        # 按估算内存从大到小排序，处理时按预算控制同时处理的图片
+        self._budget = None
+        self._task_costs = {}
+        self._admitted = {}
+        if self.memory_budget:
+            image_paths = self._schedule_by_memory(
+                image_paths, output_format, resize_width, resize_height, resize_percentage)
+        
+        # 预渲染水印图层，整个批次复用（多进程模式由各工作进程自行渲染）
+        if self.execution_mode != 'process':
+            watermark = watermark.prepare()
+        
         # 重置状态
         self.is_processing = True
         self.cancel_flag = False
+        self.stats.start()
+        
+        # 多进程模式
+        if self.execution_mode == 'process':
+            tasks = [(image_path, output_dir, output_format, quality,
+                      rename_prefix, rename_suffix,
+                      resize_width, resize_height, resize_percentage)
+                     for image_path in image_paths]
+            self.thread = threading.Thread(
+                target=self._process_with_pool,
+                args=(tasks, watermark.to_dict())
+            )
+            self.thread.daemon = True
+            self.thread.start()
+            return
+        
+        # 流水线模式
+        if self.execution_mode == 'pipeline':
+            self.thread = threading.Thread(
+                target=self._process_with_pipeline,
+                args=(list(image_paths), output_dir, watermark, output_format,
+                      quality, rename_prefix, rename_suffix,
+                      resize_width, resize_height, resize_percentage)
+            )
+            self.thread.daemon = True
+            self.thread.start()
+            return
         
         # 创建任务队列
         task_queue = queue.Queue()
@@ -72,24 +357,41 @@ class BatchProcessor:
                  resize_width, resize_height, resize_percentage) = task_queue.get()
                 
                 try:
-                    # 处理单张图片
-                    self._process_single_image(
-                        image_path,
-                        output_dir,
-                        watermark,
-                        output_format,
-                        quality,
-                        rename_prefix,
-                        rename_suffix,
-                        resize_width,
-                        resize_height,
-                        resize_percentage
-                    )
+                    output_path = self._build_output_path(
+                        image_path, output_dir, output_format, rename_prefix, rename_suffix)
+                    cached, cache_key = self._restore_from_cache(image_path, output_path)
+                    if not cached:
+                        # 处理单张图片（顺序处理，内存预算只用于统计），等待预算时取消处理则停止
+                        if not self._acquire_memory(image_path):
+                            break
+                        timings = {}
+                        output_path = self._process_single_image(
+                            image_path,
+                            output_dir,
+                            watermark,
+                            output_format,
+                            quality,
+                            rename_prefix,
+                            rename_suffix,
+                            resize_width,
+                            resize_height,
+                            resize_percentage,
+                            region_compositing=self.region_compositing,
+                            reduced_decoding=self.reduced_decoding,
+                            strip_threshold=self.strip_threshold,
+                            parallel_threshold=self.parallel_threshold,
+                            timings=timings
+                        )
+                        self._store_in_cache(cache_key, output_path)
+                        self.stats.record(timings)
+                    else:
+                        self._record_cached_stats(image_path, output_path)
+                    self._record_completed(image_path, output_path)
                     processed_count += 1
                     
                     # 调用进度回调
                     if self.progress_callback:
-                        progress = int(processed_count / total_tasks * 100)
+                        progress = self._progress_percent(processed_count, total_tasks)
                         self.progress_callback(progress, image_path)
                         
                 except Exception as e:
@@ -99,45 +401,539 @@ class BatchProcessor:
                         
                 finally:
                     # 标记任务完成
+                    self._release_memory(image_path)
                     task_queue.task_done()
             
         finally:
-            # 处理完成或取消
-            self.is_processing = False
+            self._finish_processing(processed_count, total_tasks)
+    
+    def _process_with_pool(self, tasks, watermark_config):
+        """
+        使用进程池并行处理任务
+        回调函数始终在当前进程的调度线程中调用
+        """
+        total_tasks = len(tasks)
+        processed_count = 0
+        worker_count = self.get_worker_count()
+        # 限制同时提交的任务数量，便于及时响应取消操作
+        # 设置内存预算时只提交可以立即运行的任务，已提交的任务都计入预算
+        max_pending = worker_count if self._budget is not None else worker_count * 2
+        lookups = None
+        
+        def on_success(image_path, output_path):
+            nonlocal processed_count
+            self._record_completed(image_path, output_path)
+            processed_count += 1
+            
+            # 调用进度回调
+            if self.progress_callback:
+                progress = self._progress_percent(processed_count, total_tasks)
+                self.progress_callback(progress, image_path)
+        
+        def on_error(image_path, exc):
+            # 调用错误回调
+            if self.error_callback:
+                self.error_callback(str(exc), image_path)
+        
+        try:
+            with ProcessPoolExecutor(max_workers=worker_count,
+                                     initializer=_init_worker,
+                                     initargs=(watermark_config, self.region_compositing,
+                                               self.reduced_decoding, self.strip_threshold,
+                                               self.parallel_threshold)) as executor:
+                lookups = self._iter_cache_lookups(tasks, max_pending, worker_count)
+                pending = {}
+                # 内存预算不足、等待其他任务完成后再提交的任务
+                waiting = None
+                
+                while True:
+                    # 补充任务直到达到上限
+                    while not self.cancel_flag and len(pending) < max_pending:
+                        if waiting is not None:
+                            task, cache_key = waiting
+                            waiting = None
+                        else:
+                            item = next(lookups, None)
+                            if item is None:
+                                break
+                            
+                            # 输出缓存命中的图片不再提交给工作进程
+                            task, lookup = item
+                            image_path = task[0]
+                            try:
+                                output_path, cached, cache_key = lookup()
+                            except Exception as e:
+                                on_error(image_path, e)
+                                continue
+                            if cached:
+                                self._record_cached_stats(image_path, output_path)
+                                on_success(image_path, output_path)
+                                continue
+                        
+                        if not self._acquire_memory(task[0], blocking=False):
+                            waiting = (task, cache_key)
+                            break
+                        pending[executor.submit(_process_task, task)] = (task[0], cache_key)
+                    
+                    if not pending:
+                        break
+                    
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        image_path, cache_key = pending.pop(future)
+                        self._release_memory(image_path)
+                        try:
+                            output_path, timings = future.result()
+                            self._store_in_cache(cache_key, output_path)
+                            self.stats.record(timings)
+                            on_success(image_path, output_path)
+                        except Exception as e:
+                            on_error(image_path, e)
+                    
+                    if self.cancel_flag:
+                        # 取消尚未开始的任务，等待已在运行的任务结束
+                        for future in pending:
+                            future.cancel()
+                        executor.shutdown(wait=True, cancel_futures=True)
+                        break
+        except Exception as e:
+            # 进程池本身异常（如无法创建工作进程）时报告错误
+            if self.error_callback:
+                self.error_callback(f"进程池执行失败: {str(e)}", None)
+        finally:
+            if lookups is not None:
+                lookups.close()
+            self._finish_processing(processed_count, total_tasks)
+    
+    def _iter_cache_lookups(self, tasks, depth, thread_count):
+        """
+        按任务顺序生成 (任务, 缓存查询函数)，查询函数返回 (输出路径, 是否命中, 缓存键)
+        设置输出缓存时，查询（计算输入文件的SHA-256并尝试恢复输出）在线程池中最多提前 depth 个任务进行，
+        调度线程不再逐张串行读取输入文件；未设置输出缓存时查询在调用时直接完成
+        """
+        if self.output_cache is None:
+            for task in tasks:
+                yield task, functools.partial(self._lookup_output_cache, task)
+            return
+        
+        executor = ThreadPoolExecutor(max_workers=max(1, thread_count), thread_name_prefix='cache-lookup')
+        window = deque()
+        try:
+            for task in tasks:
+                window.append((task, executor.submit(self._lookup_output_cache, task)))
+                if len(window) >= depth:
+                    task, future = window.popleft()
+                    yield task, future.result
+            while window:
+                task, future = window.popleft()
+                yield task, future.result
+        finally:
+            # 取消时丢弃尚未开始的查询
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    def _lookup_output_cache(self, task):
+        """
+        为进程池任务查询输出缓存，返回 (输出路径, 是否命中, 缓存键)
+        """
+        image_path, output_dir, output_format = task[:3]
+        output_path = self._build_output_path(image_path, output_dir, output_format, task[4], task[5])
+        cached, cache_key = self._restore_from_cache(image_path, output_path)
+        return output_path, cached, cache_key
+    
+    def _process_with_pipeline(self, image_paths, output_dir, watermark, output_format,
+                               quality, rename_prefix, rename_suffix,
+                               resize_width, resize_height, resize_percentage):
+        """
+        使用分阶段流水线处理任务
+        读取、合成、写入各自拥有独立的线程，图片解码和编码的I/O等待可以与合成重叠
+        """
+        total_tasks = len(image_paths)
+        processed_count = 0
+        
+        region_compositing = self.region_compositing
+        reduced_decoding = self.reduced_decoding
+        strip_threshold = self.strip_threshold
+        parallel_threshold = self.parallel_threshold
+        resizing = bool(resize_width or resize_height or resize_percentage)
+        
+        # 输出缓存命中的图片和分条带处理的大图在读取阶段直接完成，image 为 None，
+        # 后续阶段只传递结果；各阶段耗时记录在随图片传递的 timings 字典中
+        def read(image_path):
+            output_path = self._build_output_path(
+                image_path, output_dir, output_format, rename_prefix, rename_suffix)
+            cached, cache_key = self._restore_from_cache(image_path, output_path)
+            if cached:
+                self._record_cached_stats(image_path, output_path)
+                return image_path, None, None, output_path, None
+            # 等待内存预算，图片写出或失败后在结果回调中释放
+            if not self._acquire_memory(image_path):
+                raise RuntimeError("批量处理已取消")
+            timings = {}
+            if strip_threshold is not None and StripProcessor.can_process(
+                    image_path, strip_threshold, output_format, resizing):
+                StripProcessor.process(image_path, output_path, watermark,
+                                       keep_native_mode=region_compositing, timings=timings)
+                self._store_in_cache(cache_key, output_path)
+                self.stats.record(timings)
+                return image_path, None, None, output_path, None
+            image, source_size = self._load_stage(image_path, region_compositing, timings,
+                                                  resize_width, resize_height, resize_percentage,
+                                                  reduced_decoding)
+            return image_path, image, source_size, cache_key, timings
+        
+        def composite(payload):
+            image_path, image, source_size, cache_key, timings = payload
+            if image is None:
+                return payload
+            return image_path, self._watermark_stage(
+                image, watermark, resize_width, resize_height, resize_percentage,
+                in_place=region_compositing, timings=timings, source_size=source_size,
+                parallel_threshold=parallel_threshold), None, cache_key, timings
+        
+        def write(payload):
+            image_path, image, _, cache_key, timings = payload
+            if image is None:
+                return cache_key
+            output_path = self._build_output_path(
+                image_path, output_dir, output_format, rename_prefix, rename_suffix)
+            self._save_stage(image, output_path, output_format, quality, timings)
+            self._store_in_cache(cache_key, output_path)
+            self.stats.record(timings)
+            return output_path
+        
+        def on_result(image_path, output_path):
+            nonlocal processed_count
+            self._release_memory(image_path)
+            self._record_completed(image_path, output_path)
+            processed_count += 1
             
-            # 调用完成回调
-            if self.complete_callback:
-                result = {
-                    'success': not self.cancel_flag,
-                    'processed_count': processed_count,
-                    'total_count': total_tasks,
-                    'cancelled': self.cancel_flag
-                }
-                self.complete_callback(result)
-    
-    def _process_single_image(self, image_path, output_dir, watermark, 
+            # 调用进度回调
+            if self.progress_callback:
+                progress = self._progress_percent(processed_count, total_tasks)
+                self.progress_callback(progress, image_path)
+        
+        def on_error(image_path, exc):
+            self._release_memory(image_path)
+            # 调用错误回调
+            if self.error_callback:
+                self.error_callback(str(exc), image_path)
+        
+        pipeline = StagedPipeline([
+            PipelineStage('reader', read, self.reader_workers),
+            PipelineStage('compositor', composite, self.compositor_workers or os.cpu_count() or 1),
+            PipelineStage('writer', write, self.writer_workers)
+        ], queue_size=self.pipeline_queue_size)
+        
+        try:
+            pipeline.run(
+                ((image_path, image_path) for image_path in image_paths),
+                result_callback=on_result,
+                error_callback=on_error,
+                cancel_check=lambda: self.cancel_flag
+            )
+        finally:
+            self._finish_processing(processed_count, total_tasks)
+    
+    def _finish_processing(self, processed_count, total_tasks):
+        """
+        处理完成或取消后重置状态并调用完成回调
+        """
+        if self.journal is not None:
+            self.journal.close()
+        if self.output_cache is not None:
+            try:
+                self.output_cache.save()
+            except Exception as e:
+                warning(str(e))
+        if self._budget is not None:
+            self.stats.record_memory(self._budget.budget_bytes, self._budget.peak)
+        self.stats.finish()
+        self.is_processing = False
+        
+        # 调用完成回调（total_count 包含根据任务日志跳过的图片）
+        if self.complete_callback:
+            result = {
+                'success': not self.cancel_flag,
+                'processed_count': processed_count,
+                'skipped_count': self.skipped_count,
+                'cached_count': self.cached_count,
+                'total_count': total_tasks + self.skipped_count,
+                'cancelled': self.cancel_flag,
+                'stats': self.stats.summary()
+            }
+            self.complete_callback(result)
+    
+    def export_stats(self, file_path):
+        """
+        将最近一次运行的处理统计导出为JSON文件
+        """
+        self.stats.export_json(file_path)
+    
+    def _record_completed(self, image_path, output_path):
+        """
+        将完成的图片写入任务日志
+        """
+        if self.journal is not None:
+            self.journal.record(image_path, output_path)
+    
+    def _schedule_by_memory(self, image_paths, output_format, resize_width, resize_height, resize_percentage):
+        """
+        读取文件头估算每张图片的内存峰值，创建本次运行的内存预算，返回按估算值从大到小排序的图片
+        """
+        # 无法估算的图片按整个预算计算，不与其他图片同时处理
+        scheduled = MemoryEstimator.schedule(
+            image_paths, unknown_cost=self.memory_budget, region_compositing=self.region_compositing,
+            resize_width=resize_width, resize_height=resize_height, resize_percentage=resize_percentage,
+            reduced_decoding=self.reduced_decoding, strip_threshold=self.strip_threshold,
+            output_format=output_format)
+        self._task_costs = dict(scheduled)
+        self._budget = MemoryBudget(self.memory_budget)
+        
+        oversized = [image_path for image_path, cost in scheduled if cost > self.memory_budget]
+        if oversized:
+            warning(f"{len(oversized)} 张图片的估算内存超过预算，将在没有其他图片处理时单独处理")
+        if scheduled:
+            info(f"内存预算 {self.memory_budget / 1024 / 1024:.0f}MB，"
+                 f"最大单张估算 {scheduled[0][1] / 1024 / 1024:.1f}MB")
+        return [image_path for image_path, _ in scheduled]
+    
+    def _acquire_memory(self, image_path, blocking=True):
+        """
+        为图片占用其估算内存，未设置内存预算时直接返回 True
+        blocking 为 False 时预算不足立即返回 False；阻塞等待时取消处理也返回 False
+        """
+        if self._budget is None:
+            return True
+        cost = self._task_costs.get(image_path, 0)
+        if blocking:
+            acquired = self._budget.acquire(cost, cancel_check=lambda: self.cancel_flag)
+        else:
+            acquired = self._budget.try_acquire(cost)
+        if acquired:
+            with self._budget_lock:
+                self._admitted[image_path] = self._admitted.get(image_path, 0) + 1
+        return acquired
+    
+    def _release_memory(self, image_path):
+        """
+        释放图片占用的估算内存，没有占用（如缓存命中）时不做处理
+        """
+        if self._budget is None:
+            return
+        with self._budget_lock:
+            count = self._admitted.get(image_path, 0)
+            if not count:
+                return
+            if count == 1:
+                del self._admitted[image_path]
+            else:
+                self._admitted[image_path] = count - 1
+        self._budget.release(self._task_costs.get(image_path, 0))
+    
+    def _restore_from_cache(self, image_path, output_path):
+        """
+        尝试从输出缓存恢复输出文件，返回 (是否命中, 缓存键)
+        未命中时返回的缓存键用于处理完成后写入缓存
+        """
+        if self.output_cache is None:
+            return False, None
+        
+        key = OutputCache.make_key(self.output_cache.input_digest(image_path), self._cache_fingerprint)
+        if self.output_cache.restore(key, output_path):
+            with self._cache_lock:
+                self.cached_count += 1
+            return True, key
+        
+        OutputCache.detach(output_path)
+        return False, key
+    
+    def _record_cached_stats(self, image_path, output_path):
+        """
+        统计从输出缓存恢复的图片的输入/输出字节数
+        """
+        try:
+            self.stats.record_cached(os.path.getsize(image_path), os.path.getsize(output_path))
+        except OSError:
+            self.stats.record_cached(0, 0)
+    
+    def _store_in_cache(self, cache_key, output_path):
+        """
+        将新生成的输出文件写入输出缓存
+        """
+        if self.output_cache is not None and cache_key is not None:
+            self.output_cache.store(cache_key, output_path)
+    
+    def _progress_percent(self, processed_count, total_tasks):
+        """
+        计算进度百分比，根据任务日志跳过的图片视为已完成
+        """
+        total_count = total_tasks + self.skipped_count
+        return int((processed_count + self.skipped_count) / total_count * 100)
+    
+    @staticmethod
+    def _job_fingerprint(output_fingerprint, output_dir):
+        """
+        计算任务指纹：输出指纹和输出目录
+        """
+        job = {'output': output_fingerprint, 'output_dir': os.path.abspath(output_dir)}
+        canonical = json.dumps(job, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def _output_fingerprint(watermark, output_format, quality, rename_prefix, rename_suffix,
+                            resize_width, resize_height, resize_percentage, region_compositing=False,
+                            reduced_decoding=False):
+        """
+        计算输出指纹：水印配置和所有影响输出文件的参数
+        图片水印还包含水印文件的大小和修改时间，水印图片被替换后指纹随之改变
+        """
+        watermark_file = None
+        config = watermark.to_dict()
+        if config.get('watermark_type') == 'image' and config.get('watermark_path'):
+            try:
+                stat = os.stat(config['watermark_path'])
+                watermark_file = [stat.st_size, stat.st_mtime_ns]
+            except OSError:
+                pass
+        
+        job = {
+            'watermark': watermark.fingerprint(),
+            'watermark_file': watermark_file,
+            'region_compositing': region_compositing,
+            'reduced_decoding': reduced_decoding,
+            'output_format': output_format.upper(),
+            'quality': quality,
+            'rename_prefix': rename_prefix,
+            'rename_suffix': rename_suffix,
+            'resize': [resize_width, resize_height, resize_percentage]
+        }
+        canonical = json.dumps(job, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def _group_by_size(image_paths):
+        """
+        按图片的 (宽, 高, 模式) 分组排序，组之间保持首次出现的顺序
+        只读取文件头，无法读取的文件单独成组，留给处理阶段报告错误
+        """
+        groups = {}
+        for image_path in image_paths:
+            try:
+                with Image.open(image_path) as image:
+                    key = (image.width, image.height, image.mode)
+            except Exception:
+                key = None
+            groups.setdefault(key, []).append(image_path)
+        
+        return [image_path for group in groups.values() for image_path in group]
+    
+    @staticmethod
+    def _process_single_image(image_path, output_dir, watermark, 
                              output_format, quality, 
                              rename_prefix, rename_suffix, 
-                             resize_width, resize_height, resize_percentage):
+                             resize_width, resize_height, resize_percentage,
+                             region_compositing=False, reduced_decoding=False, strip_threshold=None,
+                             parallel_threshold=None, timings=None):
         """
         处理单张图片
+        像素数超过 strip_threshold 的PNG/TIFF图片分条带处理
+        timings 不为 None 时填入各阶段耗时（秒）、输入/输出字节数和像素数
         """
-        # 加载图片
-        image = ImageProcessor.load_image(image_path)
-        
-        # 应用水印
-        watermarked_image = watermark.apply_watermark(image)
+        with span('process_image', 'batch', path=image_path):
+            if strip_threshold is not None and StripProcessor.can_process(
+                    image_path, strip_threshold, output_format,
+                    bool(resize_width or resize_height or resize_percentage)):
+                output_path = BatchProcessor._build_output_path(
+                    image_path, output_dir, output_format, rename_prefix, rename_suffix)
+                return StripProcessor.process(image_path, output_path, watermark,
+                                              keep_native_mode=region_compositing, timings=timings)
+            
+            # 加载图片
+            image, source_size = BatchProcessor._load_stage(
+                image_path, region_compositing, timings,
+                resize_width, resize_height, resize_percentage, reduced_decoding)
+            
+            # 应用水印并调整大小
+            watermarked_image = BatchProcessor._watermark_stage(
+                image, watermark, resize_width, resize_height, resize_percentage,
+                in_place=region_compositing, timings=timings, source_size=source_size,
+                parallel_threshold=parallel_threshold)
+            
+            # 保存图片
+            output_path = BatchProcessor._build_output_path(
+                image_path, output_dir, output_format, rename_prefix, rename_suffix)
+            BatchProcessor._save_stage(watermarked_image, output_path, output_format, quality, timings)
+        return output_path
+    
+    @staticmethod
+    def _load_stage(image_path, region_compositing=False, timings=None,
+                    resize_width=None, resize_height=None, resize_percentage=None,
+                    reduced_decoding=False):
+        """
+        加载并解码图片
+        返回 (图片, 原图尺寸)：reduced_decoding 为 True 且需要调整大小时按输出尺寸解码，
+        原图尺寸供水印阶段缩放水印；否则原图尺寸为 None
+        """
+        start = time.perf_counter()
+        source_size = None
+        if reduced_decoding and (resize_width or resize_height or resize_percentage):
+            image, source_size = ImageProcessor.load_image_for_output(
+                image_path, resize_width, resize_height, resize_percentage,
+                keep_native_mode=region_compositing)
+        else:
+            image = ImageProcessor.load_image(image_path, keep_native_mode=region_compositing)
+        # 保留原始模式时图片是延迟解码的，在这里完成解码，使解码时间计入读取阶段
+        image.load()
+        if timings is not None:
+            timings['load'] = time.perf_counter() - start
+            timings['input_bytes'] = os.path.getsize(image_path)
+            timings['pixels'] = (source_size[0] * source_size[1] if source_size
+                                 else image.width * image.height)
+        return image, source_size
+    
+    @staticmethod
+    def _watermark_stage(image, watermark, resize_width, resize_height, resize_percentage,
+                         in_place=False, timings=None, source_size=None, parallel_threshold=None):
+        """
+        应用水印并按需调整图片大小
+        已按输出尺寸解码的图片（source_size 为原图尺寸）直接添加缩放后的水印，不再调整大小
+        """
+        start = time.perf_counter()
+        watermarked_image = watermark.apply_watermark(image, in_place=in_place, source_size=source_size,
+                                                      parallel_threshold=parallel_threshold)
+        if timings is not None:
+            timings['watermark'] = time.perf_counter() - start
         
         # 调整图片大小（如果需要）
-        if resize_width or resize_height or resize_percentage:
+        if not source_size and (resize_width or resize_height or resize_percentage):
+            start = time.perf_counter()
             watermarked_image = ImageProcessor.resize_image(
                 watermarked_image,
                 width=resize_width,
                 height=resize_height,
                 percentage=resize_percentage
             )
+            if timings is not None:
+                timings['resize'] = time.perf_counter() - start
         
-        # 生成输出文件名
+        return watermarked_image
+    
+    @staticmethod
+    def _save_stage(image, output_path, output_format, quality, timings=None):
+        """
+        编码并保存图片
+        """
+        start = time.perf_counter()
+        ImageProcessor.save_image(image, output_path, format=output_format, quality=quality)
+        if timings is not None:
+            timings['save'] = time.perf_counter() - start
+            timings['output_bytes'] = os.path.getsize(output_path)
+    
+    @staticmethod
+    def _build_output_path(image_path, output_dir, output_format, rename_prefix, rename_suffix):
+        """
+        生成输出文件路径
+        """
         original_name = os.path.basename(image_path)
         name_without_ext, ext = os.path.splitext(original_name)
         
@@ -159,8 +955,7 @@ class BatchProcessor:
             output_filename = f"{base_name}_watermarked{ext}"
             output_path = os.path.join(output_dir, output_filename)
         
-        # 保存图片
-        ImageProcessor.save_image(watermarked_image, output_path, format=output_format, quality=quality)
+        return output_path
     
     def cancel(self):
         """
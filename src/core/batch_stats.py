@@ -0,0 +1,169 @@
+import json
+import math
+import time
+import threading
+
+
+def percentile(values, fraction):
+    """
+    计算百分位数（最近秩法），values 为空时返回 None
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+class BatchStats:
+    """
+    批量处理的分阶段耗时和吞吐量统计
+
+    每张图片记录读取（load）、水印合成（watermark）、调整大小（resize）、保存（save）
+    四个阶段的耗时，以及输入/输出文件字节数和像素数。汇总时每个阶段给出
+    p50/p95/最大值，整个批次给出图片/秒和MB/秒，可以判断任务瓶颈在解码、合成还是编码。
+
+    从输出缓存恢复的图片计入图片数，其字节数单独统计，不计入MB/秒。
+    多进程和流水线模式下各阶段并行执行，阶段耗时之和可能大于总耗时。
+    """
+
+    STAGES = ('load', 'watermark', 'resize', 'save')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        清空统计数据
+        """
+        with self._lock:
+            self.stage_times = {stage: [] for stage in self.STAGES}
+            self.processed_images = 0
+            self.cached_images = 0
+            self.input_bytes = 0
+            self.output_bytes = 0
+            self.cached_input_bytes = 0
+            self.cached_output_bytes = 0
+            self.pixels = 0
+            self.memory_budget = None
+            self.peak_memory_estimate = None
+            self.start_time = None
+            self.end_time = None
+
+    def start(self):
+        """
+        开始计时
+        """
+        self.reset()
+        self.start_time = time.perf_counter()
+
+    def finish(self):
+        """
+        结束计时
+        """
+        self.end_time = time.perf_counter()
+
+    def record(self, timings):
+        """
+        记录一张处理完成的图片
+        timings 为 _process_single_image 填写的字典，包含各阶段秒数、
+        input_bytes、output_bytes 和 pixels，缺少的阶段（如未调整大小）不计入
+        """
+        with self._lock:
+            self.processed_images += 1
+            for stage in self.STAGES:
+                if stage in timings:
+                    self.stage_times[stage].append(timings[stage])
+            self.input_bytes += timings.get('input_bytes', 0)
+            self.output_bytes += timings.get('output_bytes', 0)
+            self.pixels += timings.get('pixels', 0)
+
+    def record_cached(self, input_bytes, output_bytes):
+        """
+        记录一张从输出缓存恢复的图片（没有解码，不计入阶段耗时、像素数和MB/秒，字节数单独统计）
+        """
+        with self._lock:
+            self.cached_images += 1
+            self.cached_input_bytes += input_bytes
+            self.cached_output_bytes += output_bytes
+
+    def record_memory(self, budget_bytes, peak_bytes):
+        """
+        记录内存预算和运行期间同时处理的任务估算内存之和的最大值
+        """
+        with self._lock:
+            self.memory_budget = budget_bytes
+            self.peak_memory_estimate = peak_bytes
+
+    @property
+    def elapsed(self):
+        """
+        已用时间（秒），尚未开始时为 0
+        """
+        if self.start_time is None:
+            return 0.0
+        end_time = self.end_time if self.end_time is not None else time.perf_counter()
+        return end_time - self.start_time
+
+    @staticmethod
+    def _per_second(value, elapsed):
+        return round(value / elapsed, 3) if elapsed > 0 else None
+
+    def summary(self):
+        """
+        生成汇总字典（时间单位为秒，数据量单位为MB）
+        """
+        elapsed = self.elapsed
+        with self._lock:
+            images = self.processed_images + self.cached_images
+            stages = {}
+            for stage, values in self.stage_times.items():
+                stages[stage] = {
+                    'count': len(values),
+                    'total_seconds': round(sum(values), 6),
+                    'mean_seconds': round(sum(values) / len(values), 6) if values else None,
+                    'p50_seconds': self._round(percentile(values, 0.5)),
+                    'p95_seconds': self._round(percentile(values, 0.95)),
+                    'max_seconds': self._round(max(values) if values else None)
+                }
+            input_megabytes = self.input_bytes / 1024 / 1024
+            output_megabytes = self.output_bytes / 1024 / 1024
+            megapixels = self.pixels / 1000000
+
+            summary = {
+                'images': images,
+                'processed_images': self.processed_images,
+                'cached_images': self.cached_images,
+                'elapsed_seconds': round(elapsed, 3),
+                'images_per_second': self._per_second(images, elapsed),
+                'input_megabytes': round(input_megabytes, 3),
+                'output_megabytes': round(output_megabytes, 3),
+                'input_megabytes_per_second': self._per_second(input_megabytes, elapsed),
+                'output_megabytes_per_second': self._per_second(output_megabytes, elapsed),
+                'cached_input_megabytes': round(self.cached_input_bytes / 1024 / 1024, 3),
+                'cached_output_megabytes': round(self.cached_output_bytes / 1024 / 1024, 3),
+                'megapixels': round(megapixels, 3),
+                'megapixels_per_second': self._per_second(megapixels, elapsed),
+                'stages': stages
+            }
+            if self.memory_budget is not None:
+                summary['memory'] = {
+                    'budget_megabytes': round(self.memory_budget / 1024 / 1024, 3),
+                    'peak_estimated_megabytes': round(self.peak_memory_estimate / 1024 / 1024, 3)
+                }
+            return summary
+
+    @staticmethod
+    def _round(value):
+        return None if value is None else round(value, 6)
+
+    def export_json(self, file_path):
+        """
+        将汇总导出为JSON文件
+        """
+        try:
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            raise Exception(f"导出处理统计失败: {str(e)}")
@@ -0,0 +1,375 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+
+
+# 混合公式与Pillow的 Image.paste(layer, pos, layer) 完全一致：
+#   tmp = base * (255 - alpha) + src * alpha + 128
+#   out = ((tmp >> 8) + tmp) >> 8
+# 其中 src * alpha + 128 只与水印图层有关，可以预先计算（预乘alpha），
+# 所有中间值都小于 65536，可以全程使用 uint16 计算。
+
+# 不同透明度对应的alpha查找表缓存
+_opacity_luts = {}
+
+# 大图分条带并行合成使用的共享线程池（首次使用时创建）
+# NumPy的逐元素运算和Pillow的裁剪/粘贴会释放GIL，各条带可以在多个核心上同时混合
+_parallel_workers = os.cpu_count() or 1
+_executor = None
+_executor_lock = threading.Lock()
+# 并行合成时每个条带的最少行数，避免条带过碎
+MIN_BAND_ROWS = 64
+
+
+def _div255(tmp):
+    """
+    按Pillow的方式计算 (tmp - 128) / 255 并取整，tmp 为已加上 128 的 uint16 数组
+    """
+    tmp += tmp >> 8
+    tmp >>= 8
+    return tmp
+
+
+def opacity_lut(opacity):
+    """
+    获取透明度查找表（长度256的uint8数组）
+    直接由Pillow对灰度渐变执行 point(lambda p: p * opacity / 100) 得到，
+    保证与原有的透明度处理结果逐值一致
+    """
+    lut = _opacity_luts.get(opacity)
+    if lut is None:
+        gradient = Image.frombytes('L', (256, 1), bytes(range(256)))
+        scaled = gradient.point(lambda p: p * opacity / 100)
+        lut = np.frombuffer(scaled.tobytes(), dtype=np.uint8).copy()
+        _opacity_luts[opacity] = lut
+    return lut
+
+
+def fade_layer(layer, opacity):
+    """
+    返回alpha按透明度缩放后的RGBA图层副本
+    只用于回退到 Image.paste 的图片模式，合成引擎在 PreparedLayer 中一并完成透明度缩放
+    """
+    layer = layer.convert('RGBA') if layer.mode != 'RGBA' else layer.copy()
+    layer.putalpha(layer.getchannel('A').point(list(opacity_lut(opacity))))
+    return layer
+
+
+def set_parallel_workers(workers=None):
+    """
+    设置并行合成的线程数，None 表示使用CPU核心数，1 表示始终串行合成
+    """
+    global _parallel_workers, _executor
+    if workers is not None and workers < 1:
+        raise ValueError("并行合成的线程数必须大于0")
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+        _parallel_workers = workers or os.cpu_count() or 1
+
+
+def _reset_executor():
+    """
+    fork 出的子进程不会继承线程池的线程，需要在子进程中重新创建
+    """
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_executor)
+
+
+def _should_parallelize(pixels, parallel_threshold):
+    """
+    判断是否分条带并行合成：需要合成的像素数达到阈值且有多个线程可用
+    """
+    return parallel_threshold is not None and pixels >= parallel_threshold and _parallel_workers > 1
+
+
+def _ensure_writable(image):
+    """
+    在分发到多个线程前加载像素数据
+    只读图片（如由 fromarray/frombuffer 创建）在第一次写入时才会复制，必须先在当前线程完成复制，
+    否则各线程的 paste 会各自复制一份图片；这里用公开的 paste 写回一个原样的像素来触发复制
+    """
+    if image.readonly:
+        image.paste(image.crop((0, 0, 1, 1)), (0, 0))
+    else:
+        image.load()
+
+
+def _run_parallel(func, arguments):
+    """
+    在共享线程池中对每组参数调用 func，等待全部完成，任一任务的异常会重新抛出
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_parallel_workers,
+                                           thread_name_prefix='compositor')
+        executor = _executor
+    futures = [executor.submit(func, *args) for args in arguments]
+    for future in futures:
+        future.result()
+
+
+class PreparedLayer:
+    """
+    预乘alpha的水印图层
+    构建时一次性完成透明度缩放和颜色预乘，之后每次合成只需一次乘加运算
+    """
+
+    def __init__(self, layer, opacity=100):
+        rgba = np.asarray(layer.convert('RGBA') if layer.mode != 'RGBA' else layer, dtype=np.uint8)
+        alpha = rgba[..., 3]
+        if opacity != 100:
+            alpha = opacity_lut(opacity)[alpha]
+            rgba = rgba.copy()
+            rgba[..., 3] = alpha
+
+        alpha16 = alpha.astype(np.uint16)[..., np.newaxis]
+        # 预乘后的颜色（含alpha通道本身，已加上取整偏移128），以及用于底图的反向权重
+        self.premultiplied = rgba.astype(np.uint16) * alpha16 + 128
+        self.inverse_alpha = 255 - alpha16
+        self.size = layer.size
+        self.width, self.height = layer.size
+        self._planes = {}
+
+    @classmethod
+    def from_arrays(cls, premultiplied, inverse_alpha):
+        """
+        由已预乘的数组直接构建图层
+        """
+        layer = cls.__new__(cls)
+        layer.premultiplied = premultiplied
+        layer.inverse_alpha = inverse_alpha
+        layer.height, layer.width = premultiplied.shape[:2]
+        layer.size = (layer.width, layer.height)
+        layer._planes = {}
+        return layer
+
+    def planes(self, channels):
+        """
+        获取与底图通道数一致的连续数组 (预乘颜色, 反向权重)
+        连续内存布局可以让NumPy使用最快的逐元素运算，结果按通道数缓存
+        """
+        planes = self._planes.get(channels)
+        if planes is None:
+            planes = (
+                np.ascontiguousarray(self.premultiplied[..., :channels]),
+                np.ascontiguousarray(np.broadcast_to(
+                    self.inverse_alpha, (self.height, self.width, channels)))
+            )
+            self._planes[channels] = planes
+        return planes
+
+    def crop(self, box):
+        """
+        裁剪图层的一部分，返回新的 PreparedLayer
+        """
+        left, top, right, bottom = box
+        cropped = PreparedLayer.from_arrays(self.premultiplied[top:bottom, left:right],
+                                            self.inverse_alpha[top:bottom, left:right])
+        for channels, (premultiplied, inverse_alpha) in self._planes.items():
+            cropped._planes[channels] = (premultiplied[top:bottom, left:right],
+                                         inverse_alpha[top:bottom, left:right])
+        return cropped
+
+
+def prepare_layer(layer, opacity=100):
+    """
+    将RGBA图像转换为 PreparedLayer，已是 PreparedLayer 时直接返回
+    """
+    if isinstance(layer, PreparedLayer):
+        return layer
+    return PreparedLayer(layer, opacity)
+
+
+def blend_array(base, layer):
+    """
+    将 PreparedLayer 混合到同尺寸的 uint8 数组上（原地修改）
+    base 的形状为 (高, 宽, 3) 或 (高, 宽, 4)
+    """
+    premultiplied, inverse_alpha = layer.planes(base.shape[2])
+    blended = base.astype(np.uint16)
+    np.multiply(blended, inverse_alpha, out=blended)
+    blended += premultiplied
+    blended += blended >> 8
+    blended >>= 8
+    np.copyto(base, blended, casting='unsafe')
+    return base
+
+
+def composite(image, layer, position, opacity=100, parallel_threshold=None):
+    """
+    将水印图层合成到RGB/RGBA图片的指定位置（原地修改）
+    只裁剪、混合并写回图层与图片相交的区域
+
+    Args:
+        image: RGB 或 RGBA 模式的 PIL 图片
+        layer: RGBA 模式的 PIL 图片或 PreparedLayer
+        position: 图层左上角在图片中的坐标，可以为负数或超出图片
+        opacity: 额外的透明度（0-100），仅在 layer 为 PIL 图片时使用
+        parallel_threshold: 相交区域的像素数达到该值时分条带并行混合，None 表示不并行
+    """
+    if image.mode not in ('RGB', 'RGBA'):
+        raise ValueError(f"合成引擎不支持的图片模式: {image.mode}")
+
+    pos_x, pos_y = position
+
+    # 计算图层与图片相交的区域
+    left = max(pos_x, 0)
+    top = max(pos_y, 0)
+    right = min(pos_x + layer.width, image.width)
+    bottom = min(pos_y + layer.height, image.height)
+    if right <= left or bottom <= top:
+        return image
+
+    prepared = prepare_layer(layer, opacity)
+    if (left, top, right, bottom) != (pos_x, pos_y, pos_x + prepared.width, pos_y + prepared.height):
+        prepared = prepared.crop((left - pos_x, top - pos_y, right - pos_x, bottom - pos_y))
+
+    return _blend_box(image, prepared, (left, top, right, bottom), parallel_threshold)
+
+
+def _blend_box(image, prepared, box, parallel_threshold=None):
+    """
+    裁剪区域 -> 混合 -> 写回，prepared 的尺寸必须与 box 一致
+    区域的像素数达到 parallel_threshold 时按行分成多个条带并行处理
+    """
+    left, top, right, bottom = box
+    if _should_parallelize((right - left) * (bottom - top), parallel_threshold):
+        band_count = min(_parallel_workers, max(1, (bottom - top) // MIN_BAND_ROWS))
+        if band_count > 1:
+            _ensure_writable(image)
+            # 在分发前准备好连续内存的图层数组，裁剪出的条带直接共享
+            prepared.planes(len(image.mode))
+            edges = [top + (bottom - top) * index // band_count for index in range(band_count + 1)]
+            _run_parallel(_blend_rows, [(image, prepared, box, band_top, band_bottom)
+                                        for band_top, band_bottom in zip(edges, edges[1:])])
+            return image
+    return _blend_rows(image, prepared, box, top, bottom)
+
+
+def _blend_rows(image, prepared, box, band_top, band_bottom):
+    """
+    混合区域 box 中第 band_top 到 band_bottom 行（图片坐标）
+    """
+    left, top, right, bottom = box
+    if (band_top, band_bottom) != (top, bottom):
+        prepared = prepared.crop((0, band_top - top, right - left, band_bottom - top))
+    box = (left, band_top, right, band_bottom)
+    region = np.array(image.crop(box), dtype=np.uint8)
+    blend_array(region, prepared)
+    image.paste(Image.fromarray(region), box)
+    return image
+
+
+class PositionedOverlay:
+    """
+    已定位到固定尺寸画布上的水印图层
+    构建时完成位置计算和越界裁剪，裁剪后的图层使用连续内存，
+    同尺寸的图片只需一次区域混合，相当于一张全画布的叠加层，
+    但只保存水印实际覆盖的区域。
+    """
+
+    def __init__(self, layer, position, canvas_size):
+        prepared = prepare_layer(layer)
+        pos_x, pos_y = position
+        canvas_width, canvas_height = canvas_size
+
+        left = max(pos_x, 0)
+        top = max(pos_y, 0)
+        right = min(pos_x + prepared.width, canvas_width)
+        bottom = min(pos_y + prepared.height, canvas_height)
+
+        self.canvas_size = (canvas_width, canvas_height)
+        self.position = (pos_x, pos_y)
+        if right <= left or bottom <= top:
+            # 水印完全落在画布之外
+            self.box = None
+            self.layer = None
+            return
+
+        cropped = prepared.crop((left - pos_x, top - pos_y, right - pos_x, bottom - pos_y))
+        self.box = (left, top, right, bottom)
+        self.layer = PreparedLayer.from_arrays(np.ascontiguousarray(cropped.premultiplied),
+                                               np.ascontiguousarray(cropped.inverse_alpha))
+
+
+def composite_overlay(image, overlay, parallel_threshold=None):
+    """
+    将已定位的水印图层合成到同尺寸的RGB/RGBA图片上（原地修改）
+    """
+    if image.mode not in ('RGB', 'RGBA'):
+        raise ValueError(f"合成引擎不支持的图片模式: {image.mode}")
+    if image.size != overlay.canvas_size:
+        raise ValueError(f"叠加层尺寸 {overlay.canvas_size} 与图片尺寸 {image.size} 不一致")
+
+    if overlay.box is None:
+        return image
+    return _blend_box(image, overlay.layer, overlay.box, parallel_threshold)
+
+
+class TiledOverlay:
+    """
+    平铺水印的条带图层
+    将水印按水平步长重复铺满整幅宽度，得到一个高度等于水印高度的条带，
+    合成时只需按垂直步长逐条带混合，不再逐个粘贴水印。
+    条带只与图片宽度有关，同宽度的图片可以复用。
+    """
+
+    def __init__(self, layer, width, spacing=50, opacity=100):
+        prepared = prepare_layer(layer, opacity)
+        step_x = prepared.width + spacing
+        step_y = prepared.height + spacing
+        if spacing < 0 or step_x <= 0 or step_y <= 0:
+            raise ValueError(f"平铺条带不支持的间距: {spacing}")
+
+        # 单个平铺单元：水印位于左上角，其余部分完全透明
+        # 透明像素的预乘值为 0 * 0 + 128，反向权重为 255，混合后底图保持不变
+        cell_premultiplied = np.full((prepared.height, step_x, 4), 128, dtype=np.uint16)
+        cell_premultiplied[:, :prepared.width] = prepared.premultiplied
+        cell_inverse = np.full((prepared.height, step_x, 1), 255, dtype=np.uint16)
+        cell_inverse[:, :prepared.width] = prepared.inverse_alpha
+
+        # 横向重复单元并裁剪到图片宽度
+        repeat = -(-width // step_x)
+        self.band = PreparedLayer.from_arrays(
+            np.ascontiguousarray(np.tile(cell_premultiplied, (1, repeat, 1))[:, :width]),
+            np.ascontiguousarray(np.tile(cell_inverse, (1, repeat, 1))[:, :width])
+        )
+        self.width = width
+        self.step_y = step_y
+
+
+def composite_tiled(image, overlay, offset_y=0, parallel_threshold=None):
+    """
+    将平铺条带合成到整张图片上（原地修改）
+    结果与从 (0, 0) 开始按步长逐个粘贴水印完全一致
+
+    offset_y 为图片第一行在整幅画布中的行号，用于分条带处理大图：
+    只合成与该条带相交的水印行，结果与整幅处理后截取对应行一致
+
+    图片像素数达到 parallel_threshold 时各水印行在线程池中并行合成
+    （间距不为负数，水印行之间互不重叠）
+    """
+    if overlay.width != image.width:
+        raise ValueError(f"平铺条带宽度 {overlay.width} 与图片宽度 {image.width} 不一致")
+
+    # 第一条可能与本条带相交的水印行（可能从条带上方开始）
+    first = (offset_y // overlay.step_y) * overlay.step_y - offset_y
+    rows = range(first, image.height, overlay.step_y)
+    if len(rows) > 1 and _should_parallelize(image.width * image.height, parallel_threshold):
+        _ensure_writable(image)
+        overlay.band.planes(len(image.mode))
+        _run_parallel(composite, [(image, overlay.band, (0, y)) for y in rows])
+        return image
+
+    for y in rows:
+        composite(image, overlay.band, (0, y))
+    return image
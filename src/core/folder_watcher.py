@@ -0,0 +1,363 @@
+import os
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from src.core.image_processor import ImageProcessor
+from src.core.batch_processor import BatchProcessor, _init_worker, _process_task
+from src.utils.logger import info, warning, error
+
+# watchdog 为可选依赖（Linux上基于inotify），未安装时使用轮询
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+
+class _WatchEventHandler(FileSystemEventHandler):
+    """
+    将文件系统事件转发给 FolderWatcher
+    """
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher._notice(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher._notice(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher._notice(event.dest_path)
+
+
+class FolderWatcher:
+    """
+    热文件夹监视器，持续为输入目录中新出现的图片添加水印
+
+    - 安装了 watchdog 时使用系统文件事件（Linux上为inotify），否则定期轮询目录
+    - 文件大小和修改时间在 settle_time 秒内保持不变才会处理，避免处理上传到一半的文件；
+      已处理的文件之后再被修改会重新处理
+    - 工作进程（或线程）在启动时创建并预渲染水印，字体、水印图层和按尺寸缓存的叠加层
+      在整个监视期间保持加载
+    - 每个文件完成后通过 file_callback 报告从发现文件到输出完成的延迟
+
+    回调函数在后台线程中调用。
+    """
+
+    def __init__(self, input_dirs, output_dir, watermark,
+                 output_format='PNG', quality=95,
+                 rename_prefix='', rename_suffix='',
+                 resize_width=None, resize_height=None, resize_percentage=None,
+                 recursive=False, execution_mode='process', max_workers=None,
+                 settle_time=1.0, poll_interval=0.5, use_native_events=True,
+                 process_existing=False, region_compositing=False, reduced_decoding=False,
+                 strip_threshold=None, parallel_threshold=ImageProcessor.PARALLEL_THRESHOLD):
+        if execution_mode not in ('thread', 'process'):
+            raise ValueError(f"监视模式不支持的执行模式: {execution_mode}")
+        if max_workers is not None and max_workers < 1:
+            raise ValueError("工作进程数量必须大于0")
+        if settle_time < 0 or poll_interval <= 0:
+            raise ValueError("稳定时间不能为负数，轮询间隔必须大于0")
+
+        self.input_dirs = [os.path.abspath(path) for path in input_dirs]
+        self.output_dir = os.path.abspath(output_dir)
+        if self.output_dir in self.input_dirs:
+            # 输出文件会再次被当作新图片处理
+            raise ValueError("输出目录不能与监视目录相同")
+        self.watermark = watermark
+        self.output_format = output_format
+        self.quality = quality
+        self.rename_prefix = rename_prefix
+        self.rename_suffix = rename_suffix
+        self.resize_width = resize_width
+        self.resize_height = resize_height
+        self.resize_percentage = resize_percentage
+        self.recursive = recursive
+        self.execution_mode = execution_mode
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.use_native_events = use_native_events and Observer is not None
+        self.process_existing = process_existing
+        self.region_compositing = region_compositing
+        self.reduced_decoding = reduced_decoding
+        self.strip_threshold = strip_threshold
+        self.parallel_threshold = parallel_threshold
+
+        self.file_callback = None
+        self.error_callback = None
+
+        self.processed_count = 0
+        self.error_count = 0
+        self.in_flight = 0
+
+        # 等待稳定的文件：路径 -> [(大小, 修改时间), 发现时间, 最后变化时间]
+        self._pending = {}
+        # 已提交处理的文件：路径 -> (大小, 修改时间)
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._executor = None
+        self._observer = None
+        self._thread = None
+        self._prepared_watermark = None
+
+    def set_callbacks(self, file_callback=None, error_callback=None):
+        """
+        设置回调函数
+        file_callback(result) 的 result 包含 image_path、output_path、latency（发现到完成的秒数）、
+        settle（等待文件稳定的秒数）、processing（提交处理到完成的秒数）
+        和 timings（读取、合成、调整大小、保存各阶段的秒数及字节数）
+        error_callback(message, image_path)
+        """
+        self.file_callback = file_callback
+        self.error_callback = error_callback
+
+    @property
+    def is_running(self):
+        """
+        是否正在监视
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """
+        启动工作进程池和目录监视
+        """
+        if self.is_running:
+            raise RuntimeError("监视已在运行中")
+        for input_dir in self.input_dirs:
+            if not os.path.isdir(input_dir):
+                raise FileNotFoundError(f"监视目录不存在: {input_dir}")
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        self._stop_event.clear()
+        self._start_workers()
+
+        # 记录启动时已存在的文件，默认不处理
+        now = time.monotonic()
+        for image_path in self._scan():
+            if self.process_existing:
+                self._notice(image_path, now)
+            else:
+                self._seen[image_path] = self._stat_key(image_path)
+
+        if self.use_native_events:
+            self._observer = Observer()
+            handler = _WatchEventHandler(self)
+            for input_dir in self.input_dirs:
+                self._observer.schedule(handler, input_dir, recursive=self.recursive)
+            self._observer.start()
+
+        self._thread = threading.Thread(target=self._run, name="folder-watcher")
+        self._thread.daemon = True
+        self._thread.start()
+        info(f"开始监视目录: {', '.join(self.input_dirs)}"
+             f"（{'文件事件' if self.use_native_events else '轮询'}模式）")
+
+    def stop(self, wait=True):
+        """
+        停止监视，wait 为 True 时等待正在处理的文件完成
+        """
+        self._stop_event.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
+        info("目录监视已停止")
+
+    def _start_workers(self):
+        """
+        创建常驻的工作进程池（或线程池）并预热
+        """
+        if self.execution_mode == 'process':
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(self.watermark.to_dict(), self.region_compositing, self.reduced_decoding,
+                          self.strip_threshold, self.parallel_threshold))
+            # 提交空任务使工作进程立即启动并完成初始化（加载字体、渲染水印）
+            for future in [self._executor.submit(_warm_up) for _ in range(self.max_workers)]:
+                future.result()
+        else:
+            self._prepared_watermark = self.watermark.prepare()
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix="folder-watcher-worker")
+
+    def _run(self):
+        """
+        监视线程：轮询目录（无文件事件时），并提交已稳定的文件
+        """
+        check_interval = min(self.poll_interval, max(self.settle_time / 4, 0.01))
+        last_scan = 0
+        while not self._stop_event.wait(check_interval):
+            now = time.monotonic()
+            if not self.use_native_events and now - last_scan >= self.poll_interval:
+                last_scan = now
+                for image_path in self._scan():
+                    self._notice(image_path, now)
+            try:
+                self._submit_settled(now)
+            except Exception as e:
+                error(f"提交监视任务失败: {str(e)}")
+
+    def _scan(self):
+        """
+        扫描所有输入目录中支持的图片
+        """
+        for input_dir in self.input_dirs:
+            for root, dirs, files in os.walk(input_dir):
+                if not self.recursive:
+                    dirs[:] = []
+                else:
+                    dirs[:] = [name for name in dirs
+                               if os.path.join(root, name) != self.output_dir and not name.startswith('.')]
+                for filename in files:
+                    image_path = os.path.join(root, filename)
+                    if self._is_candidate(image_path):
+                        yield image_path
+
+    def _is_candidate(self, image_path):
+        """
+        是否为需要处理的图片：支持的格式、不是隐藏文件、不在输出目录中
+        """
+        if os.path.basename(image_path).startswith('.'):
+            return False
+        if image_path.startswith(self.output_dir + os.sep):
+            return False
+        return ImageProcessor.is_supported_format(image_path)
+
+    @staticmethod
+    def _stat_key(image_path):
+        """
+        文件的 (大小, 修改时间)，文件不存在时返回 None
+        """
+        try:
+            stat = os.stat(image_path)
+            return stat.st_size, stat.st_mtime_ns
+        except OSError:
+            return None
+
+    def _notice(self, image_path, now=None):
+        """
+        记录新出现或发生变化的文件，等待其稳定
+        """
+        image_path = os.path.abspath(image_path)
+        if not self._is_candidate(image_path):
+            return
+        if not self.recursive and os.path.dirname(image_path) not in self.input_dirs:
+            return
+
+        stat_key = self._stat_key(image_path)
+        if stat_key is None:
+            return
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            if image_path in self._pending or self._seen.get(image_path) == stat_key:
+                return
+            self._pending[image_path] = [stat_key, now, now]
+
+    def _submit_settled(self, now):
+        """
+        提交在 settle_time 内未再变化的文件
+        """
+        with self._lock:
+            pending = list(self._pending.items())
+
+        for image_path, entry in pending:
+            stat_key, arrived, last_change = entry
+            current = self._stat_key(image_path)
+            if current is None:
+                # 文件在稳定前被删除或移走
+                with self._lock:
+                    self._pending.pop(image_path, None)
+                continue
+            if current != stat_key:
+                entry[0], entry[2] = current, now
+                continue
+            if now - last_change < self.settle_time or current[0] == 0:
+                continue
+
+            with self._lock:
+                self._pending.pop(image_path, None)
+                self._seen[image_path] = current
+                self.in_flight += 1
+            self._submit(image_path, arrived, now)
+
+    def _submit(self, image_path, arrived, settled):
+        """
+        将稳定的文件提交给工作进程
+        """
+        submitted = time.monotonic()
+        if self.execution_mode == 'process':
+            task = (image_path, self.output_dir, self.output_format, self.quality,
+                    self.rename_prefix, self.rename_suffix,
+                    self.resize_width, self.resize_height, self.resize_percentage)
+            future = self._executor.submit(_process_task, task)
+        else:
+            future = self._executor.submit(self._process_in_thread, image_path)
+
+        future.add_done_callback(
+            lambda done: self._on_done(done, image_path, arrived, settled, submitted))
+
+    def _process_in_thread(self, image_path):
+        """
+        线程模式下处理单张图片，返回 (输出路径, 分阶段耗时)，与工作进程的返回值一致
+        """
+        timings = {}
+        output_path = BatchProcessor._process_single_image(
+            image_path, self.output_dir, self._prepared_watermark,
+            self.output_format, self.quality, self.rename_prefix, self.rename_suffix,
+            self.resize_width, self.resize_height, self.resize_percentage,
+            region_compositing=self.region_compositing, reduced_decoding=self.reduced_decoding,
+            strip_threshold=self.strip_threshold, parallel_threshold=self.parallel_threshold,
+            timings=timings)
+        return output_path, timings
+
+    def _on_done(self, future, image_path, arrived, settled, submitted):
+        """
+        单个文件处理完成，报告延迟或错误
+        """
+        finished = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+        try:
+            output_path, timings = future.result()
+        except Exception as e:
+            with self._lock:
+                self.error_count += 1
+            warning(f"监视处理失败: {image_path}, {str(e)}")
+            if self.error_callback:
+                self.error_callback(str(e), image_path)
+            return
+
+        with self._lock:
+            self.processed_count += 1
+        if self.file_callback:
+            self.file_callback({
+                'image_path': image_path,
+                'output_path': output_path,
+                'latency': finished - arrived,
+                'settle': settled - arrived,
+                'processing': finished - submitted,
+                'timings': timings
+            })
+
+
+def _warm_up():
+    """
+    工作进程预热用的空任务（初始化函数已在进程启动时执行）
+    """
+    return os.getpid()
@@ -1,8 +1,12 @@
 import os
+import threading
+from collections import OrderedDict
 from PIL import Image, ImageDraw, ImageFont
 import io
 from src.utils.font_manager import font_manager
+from . import compositor
 from src.utils.logger import info, warning, error
+from src.utils.tracing import traced
 
 class ImageProcessor:
     """
@@ -11,6 +15,28 @@ class ImageProcessor:
     
     SUPPORTED_FORMATS = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif']
     
+    # 区域合成模式下可以直接合成水印的图片模式
+    NATIVE_COMPOSITE_MODES = ('RGB', 'RGBA')
+    
+    # 处理完成的图片水印缓存（LRU），键为 (路径, 修改时间, 文件大小, 缩放, 旋转)
+    WATERMARK_CACHE_SIZE = 32
+    _watermark_cache = OrderedDict()
+    _watermark_cache_lock = threading.Lock()
+    
+    # 平铺水印条带缓存（LRU），键为 (水印图层标识, 间距, 图片宽度)
+    TILED_OVERLAY_CACHE_SIZE = 8
+    _tiled_overlay_cache = OrderedDict()
+    
+    # 缩小解码时保留的余量：先解码（或 reduce）到目标尺寸的约2倍，再用LANCZOS缩放到目标尺寸，
+    # 与 Image.thumbnail 的默认做法相同
+    REDUCING_GAP = 2.0
+    # 可以直接缩放（resize/reduce）的图片模式
+    RESAMPLE_MODES = ('L', 'LA', 'RGB', 'RGBA')
+    
+    # 分条带并行合成的默认像素数阈值：需要合成的区域达到该像素数时，
+    # 按水平条带拆分到线程池中并行混合（见 compositor），批量处理默认使用该值
+    PARALLEL_THRESHOLD = 16000000
+    
     @staticmethod
     def is_supported_format(file_path):
         """
@@ -18,11 +44,52 @@ class ImageProcessor:
         """
         ext = os.path.splitext(file_path)[1].lower()
         return ext in ImageProcessor.SUPPORTED_FORMATS
-    
+
+    @staticmethod
+    def read_header(file_path):
+        """
+        读取图片文件头，返回包含 format、mode、width、height、transparency 的字典，不解码像素
+
+        超过Pillow解压炸弹阈值（约179MP）的图片 Image.open 会直接拒绝，这时与 Image.open
+        相同按已注册的插件识别格式，但不做尺寸检查：文件头只用于估算和调度，
+        这类大图可能由分条带处理完成。无法识别时抛出异常
+        """
+        try:
+            with Image.open(file_path) as image:
+                return ImageProcessor._header_fields(image)
+        except Image.DecompressionBombError:
+            pass
+
+        Image.init()
+        with open(file_path, 'rb') as f:
+            prefix = f.read(16)
+            for format_id in Image.ID:
+                factory, accept = Image.OPEN[format_id]
+                accepted = accept is None or accept(prefix)
+                # accept 返回字符串表示可以识别但无法打开（与 Image.open 相同跳过）
+                if not accepted or isinstance(accepted, str):
+                    continue
+                f.seek(0)
+                try:
+                    image = factory(f, file_path)
+                except Exception:
+                    continue
+                return ImageProcessor._header_fields(image)
+        raise ValueError(f"无法识别的图片文件: {file_path}")
+
+    @staticmethod
+    def _header_fields(image):
+        return {'format': image.format, 'mode': image.mode, 'width': image.width,
+                'height': image.height, 'transparency': 'transparency' in image.info}
+
     @staticmethod
-    def load_image(file_path):
+    @traced('ImageProcessor.load_image', 'io')
+    def load_image(file_path, keep_native_mode=False):
         """
         加载图片文件
+        
+        keep_native_mode 为 True 时保留RGB/RGBA图片的原始模式，不再统一转换为RGBA，
+        用于区域合成模式（JPEG图片可以节省约三分之一的内存）
         """
         try:
             info(f"开始加载图片: {file_path}")
@@ -34,19 +101,74 @@ class ImageProcessor:
             image = Image.open(file_path)
             info(f"图片成功打开: {file_path}")
             
-            # 确保图片模式包含alpha通道（如果是PNG）
-            if image.mode == 'RGBA' or image.mode == 'LA':
-                info(f"图片模式已包含alpha通道: {image.mode}")
+            return ImageProcessor._convert_loaded(image, keep_native_mode)
+        except Exception as e:
+            error(f"加载图片失败: {str(e)}")
+            raise Exception(f"加载图片失败: {str(e)}")
+    
+    @staticmethod
+    def _convert_loaded(image, keep_native_mode=False):
+        """
+        将读取的图片转换为水印处理使用的模式
+        """
+        # 区域合成模式：RGB/RGBA保持原样，其他模式按是否有透明信息转换
+        if keep_native_mode:
+            if image.mode in ImageProcessor.NATIVE_COMPOSITE_MODES:
+                info(f"保留图片原始模式: {image.mode}")
                 return image
-            else:
-                # 转换为RGBA以支持透明水印
-                info(f"将图片从 {image.mode} 转换为 RGBA")
-                return image.convert('RGBA')
+            target_mode = 'RGBA' if 'A' in image.mode or 'transparency' in image.info else 'RGB'
+            info(f"将图片从 {image.mode} 转换为 {target_mode}")
+            return image.convert(target_mode)
+        
+        # 确保图片模式包含alpha通道（如果是PNG）
+        if image.mode == 'RGBA' or image.mode == 'LA':
+            info(f"图片模式已包含alpha通道: {image.mode}")
+            return image
+        else:
+            # 转换为RGBA以支持透明水印
+            info(f"将图片从 {image.mode} 转换为 RGBA")
+            return image.convert('RGBA')
+    
+    @staticmethod
+    @traced('ImageProcessor.load_image_for_output', 'io')
+    def load_image_for_output(file_path, width=None, height=None, percentage=None, keep_native_mode=False):
+        """
+        按输出尺寸加载图片，返回 (输出尺寸的图片, 原始尺寸)
+        
+        JPEG 使用DCT域的缩小解码（draft）直接解码到接近目标的尺寸，
+        其他格式解码后先用 reduce 快速缩小，再用LANCZOS缩放到目标尺寸；
+        模式转换在缩小之后进行。未指定输出尺寸时与 load_image 相同。
+        水印需要按原始尺寸缩放后再添加（apply_watermark 的 source_size 参数），
+        结果与先在原图上添加水印再缩小的效果一致（不保证逐像素相同）。
+        """
+        try:
+            if not ImageProcessor.is_supported_format(file_path):
+                warning(f"不支持的图片格式: {file_path}")
+                raise ValueError(f"不支持的图片格式: {file_path}")
+            
+            image = Image.open(file_path)
+            source_size = image.size
+            target_size = ImageProcessor.target_size(source_size[0], source_size[1],
+                                                     width, height, percentage)
+            if target_size is None or target_size == source_size:
+                return ImageProcessor._convert_loaded(image, keep_native_mode), source_size
+            
+            # 只有JPEG支持，其他格式调用无效果
+            gap = ImageProcessor.REDUCING_GAP
+            image.draft(None, (int(target_size[0] * gap), int(target_size[1] * gap)))
+            info(f"按输出尺寸加载图片: {file_path}, {source_size[0]}x{source_size[1]} -> "
+                 f"解码 {image.width}x{image.height} -> 输出 {target_size[0]}x{target_size[1]}")
+            
+            if image.mode not in ImageProcessor.RESAMPLE_MODES:
+                image = ImageProcessor._convert_loaded(image, keep_native_mode)
+            image = image.resize(target_size, Image.LANCZOS, reducing_gap=gap)
+            return ImageProcessor._convert_loaded(image, keep_native_mode), source_size
         except Exception as e:
             error(f"加载图片失败: {str(e)}")
             raise Exception(f"加载图片失败: {str(e)}")
     
     @staticmethod
+    @traced('ImageProcessor.save_image', 'io')
     def save_image(image, output_path, format=None, quality=95):
         """
         保存图片到指定路径
@@ -64,8 +186,9 @@ class ImageProcessor:
             
             # 如果输出格式为JPEG，转换为RGB模式
             if format.upper() == 'JPEG':
-                info("输出格式为JPEG，将图片转换为RGB模式")
-                image = image.convert('RGB')
+                if image.mode != 'RGB':
+                    info("输出格式为JPEG，将图片转换为RGB模式")
+                    image = image.convert('RGB')
                 image.save(output_path, format=format, quality=quality)
             else:
                 image.save(output_path, format=format, quality=quality)
@@ -103,14 +226,54 @@ class ImageProcessor:
             except:
                 return 20 * len(text) // 2, 20
     
+    @staticmethod
+    def composite_region(image, layer, position, parallel_threshold=None, opacity=100):
+        """
+        将RGBA水印图层合成到图片的指定位置（原地修改图片）
+        只处理图层与图片相交的区域，不复制整张图片
+        layer 可以是 PIL 图片或 compositor.PreparedLayer（此时忽略 opacity）
+        相交区域的像素数达到 parallel_threshold 时分条带并行合成
+        """
+        if image.mode not in ImageProcessor.NATIVE_COMPOSITE_MODES:
+            raise ValueError(f"区域合成不支持的图片模式: {image.mode}")
+        
+        return compositor.composite(image, layer, position, opacity, parallel_threshold=parallel_threshold)
+    
+    @staticmethod
+    def composite_overlay(image, overlay, parallel_threshold=None):
+        """
+        将已定位的水印叠加层（compositor.PositionedOverlay）合成到同尺寸图片上（原地修改图片）
+        叠加区域的像素数达到 parallel_threshold 时分条带并行合成
+        """
+        if image.mode not in ImageProcessor.NATIVE_COMPOSITE_MODES:
+            raise ValueError(f"区域合成不支持的图片模式: {image.mode}")
+        
+        return compositor.composite_overlay(image, overlay, parallel_threshold)
+    
+    @staticmethod
+    def paste_layer(image, layer, position, parallel_threshold=None, opacity=100):
+        """
+        将RGBA水印图层按透明度 opacity 粘贴到图片上（原地修改图片）
+        RGB/RGBA图片使用合成引擎（透明度在同一次混合中完成，相交区域达到 parallel_threshold 时分条带并行），
+        其他模式回退到Pillow的paste
+        """
+        if image.mode in ImageProcessor.NATIVE_COMPOSITE_MODES:
+            return compositor.composite(image, layer, position, opacity, parallel_threshold=parallel_threshold)
+        
+        if opacity != 100:
+            layer = compositor.fade_layer(layer, opacity)
+        image.paste(layer, position, layer)
+        return image
+    
     @staticmethod
     def add_text_watermark(image, text, position, font_name=None, font_size=20, 
-                          font_color=(255, 255, 255, 128), rotation=0):
+                          font_color=(255, 255, 255, 128), rotation=0, in_place=False):
         """
         添加文本水印
+        in_place 为 True 时直接在原图上合成（区域合成模式），不复制整张图片
         """
         # 创建一个可绘制的副本
-        watermark_image = image.copy()
+        watermark_image = image if in_place else image.copy()
         draw = ImageDraw.Draw(watermark_image, 'RGBA')
         
         # 加载字体
@@ -166,43 +329,113 @@ class ImageProcessor:
                 pos_x, pos_y = img_width - text_width - 10, img_height - text_height - 10
         
         # 粘贴水印
-        watermark_image.paste(text_img, (pos_x, pos_y), text_img)
+        if in_place:
+            return ImageProcessor.composite_region(watermark_image, text_img, (pos_x, pos_y))
+        
+        return ImageProcessor.paste_layer(watermark_image, text_img, (pos_x, pos_y))
+    
+    @staticmethod
+    def prepare_image_watermark(watermark_path, scale=1.0, rotation=0):
+        """
+        加载水印图片并完成缩放和旋转，返回RGBA图层
+        透明度不在图层中处理，合成时传给 paste_layer/composite_region（在预乘图层时一并缩放alpha），
+        同一张水印图片的不同透明度共用一个图层
+        
+        结果按 (路径, 修改时间, 文件大小, 缩放, 旋转) 缓存，水印文件被修改后自动失效。
+        返回的图层在多次调用之间共享，调用方不应修改它。
+        """
+        cache_key = ImageProcessor._watermark_asset_key(watermark_path, scale, rotation)
+        
+        # 检查缓存
+        watermark = ImageProcessor._cache_get(ImageProcessor._watermark_cache, cache_key)
+        if watermark is not None:
+            return watermark
+        
+        watermark = ImageProcessor._render_image_watermark(watermark_path, scale, rotation)
         
-        return watermark_image
+        # 缓存处理结果，超出容量时淘汰最久未使用的条目
+        ImageProcessor._cache_put(ImageProcessor._watermark_cache, cache_key, watermark,
+                                  ImageProcessor.WATERMARK_CACHE_SIZE)
+        return watermark
+    
+    @staticmethod
+    def _watermark_asset_key(watermark_path, scale, rotation):
+        """
+        生成图片水印的缓存键，水印文件被修改后键随之改变
+        """
+        stat = os.stat(watermark_path)
+        return (os.path.abspath(watermark_path), stat.st_mtime_ns, stat.st_size, scale, rotation)
+    
+    @staticmethod
+    def _cache_get(cache, key):
+        """
+        从LRU缓存中读取条目，命中时将其标记为最近使用
+        """
+        with ImageProcessor._watermark_cache_lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+    
+    @staticmethod
+    def _cache_put(cache, key, value, max_size):
+        """
+        写入LRU缓存，超出容量时淘汰最久未使用的条目
+        """
+        with ImageProcessor._watermark_cache_lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > max_size:
+                cache.popitem(last=False)
+    
+    @staticmethod
+    def clear_watermark_cache():
+        """
+        清除图片水印缓存
+        """
+        with ImageProcessor._watermark_cache_lock:
+            ImageProcessor._watermark_cache.clear()
+            ImageProcessor._tiled_overlay_cache.clear()
+        info("图片水印缓存已清除")
     
     @staticmethod
-    def add_image_watermark(image, watermark_path, position, opacity=50, scale=1.0, rotation=0):
+    def _render_image_watermark(watermark_path, scale, rotation):
+        """
+        加载水印图片并完成缩放和旋转（不使用缓存）
+        """
+        # 加载水印图片
+        watermark = Image.open(watermark_path).convert('RGBA')
+        info(f"水印图片加载成功: {watermark_path}")
+        
+        # 缩放水印
+        if scale != 1.0:
+            new_width = int(watermark.width * scale)
+            new_height = int(watermark.height * scale)
+            info(f"缩放水印: {watermark.width}x{watermark.height} -> {new_width}x{new_height}")
+            watermark = watermark.resize((new_width, new_height), Image.LANCZOS)
+        
+        # 旋转水印
+        if rotation != 0:
+            info(f"旋转水印: {rotation}度")
+            watermark = watermark.rotate(rotation, expand=True, resample=Image.BICUBIC)
+        
+        return watermark
+    
+    @staticmethod
+    def add_image_watermark(image, watermark_path, position, opacity=50, scale=1.0, rotation=0,
+                            in_place=False):
         """
         添加图片水印
+        in_place 为 True 时直接在原图上合成（区域合成模式），不复制整张图片
         """
         try:
             info(f"开始添加图片水印: {watermark_path}")
             
-            # 加载水印图片
-            watermark = Image.open(watermark_path).convert('RGBA')
-            info(f"水印图片加载成功: {watermark_path}")
-            
-            # 缩放水印
-            if scale != 1.0:
-                new_width = int(watermark.width * scale)
-                new_height = int(watermark.height * scale)
-                info(f"缩放水印: {watermark.width}x{watermark.height} -> {new_width}x{new_height}")
-                watermark = watermark.resize((new_width, new_height), Image.LANCZOS)
-            
-            # 旋转水印
-            if rotation != 0:
-                info(f"旋转水印: {rotation}度")
-                watermark = watermark.rotate(rotation, expand=True, resample=Image.BICUBIC)
-            
-            # 调整透明度
-            if opacity != 100:
-                info(f"调整水印透明度: {opacity}%")
-                alpha = watermark.split()[3]
-                alpha = alpha.point(lambda p: p * opacity / 100)
-                watermark.putalpha(alpha)
+            # 加载并处理水印图片
+            watermark = ImageProcessor.prepare_image_watermark(watermark_path, scale, rotation)
             
             # 创建副本并粘贴水印
-            watermark_image = image.copy()
+            watermark_image = image if in_place else image.copy()
             img_width, img_height = watermark_image.size
             wm_width, wm_height = watermark.size
             info(f"图片尺寸: {img_width}x{img_height}, 水印尺寸: {wm_width}x{wm_height}")
@@ -236,8 +469,11 @@ class ImageProcessor:
             
             info(f"水印位置: {position} ({pos_x}, {pos_y})")
             
-            # 粘贴水印
-            watermark_image.paste(watermark, (pos_x, pos_y), watermark)
+            # 粘贴水印，透明度在合成时与混合一起完成
+            if in_place:
+                ImageProcessor.composite_region(watermark_image, watermark, (pos_x, pos_y), opacity=opacity)
+            else:
+                ImageProcessor.paste_layer(watermark_image, watermark, (pos_x, pos_y), opacity=opacity)
             info("图片水印添加完成")
             
             return watermark_image
@@ -248,104 +484,178 @@ class ImageProcessor:
     @staticmethod
     def add_tiled_watermark(image, text, font_name=None, font_size=20,
                            font_color=(255, 255, 255, 128), rotation=0,
-                           spacing=50):
+                           spacing=50, in_place=False, source_size=None):
         """
         添加平铺文本水印
+        in_place 为 True 时直接在原图上合成，不复制整张图片
+        source_size 为图片缩放前的原始尺寸，水印图层和间距按原图计算后再等比缩放
         """
         try:
             # 创建一个可绘制的副本
-            watermark_image = image.copy()
-            draw = ImageDraw.Draw(watermark_image, 'RGBA')
-            
-            # 加载字体
-            font = font_manager.load_font(font_name, font_size)
-            
-            if font is None:
-                warning("无法加载任何字体，使用默认字体")
-                font = ImageFont.load_default()
-            
-            # 获取文本尺寸
-            text_width, text_height = ImageProcessor._get_text_size(draw, text, font)
-            
-            # 创建文本图像
-            text_img = Image.new('RGBA', (text_width, text_height), (255, 255, 255, 0))
-            text_draw = ImageDraw.Draw(text_img)
-            text_draw.text((0, 0), text, font=font, fill=font_color)
-            
-            # 旋转文本
-            if rotation != 0:
-                text_img = text_img.rotate(rotation, expand=True)
-            
-            # 平铺水印
-            img_width, img_height = watermark_image.size
-            wm_width, wm_height = text_img.size
+            watermark_image = image if in_place else image.copy()
             
-            # 计算每行每列可以放置的水印数量
-            # 考虑间距
-            step_x = wm_width + spacing
-            step_y = wm_height + spacing
+            render_layer = lambda: ImageProcessor._render_tiled_text(text, font_name, font_size, font_color, rotation)
+            if source_size and tuple(source_size) != image.size:
+                return ImageProcessor._apply_scaled_tiled_layer(watermark_image, render_layer(), spacing,
+                                                                tuple(source_size))
             
-            # 平铺水印
-            for x in range(0, img_width, step_x):
-                for y in range(0, img_height, step_y):
-                    # 计算实际位置
-                    pos_x = x
-                    pos_y = y
-                    
-                    # 粘贴水印
-                    watermark_image.paste(text_img, (pos_x, pos_y), text_img)
-            
-            return watermark_image
+            layer_key = ('text', text, font_name, font_size, tuple(font_color), rotation)
+            return ImageProcessor._apply_tiled_layer(watermark_image, layer_key, spacing, render_layer)
         except Exception as e:
             raise Exception(f"添加平铺水印失败: {str(e)}")
     
+    @staticmethod
+    def _render_tiled_text(text, font_name, font_size, font_color, rotation):
+        """
+        渲染平铺文本水印的单个图层
+        """
+        # 加载字体
+        font = font_manager.load_font(font_name, font_size)
+        
+        if font is None:
+            warning("无法加载任何字体，使用默认字体")
+            font = ImageFont.load_default()
+        
+        # 获取文本尺寸
+        draw = ImageDraw.Draw(Image.new('RGBA', (1, 1)), 'RGBA')
+        text_width, text_height = ImageProcessor._get_text_size(draw, text, font)
+        
+        # 创建文本图像
+        text_img = Image.new('RGBA', (text_width, text_height), (255, 255, 255, 0))
+        text_draw = ImageDraw.Draw(text_img)
+        text_draw.text((0, 0), text, font=font, fill=font_color)
+        
+        # 旋转文本
+        if rotation != 0:
+            text_img = text_img.rotate(rotation, expand=True)
+        
+        return text_img
+    
     @staticmethod
     def add_tiled_image_watermark(image, watermark_path, opacity=50, scale=1.0,
-                                 rotation=0, spacing=50):
+                                 rotation=0, spacing=50, in_place=False, source_size=None):
         """
         添加平铺图片水印
+        in_place 为 True 时直接在原图上合成，不复制整张图片
+        source_size 为图片缩放前的原始尺寸，水印图层和间距按原图计算后再等比缩放
         """
         try:
-            # 加载水印图片
-            watermark = Image.open(watermark_path).convert('RGBA')
-            
-            # 缩放水印
-            if scale != 1.0:
-                new_width = int(watermark.width * scale)
-                new_height = int(watermark.height * scale)
-                watermark = watermark.resize((new_width, new_height), Image.LANCZOS)
-            
-            # 旋转水印
-            if rotation != 0:
-                watermark = watermark.rotate(rotation, expand=True, resample=Image.BICUBIC)
-            
-            # 调整透明度
-            if opacity != 100:
-                alpha = watermark.split()[3]
-                alpha = alpha.point(lambda p: p * opacity / 100)
-                watermark.putalpha(alpha)
-            
             # 创建副本并平铺水印
-            watermark_image = image.copy()
-            img_width, img_height = watermark_image.size
-            wm_width, wm_height = watermark.size
-            
-            # 计算每行每列可以放置的水印数量
-            # 考虑间距
-            step_x = wm_width + spacing
-            step_y = wm_height + spacing
+            watermark_image = image if in_place else image.copy()
             
-            # 平铺水印
-            for x in range(0, img_width, step_x):
-                for y in range(0, img_height, step_y):
-                    # 粘贴水印
-                    watermark_image.paste(watermark, (x, y), watermark)
+            render_layer = lambda: ImageProcessor.prepare_image_watermark(watermark_path, scale, rotation)
+            if source_size and tuple(source_size) != image.size:
+                return ImageProcessor._apply_scaled_tiled_layer(watermark_image, render_layer(), spacing,
+                                                                tuple(source_size), opacity)
             
-            return watermark_image
+            layer_key = ('image', opacity) + ImageProcessor._watermark_asset_key(watermark_path, scale, rotation)
+            return ImageProcessor._apply_tiled_layer(watermark_image, layer_key, spacing, render_layer,
+                                                     opacity=opacity)
         except Exception as e:
             raise Exception(f"添加平铺图片水印失败: {str(e)}")
     
     @staticmethod
+    def scale_tiled_layer(layer, spacing, source_size, image_size):
+        """
+        将按原图尺寸 source_size 渲染的水印图层和平铺间距缩放到图片尺寸 image_size
+        返回 (缩放后的图层, 缩放后的间距)
+        """
+        scale_x = image_size[0] / source_size[0]
+        scale_y = image_size[1] / source_size[1]
+        size = (max(1, round(layer.width * scale_x)), max(1, round(layer.height * scale_y)))
+        # 平铺步长（图层宽度加间距）整体缩放后再减去缩放后的图层宽度，减少逐个水印累积的偏移
+        spacing = round((layer.width + spacing) * scale_x) - size[0]
+        if size != layer.size:
+            layer = layer.resize(size, Image.LANCZOS)
+        return layer, spacing
+    
+    @staticmethod
+    def _apply_scaled_tiled_layer(image, layer, spacing, source_size, opacity=100):
+        """
+        在已缩放的图片上平铺与原图效果一致的水印（原地修改）
+        """
+        layer, spacing = ImageProcessor.scale_tiled_layer(layer, spacing, source_size, image.size)
+        return ImageProcessor._apply_tiled_layer(image, None, spacing, lambda: layer, opacity=opacity)
+    
+    @staticmethod
+    def _apply_tiled_layer(image, layer_key, spacing, render_layer, parallel_threshold=None, opacity=100):
+        """
+        将水印图层按透明度 opacity 从左上角开始按步长平铺到图片上（原地修改）
+        
+        RGB/RGBA图片使用缓存的平铺条带一次合成一整行水印，
+        图片像素数达到 parallel_threshold 时各水印行并行合成；
+        其他模式或负间距（水印互相重叠）时回退为逐个粘贴。
+        render_layer 仅在缓存未命中时调用；layer_key 为 None 时不使用缓存，
+        否则 layer_key 必须已包含透明度。
+        """
+        if image.mode in ImageProcessor.NATIVE_COMPOSITE_MODES and spacing >= 0:
+            if layer_key is None:
+                overlay = compositor.TiledOverlay(render_layer(), image.width, spacing, opacity)
+                return compositor.composite_tiled(image, overlay, parallel_threshold=parallel_threshold)
+            
+            cache_key = (layer_key, spacing, image.width)
+            overlay = ImageProcessor._cache_get(ImageProcessor._tiled_overlay_cache, cache_key)
+            if overlay is None:
+                overlay = compositor.TiledOverlay(render_layer(), image.width, spacing, opacity)
+                ImageProcessor._cache_put(ImageProcessor._tiled_overlay_cache, cache_key, overlay,
+                                          ImageProcessor.TILED_OVERLAY_CACHE_SIZE)
+            return compositor.composite_tiled(image, overlay, parallel_threshold=parallel_threshold)
+        
+        layer = render_layer()
+        img_width, img_height = image.size
+        wm_width, wm_height = layer.size
+        
+        # 计算每行每列可以放置的水印数量
+        # 考虑间距
+        step_x = wm_width + spacing
+        step_y = wm_height + spacing
+        
+        # 预乘图层（或回退模式下的透明度缩放）只计算一次
+        if image.mode in ImageProcessor.NATIVE_COMPOSITE_MODES:
+            layer = compositor.prepare_layer(layer, opacity)
+        elif opacity != 100:
+            layer = compositor.fade_layer(layer, opacity)
+        
+        # 平铺水印
+        for x in range(0, img_width, step_x):
+            for y in range(0, img_height, step_y):
+                # 粘贴水印
+                ImageProcessor.paste_layer(image, layer, (x, y))
+        
+        return image
+    
+    @staticmethod
+    def target_size(img_width, img_height, width=None, height=None, percentage=None):
+        """
+        计算调整大小后的尺寸，不需要调整时返回 None
+        """
+        if percentage:
+            # 按百分比缩放
+            new_width = int(img_width * percentage / 100)
+            new_height = int(img_height * percentage / 100)
+            info(f"按百分比缩放: {percentage}% -> {new_width}x{new_height}")
+        elif width and height:
+            # 同时指定宽高
+            new_width, new_height = width, height
+            info(f"指定宽高: {new_width}x{new_height}")
+        elif width:
+            # 只指定宽度，保持比例
+            ratio = width / img_width
+            new_width = width
+            new_height = int(img_height * ratio)
+            info(f"按宽度缩放: {new_width}x{new_height}")
+        elif height:
+            # 只指定高度，保持比例
+            ratio = height / img_height
+            new_width = int(img_width * ratio)
+            new_height = height
+            info(f"按高度缩放: {new_width}x{new_height}")
+        else:
+            return None
+        return new_width, new_height
+    
+    @staticmethod
+    @traced('ImageProcessor.resize_image')
     def resize_image(image, width=None, height=None, percentage=None):
         """
         调整图片大小
@@ -354,31 +664,12 @@ class ImageProcessor:
             img_width, img_height = image.size
             info(f"调整图片大小: 当前尺寸 {img_width}x{img_height}")
             
-            if percentage:
-                # 按百分比缩放
-                new_width = int(img_width * percentage / 100)
-                new_height = int(img_height * percentage / 100)
-                info(f"按百分比缩放: {percentage}% -> {new_width}x{new_height}")
-            elif width and height:
-                # 同时指定宽高
-                new_width, new_height = width, height
-                info(f"指定宽高: {new_width}x{new_height}")
-            elif width:
-                # 只指定宽度，保持比例
-                ratio = width / img_width
-                new_width = width
-                new_height = int(img_height * ratio)
-                info(f"按宽度缩放: {new_width}x{new_height}")
-            elif height:
-                # 只指定高度，保持比例
-                ratio = height / img_height
-                new_width = int(img_width * ratio)
-                new_height = height
-                info(f"按高度缩放: {new_width}x{new_height}")
-            else:
+            new_size = ImageProcessor.target_size(img_width, img_height, width, height, percentage)
+            if new_size is None:
                 # 不调整大小
                 info("不调整图片大小")
                 return image.copy()
+            new_width, new_height = new_size
             
             # 调整大小
             resized_image = image.resize((new_width, new_height), Image.LANCZOS)
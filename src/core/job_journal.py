@@ -0,0 +1,133 @@
+import os
+import json
+import threading
+from src.utils.logger import info, warning
+
+
+class JobJournal:
+    """
+    批量任务日志（仅追加写入）
+    每处理完成一张图片追加一行JSON记录：输入路径、输入文件大小和修改时间、输出路径。
+    任务中断后重新运行时，输入文件未变化（大小和修改时间一致）且输出文件仍存在的记录会被跳过。
+
+    文件第一行记录任务指纹（水印配置和输出参数的哈希），指纹不一致时旧记录全部作废。
+    进程崩溃可能留下不完整的最后一行，加载时会被忽略。
+    """
+
+    def __init__(self, journal_path, fingerprint=None):
+        self.journal_path = journal_path
+        self.fingerprint = fingerprint
+        self.entries = {}
+        self._file = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        """
+        加载已有记录并打开日志文件准备追加
+        """
+        try:
+            journal_dir = os.path.dirname(os.path.abspath(self.journal_path))
+            os.makedirs(journal_dir, exist_ok=True)
+
+            valid = self._load()
+            if valid:
+                self._file = open(self.journal_path, 'a', encoding='utf-8')
+                # 上次崩溃时写了一半的行需要先补上换行，避免与新记录拼接
+                if self._file.tell() > 0 and not self._ends_with_newline():
+                    self._file.write('\n')
+            else:
+                self.entries = {}
+                self._file = open(self.journal_path, 'w', encoding='utf-8')
+                self._write({'fingerprint': self.fingerprint})
+
+            info(f"任务日志已打开: {self.journal_path}, 已完成 {len(self.entries)} 项")
+            return self
+        except Exception as e:
+            raise Exception(f"打开任务日志失败: {str(e)}")
+
+    def _load(self):
+        """
+        读取已有记录，返回日志是否可以继续使用
+        """
+        if not os.path.exists(self.journal_path):
+            return False
+
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        if not lines:
+            return False
+
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            warning(f"任务日志头部损坏，重新开始: {self.journal_path}")
+            return False
+        if header.get('fingerprint') != self.fingerprint:
+            warning(f"任务配置已改变，忽略旧的任务日志: {self.journal_path}")
+            return False
+
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+                self.entries[entry['input']] = entry
+            except (ValueError, KeyError, TypeError):
+                # 崩溃时写了一半的行
+                continue
+        return True
+
+    def _ends_with_newline(self):
+        """
+        检查日志文件是否以换行结尾
+        """
+        with open(self.journal_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def _write(self, record):
+        """
+        追加一行记录并立即刷新到操作系统
+        """
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def is_completed(self, image_path):
+        """
+        检查图片是否已在之前的运行中处理完成
+        只比较文件大小和修改时间，并确认输出文件仍然存在
+        """
+        entry = self.entries.get(os.path.abspath(image_path))
+        if entry is None:
+            return False
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return False
+        return (stat.st_size == entry['size'] and
+                stat.st_mtime_ns == entry['mtime_ns'] and
+                os.path.exists(entry['output']))
+
+    def record(self, image_path, output_path):
+        """
+        记录一张图片处理完成
+        """
+        image_path = os.path.abspath(image_path)
+        stat = os.stat(image_path)
+        entry = {
+            'input': image_path,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'output': os.path.abspath(output_path)
+        }
+        with self._lock:
+            self.entries[image_path] = entry
+            if self._file is not None:
+                self._write(entry)
+
+    def close(self):
+        """
+        关闭日志文件
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,153 @@
+import threading
+from PIL import Image
+from src.core.image_processor import ImageProcessor
+from src.core.strip_processor import StripProcessor, STRIP_BYTES
+
+
+# 特殊模式每像素的字节数，其他模式每个通道1字节
+_MODE_PIXEL_BYTES = {'1': 1, 'I': 4, 'F': 4, 'I;16': 2, 'I;16B': 2, 'I;16L': 2, 'I;16N': 2}
+
+
+def pixel_bytes(mode):
+    """
+    返回指定模式下每个像素解码后占用的字节数
+    """
+    if mode in _MODE_PIXEL_BYTES:
+        return _MODE_PIXEL_BYTES[mode]
+    try:
+        return Image.getmodebands(mode)
+    except Exception:
+        return 4
+
+
+class MemoryEstimator:
+    """
+    根据文件头估算单张图片处理时的内存峰值
+
+    只读取文件头中的尺寸、模式和格式，不解码像素。估算值按处理流程中同时存在的
+    像素缓冲区累加（解码结果、模式转换结果、水印合成的副本、调整大小的结果），
+    偏向高估，用于调度而不是精确计量。分条带处理的大图只计条带缓冲区。
+    """
+
+    # 分条带处理时同时存在的条带缓冲区数量（读取、合成、写出）
+    STRIP_BUFFERS = 4
+
+    @staticmethod
+    def estimate(image_path, region_compositing=False, resize_width=None, resize_height=None,
+                 resize_percentage=None, reduced_decoding=False, strip_threshold=None, output_format='PNG'):
+        """
+        估算处理一张图片的内存峰值（字节），无法读取文件头时返回 None
+        超过Pillow解压炸弹阈值的大图同样按文件头估算（可能分条带处理）
+        """
+        try:
+            header = ImageProcessor.read_header(image_path)
+        except Exception:
+            return None
+        width, height = header['width'], header['height']
+        mode = header['mode']
+        image_format = header['format']
+        has_transparency = header['transparency']
+
+        resizing = bool(resize_width or resize_height or resize_percentage)
+        if strip_threshold is not None and width * height > strip_threshold and StripProcessor.can_process(
+                image_path, strip_threshold, output_format, resizing):
+            return STRIP_BYTES * MemoryEstimator.STRIP_BUFFERS
+
+        # 水印处理使用的模式（与 ImageProcessor._convert_loaded 一致）
+        if region_compositing and mode in ImageProcessor.NATIVE_COMPOSITE_MODES:
+            working_mode = mode
+        elif region_compositing and not ('A' in mode or has_transparency):
+            working_mode = 'RGB'
+        else:
+            working_mode = mode if mode in ('RGBA', 'LA') else 'RGBA'
+
+        source_pixels = width * height
+        target_size = ImageProcessor.target_size(width, height, resize_width, resize_height,
+                                                 resize_percentage) if resizing else None
+        output_pixels = target_size[0] * target_size[1] if target_size else source_pixels
+
+        if reduced_decoding and target_size:
+            # JPEG按输出尺寸缩小解码，其他格式仍需完整解码后再缩小
+            if image_format == 'JPEG':
+                decoded = min(source_pixels, int(output_pixels * ImageProcessor.REDUCING_GAP ** 2))
+            else:
+                decoded = source_pixels
+            return decoded * pixel_bytes(mode) + output_pixels * pixel_bytes(working_mode) * 2
+
+        total = source_pixels * pixel_bytes(mode)
+        if working_mode != mode:
+            total += source_pixels * pixel_bytes(working_mode)
+        if not region_compositing:
+            # 整图合成先复制一份图片
+            total += source_pixels * pixel_bytes(working_mode)
+        if target_size:
+            total += output_pixels * pixel_bytes(working_mode)
+        return total
+
+    @staticmethod
+    def schedule(image_paths, unknown_cost=0, **options):
+        """
+        估算每张图片的内存峰值并按从大到小排序，返回 [(图片路径, 估算字节数), ...]
+        大图先处理，避免批次末尾只剩一张大图在运行；估算值相同的图片保持原有顺序。
+        无法读取文件头的图片估算值为 unknown_cost，按内存预算调度时应传入整个预算，
+        使其单独处理而不是与其他图片同时运行
+        """
+        estimates = []
+        for image_path in image_paths:
+            estimate = MemoryEstimator.estimate(image_path, **options)
+            estimates.append((image_path, unknown_cost if estimate is None else estimate))
+        return sorted(estimates, key=lambda item: item[1], reverse=True)
+
+
+class MemoryBudget:
+    """
+    按字节计量的内存预算
+
+    任务开始前申请其估算的内存，结束后释放；正在处理的任务估算值之和不超过预算。
+    单个任务超过整个预算时，只在没有其他任务运行时才允许开始，保证批次总能完成。
+    """
+
+    def __init__(self, budget_bytes):
+        if budget_bytes <= 0:
+            raise ValueError("内存预算必须大于0")
+        self.budget_bytes = budget_bytes
+        self.in_flight = 0
+        self.peak = 0
+        self._condition = threading.Condition()
+
+    def _admit(self, cost):
+        """
+        在持有锁时判断并占用预算
+        """
+        if self.in_flight and self.in_flight + cost > self.budget_bytes:
+            return False
+        self.in_flight += cost
+        self.peak = max(self.peak, self.in_flight)
+        return True
+
+    def try_acquire(self, cost):
+        """
+        预算足够时占用 cost 字节并返回 True，否则立即返回 False
+        """
+        with self._condition:
+            return self._admit(cost)
+
+    def acquire(self, cost, cancel_check=None, poll_interval=0.1):
+        """
+        阻塞直到预算足够并占用 cost 字节，返回 True
+        cancel_check 返回 True 时放弃等待并返回 False
+        """
+        with self._condition:
+            while not self._admit(cost):
+                if cancel_check is not None and cancel_check():
+                    return False
+                self._condition.wait(poll_interval)
+            return True
+
+    def release(self, cost):
+        """
+        释放 cost 字节并唤醒等待的任务
+        """
+        with self._condition:
+            self.in_flight = max(0, self.in_flight - cost)
+            self._condition.notify_all()
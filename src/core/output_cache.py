@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from src.utils.logger import info, warning
+
+
+class OutputCache:
+    """
+    按内容寻址的输出缓存
+    缓存键由输入文件内容的SHA-256、水印配置指纹和输出参数共同决定，
+    输入和参数都没有变化时直接把缓存中的输出文件硬链接（或复制）到输出路径，
+    不再重新解码、添加水印和编码。
+
+    缓存目录结构：
+        index.json                 索引（缓存条目及输入文件摘要）
+        objects/<键前两位>/<键>.<扩展名>  缓存的输出文件
+
+    总大小超过上限时按最近最少使用的顺序淘汰。
+    索引在 save() 时写回磁盘，同一缓存目录不支持多个进程同时写入。
+    """
+
+    DEFAULT_MAX_SIZE = 2 * 1024 * 1024 * 1024  # 2GB
+    # 输入文件摘要的记忆条数上限（按路径、大小、修改时间记忆，避免每次重新计算哈希）
+    MAX_DIGESTS = 100000
+    INDEX_VERSION = 1
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE, use_links=True):
+        if max_size <= 0:
+            raise ValueError("缓存大小上限必须大于0")
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.use_links = use_links
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        # 缓存条目，按最近使用顺序排列：键 -> {'file', 'size', 'last_used'}
+        self.entries = OrderedDict()
+        # 输入文件摘要：绝对路径 -> [大小, 修改时间, 摘要]
+        self.digests = OrderedDict()
+        self.total_size = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """
+        加载缓存索引，索引损坏时从空缓存开始
+        """
+        try:
+            os.makedirs(self.objects_dir, exist_ok=True)
+        except Exception as e:
+            raise Exception(f"创建缓存目录失败: {str(e)}")
+
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') != self.INDEX_VERSION:
+                raise ValueError(f"不支持的索引版本: {index.get('version')}")
+            entries = sorted(index.get('entries', {}).items(), key=lambda item: item[1]['last_used'])
+            self.entries = OrderedDict(entries)
+            self.digests = OrderedDict(index.get('digests', {}))
+            self.total_size = sum(entry['size'] for entry in self.entries.values())
+            info(f"输出缓存已加载: {len(self.entries)} 项, {self.total_size} 字节")
+        except Exception as e:
+            warning(f"读取输出缓存索引失败，使用空缓存: {str(e)}")
+            self.entries = OrderedDict()
+            self.digests = OrderedDict()
+            self.total_size = 0
+
+    def save(self):
+        """
+        将索引写回磁盘（先写临时文件再替换，避免中断时损坏索引）
+        """
+        with self._lock:
+            index = {
+                'version': self.INDEX_VERSION,
+                'entries': dict(self.entries),
+                'digests': dict(self.digests)
+            }
+        try:
+            temp_path = self.index_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(temp_path, self.index_path)
+        except Exception as e:
+            raise Exception(f"保存输出缓存索引失败: {str(e)}")
+
+    def input_digest(self, image_path):
+        """
+        计算输入文件内容的SHA-256
+        路径、大小和修改时间都没有变化时直接使用记忆的结果
+        """
+        image_path = os.path.abspath(image_path)
+        stat = os.stat(image_path)
+        with self._lock:
+            memo = self.digests.get(image_path)
+            if memo and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+                self.digests.move_to_end(image_path)
+                return memo[2]
+
+        sha256 = hashlib.sha256()
+        with open(image_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+
+        with self._lock:
+            self.digests[image_path] = [stat.st_size, stat.st_mtime_ns, digest]
+            self.digests.move_to_end(image_path)
+            while len(self.digests) > self.MAX_DIGESTS:
+                self.digests.popitem(last=False)
+        return digest
+
+    @staticmethod
+    def make_key(input_digest, fingerprint):
+        """
+        由输入摘要和输出指纹生成缓存键
+        """
+        return hashlib.sha256(f"{input_digest}:{fingerprint}".encode('utf-8')).hexdigest()
+
+    def _object_path(self, key, file_name):
+        """
+        缓存文件的绝对路径
+        """
+        return os.path.join(self.objects_dir, key[:2], file_name)
+
+    def restore(self, key, output_path):
+        """
+        缓存命中时将缓存文件放到输出路径，返回是否命中
+        输出文件已经是同一个文件（硬链接）时直接跳过
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False
+            object_path = self._object_path(key, entry['file'])
+            if not os.path.exists(object_path):
+                # 缓存文件被外部删除
+                self._remove_entry(key)
+                return False
+            entry['last_used'] = time.time()
+            self.entries.move_to_end(key)
+
+        try:
+            if os.path.exists(output_path):
+                if os.path.samefile(object_path, output_path):
+                    return True
+                os.remove(output_path)
+            self._place(object_path, output_path)
+            return True
+        except OSError as e:
+            warning(f"从输出缓存恢复文件失败: {output_path}, {str(e)}")
+            return False
+
+    @staticmethod
+    def detach(output_path):
+        """
+        重新生成输出文件前调用：输出文件是缓存文件的硬链接时先删除，
+        避免写入新内容时同时改写缓存中的文件
+        """
+        try:
+            if os.stat(output_path).st_nlink > 1:
+                os.remove(output_path)
+        except OSError:
+            pass
+
+    def store(self, key, output_path):
+        """
+        将新生成的输出文件加入缓存，超出大小上限时淘汰最久未使用的条目
+        """
+        ext = os.path.splitext(output_path)[1]
+        file_name = f"{key}{ext}"
+        object_path = self._object_path(key, file_name)
+        try:
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            if os.path.exists(object_path):
+                os.remove(object_path)
+            self._place(output_path, object_path)
+            size = os.path.getsize(object_path)
+        except OSError as e:
+            warning(f"写入输出缓存失败: {output_path}, {str(e)}")
+            return
+
+        with self._lock:
+            if key in self.entries:
+                self.total_size -= self.entries[key]['size']
+            self.entries[key] = {'file': file_name, 'size': size, 'last_used': time.time()}
+            self.entries.move_to_end(key)
+            self.total_size += size
+            while self.total_size > self.max_size and len(self.entries) > 1:
+                self._remove_entry(next(iter(self.entries)))
+
+    def _place(self, source_path, target_path):
+        """
+        硬链接文件，不支持硬链接（如跨文件系统）时复制
+        """
+        if self.use_links:
+            try:
+                os.link(source_path, target_path)
+                return
+            except OSError:
+                pass
+        shutil.copyfile(source_path, target_path)
+
+    def _remove_entry(self, key):
+        """
+        删除缓存条目及其文件（调用方需持有锁）
+        """
+        entry = self.entries.pop(key)
+        self.total_size -= entry['size']
+        try:
+            os.remove(self._object_path(key, entry['file']))
+        except OSError:
+            pass
+
+    def clear(self):
+        """
+        清空缓存
+        """
+        with self._lock:
+            for key in list(self.entries):
+                self._remove_entry(key)
+            self.digests.clear()
+        self.save()
@@ -0,0 +1,139 @@
+import threading
+import queue
+
+
+class PipelineStage:
+    """
+    流水线阶段定义
+    func 接收上一阶段的输出并返回本阶段的输出
+    """
+
+    def __init__(self, name, func, workers=1):
+        if workers < 1:
+            raise ValueError(f"阶段 {name} 的并发数必须大于0")
+        self.name = name
+        self.func = func
+        self.workers = workers
+
+
+class StagedPipeline:
+    """
+    分阶段流式处理流水线
+
+    各阶段之间通过有界队列连接，下游处理变慢时上游会阻塞在 put 上（背压），
+    因此同时在内存中的任务数量不超过 队列容量 x 阶段数 + 工作线程总数。
+    任一阶段抛出的异常会随任务向下游传递，由结果收集方统一报告。
+    """
+
+    # 阶段结束标记
+    _SENTINEL = object()
+
+    def __init__(self, stages, queue_size=4):
+        if not stages:
+            raise ValueError("流水线至少需要一个阶段")
+        if queue_size < 1:
+            raise ValueError("队列容量必须大于0")
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(self, items, result_callback=None, error_callback=None, cancel_check=None):
+        """
+        运行流水线，阻塞直到所有任务完成或被取消
+
+        Args:
+            items: 可迭代的 (key, payload) 序列，key 用于回调时标识任务
+            result_callback: 任务成功完成时调用 result_callback(key, result)
+            error_callback: 任务失败时调用 error_callback(key, exception)
+            cancel_check: 返回 True 时停止送入新任务并丢弃未完成的任务
+
+        回调函数都在调用 run 的线程中执行。
+        """
+        cancel_check = cancel_check or (lambda: False)
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = []
+
+        for index, stage in enumerate(self.stages):
+            # 记录本阶段仍在运行的工作线程数，最后一个退出的线程负责通知下游
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for worker_index in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._stage_worker,
+                    args=(stage, queues[index], queues[index + 1],
+                          self.stages[index + 1].workers if index + 1 < len(self.stages) else 1,
+                          remaining, lock, cancel_check),
+                    name=f"pipeline-{stage.name}-{worker_index}"
+                )
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+
+        feeder = threading.Thread(
+            target=self._feed,
+            args=(items, queues[0], self.stages[0].workers, cancel_check),
+            name="pipeline-feeder"
+        )
+        feeder.daemon = True
+        feeder.start()
+        threads.append(feeder)
+
+        # 在调用线程中收集结果
+        output_queue = queues[-1]
+        while True:
+            entry = output_queue.get()
+            if entry is self._SENTINEL:
+                break
+            key, result, exc = entry
+            if cancel_check():
+                continue
+            if exc is not None:
+                if error_callback:
+                    error_callback(key, exc)
+            elif result_callback:
+                result_callback(key, result)
+
+        for thread in threads:
+            thread.join()
+
+    def _feed(self, items, output_queue, consumer_count, cancel_check):
+        """
+        将任务送入第一个阶段的队列
+        """
+        try:
+            for key, payload in items:
+                if cancel_check():
+                    break
+                output_queue.put((key, payload, None))
+        finally:
+            for _ in range(consumer_count):
+                output_queue.put(self._SENTINEL)
+
+    def _stage_worker(self, stage, input_queue, output_queue, consumer_count,
+                      remaining, lock, cancel_check):
+        """
+        阶段工作线程：从输入队列取任务，处理后放入输出队列
+        """
+        try:
+            while True:
+                entry = input_queue.get()
+                if entry is self._SENTINEL:
+                    break
+                key, payload, exc = entry
+
+                # 取消后丢弃剩余任务，只负责排空队列
+                if cancel_check():
+                    continue
+
+                if exc is None:
+                    try:
+                        payload = stage.func(payload)
+                    except Exception as e:
+                        payload, exc = None, e
+                output_queue.put((key, payload, exc))
+        finally:
+            with lock:
+                remaining[0] -= 1
+                is_last = remaining[0] == 0
+            if is_last:
+                for _ in range(consumer_count):
+                    output_queue.put(self._SENTINEL)
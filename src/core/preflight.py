@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import heapq
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from src.core.image_processor import ImageProcessor
+from src.core.strip_processor import StripProcessor
+
+
+# 按百万像素划分的尺寸区间（上限不含），最后一个区间没有上限
+SIZE_BUCKETS = ((1, '<1MP'), (4, '1-4MP'), (12, '4-12MP'), (24, '12-24MP'), (50, '24-50MP'),
+                (100, '50-100MP'), (None, '>=100MP'))
+
+# 每批扫描的文件数，避免为大量文件一次创建过多任务
+SCAN_CHUNK_SIZE = 256
+
+
+def exceeds_decoder_limit(pixels):
+    """
+    判断图片是否超过Pillow的解压炸弹阈值（MAX_IMAGE_PIXELS 的2倍），超过时无法整图解码
+    """
+    return Image.MAX_IMAGE_PIXELS is not None and pixels > 2 * Image.MAX_IMAGE_PIXELS
+
+
+def size_bucket(megapixels):
+    """
+    返回像素数所在的尺寸区间名称
+    """
+    for limit, name in SIZE_BUCKETS:
+        if limit is None or megapixels < limit:
+            return name
+
+
+class CostModel:
+    """
+    批量处理耗时模型
+
+    每张图片的耗时 = 固定开销 + 百万像素数 x（按输入格式的读取耗时 + 水印合成耗时）
+                     + 输出百万像素数 x（调整大小耗时 + 按输出格式的保存耗时）
+    默认值来自 benchmarks/run_benchmarks.py 在单核上的测量结果（秒/百万像素），
+    可以使用 from_benchmark_results 按本机的基准测试结果校准。
+    """
+
+    DEFAULT_COSTS = {
+        'load': {'JPEG': 0.011, 'PNG': 0.027, 'TIFF': 0.003, 'BMP': 0.003},
+        'save': {'JPEG': 0.007, 'PNG': 0.25, 'TIFF': 0.005},
+        'watermark': 0.001,
+        'resize': 0.02,
+        'overhead': 0.005
+    }
+    # 没有测量数据的格式使用的读取/保存耗时
+    FALLBACK_COST = 0.02
+
+    def __init__(self, costs=None):
+        self.costs = json.loads(json.dumps(self.DEFAULT_COSTS))
+        for key, value in (costs or {}).items():
+            if isinstance(value, dict):
+                self.costs.setdefault(key, {}).update(value)
+            else:
+                self.costs[key] = value
+
+    @classmethod
+    def from_benchmark_results(cls, file_path):
+        """
+        根据基准测试结果JSON校准耗时模型
+        读取/保存耗时取 load_image、save_image 各格式结果的中位数（秒/百万像素），
+        水印合成取 prepared_apply，调整大小取 resize_image；缺少的项目使用默认值
+        """
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                results = json.load(f).get('results', [])
+        except Exception as e:
+            raise Exception(f"读取基准测试结果失败: {str(e)}")
+
+        samples = {}
+        for result in results:
+            megapixels = result.get('megapixels')
+            seconds = result.get('min_seconds')
+            if not megapixels or seconds is None:
+                continue
+            name = result.get('name')
+            if name == 'load_image':
+                key = ('load', result.get('format'))
+            elif name == 'save_image':
+                key = ('save', result.get('format'))
+            elif name == 'prepared_apply':
+                key = ('watermark', None)
+            elif name == 'resize_image':
+                key = ('resize', None)
+            else:
+                continue
+            samples.setdefault(key, []).append(seconds / megapixels)
+
+        costs = {}
+        for (stage, image_format), values in samples.items():
+            value = round(statistics.median(values), 6)
+            if image_format is None:
+                costs[stage] = value
+            else:
+                costs.setdefault(stage, {})[image_format] = value
+        return cls(costs)
+
+    def image_seconds(self, image_format, megapixels, output_format='PNG', output_megapixels=None):
+        """
+        预测处理一张图片的耗时（秒），output_megapixels 不为 None 时表示需要调整大小
+        """
+        costs = self.costs
+        seconds = costs['overhead'] + megapixels * (
+            costs['load'].get(image_format, self.FALLBACK_COST) + costs['watermark'])
+        if output_megapixels is None:
+            output_megapixels = megapixels
+        else:
+            seconds += output_megapixels * costs['resize']
+        return seconds + output_megapixels * costs['save'].get(output_format.upper(), self.FALLBACK_COST)
+
+    @staticmethod
+    def wall_seconds(task_seconds, workers):
+        """
+        按从大到小的顺序把任务分配给最先空闲的工作进程，返回预测的总耗时（秒）
+        """
+        finish_times = [0.0] * max(1, workers)
+        for seconds in sorted(task_seconds, reverse=True):
+            heapq.heapreplace(finish_times, finish_times[0] + seconds)
+        return max(finish_times)
+
+
+class PreflightScanner:
+    """
+    批量任务预检
+
+    并行读取所有输入文件的文件头（不解码像素），统计格式、尺寸和总像素数，
+    找出不支持或无法读取的文件，并根据耗时模型预测指定工作进程数下的处理时间。
+    超过解压炸弹阈值的大图同样读取文件头，能分条带处理时按分条带处理预测，否则报告为过大。
+    只读取文件头，无法发现像素数据损坏（如截断）的文件。
+    """
+
+    @staticmethod
+    def scan_file(image_path):
+        """
+        读取一个文件的文件头，返回记录字典
+        status 为 'ok'、'unsupported'（扩展名不支持）或 'unreadable'（无法识别或读取）
+        """
+        record = {'path': image_path, 'status': 'ok'}
+        try:
+            record['bytes'] = os.path.getsize(image_path)
+        except OSError as e:
+            record.update(status='unreadable', error=str(e))
+            return record
+        if not ImageProcessor.is_supported_format(image_path):
+            record['status'] = 'unsupported'
+            return record
+        try:
+            header = ImageProcessor.read_header(image_path)
+            record.update(format=header['format'], mode=header['mode'],
+                          width=header['width'], height=header['height'])
+        except Exception as e:
+            record.update(status='unreadable', error=str(e))
+        return record
+
+    @staticmethod
+    def _scan_chunk(image_paths):
+        """
+        在一个线程中依次扫描一批文件
+        """
+        return [PreflightScanner.scan_file(image_path) for image_path in image_paths]
+
+    @staticmethod
+    def scan(image_paths, workers=None):
+        """
+        使用线程池并行扫描文件头，返回与输入顺序一致的记录列表
+        workers 为 None 时使用 min(32, CPU核心数 + 4) 个线程
+        """
+        image_paths = list(image_paths)
+        chunks = [image_paths[start:start + SCAN_CHUNK_SIZE]
+                  for start in range(0, len(image_paths), SCAN_CHUNK_SIZE)]
+        if len(chunks) <= 1 or workers == 1:
+            return [record for chunk in chunks for record in PreflightScanner._scan_chunk(chunk)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return [record for records in executor.map(PreflightScanner._scan_chunk, chunks)
+                    for record in records]
+
+    @staticmethod
+    def summarize(records, cost_model=None, workers=1, output_format='PNG',
+                  resize_width=None, resize_height=None, resize_percentage=None, strip_threshold=None):
+        """
+        汇总扫描记录并预测处理时间
+        返回的字典包含文件数、各格式和尺寸区间的统计、总像素数、不支持和无法读取的文件，
+        以及 prediction（单张图片耗时之和 cpu_seconds 与 workers 个工作进程下的 wall_seconds）
+
+        strip_threshold 与批量处理相同：超过该像素数且可以分条带处理的图片计入 strip_images；
+        超过解压炸弹阈值又不能分条带处理的图片无法整图解码，列入 too_large，不计入预测
+        """
+        cost_model = cost_model or CostModel()
+        resizing = bool(resize_width or resize_height or resize_percentage)
+        formats = {}
+        sizes = {name: 0 for _, name in SIZE_BUCKETS}
+        unsupported = []
+        unreadable = []
+        too_large = []
+        strip_images = 0
+        task_seconds = []
+        total_pixels = 0
+        total_bytes = 0
+        largest = None
+
+        for record in records:
+            total_bytes += record.get('bytes', 0)
+            if record['status'] == 'unsupported':
+                unsupported.append(record['path'])
+                continue
+            if record['status'] != 'ok':
+                unreadable.append({'path': record['path'], 'error': record.get('error')})
+                continue
+
+            pixels = record['width'] * record['height']
+            megapixels = pixels / 1000000
+            strip = strip_threshold is not None and pixels > strip_threshold and StripProcessor.can_process(
+                record['path'], strip_threshold, output_format, resizing)
+            if not strip and exceeds_decoder_limit(pixels):
+                too_large.append({'path': record['path'], 'megapixels': round(megapixels, 3)})
+                continue
+            if strip:
+                strip_images += 1
+            total_pixels += pixels
+            entry = formats.setdefault(record['format'], {'count': 0, 'megapixels': 0.0})
+            entry['count'] += 1
+            entry['megapixels'] += megapixels
+            sizes[size_bucket(megapixels)] += 1
+            if largest is None or pixels > largest[1]:
+                largest = (record['path'], pixels)
+
+            output_megapixels = None
+            if resizing:
+                target_size = ImageProcessor.target_size(record['width'], record['height'],
+                                                         resize_width, resize_height, resize_percentage)
+                if target_size:
+                    output_megapixels = target_size[0] * target_size[1] / 1000000
+            task_seconds.append(cost_model.image_seconds(record['format'], megapixels,
+                                                         output_format, output_megapixels))
+
+        for entry in formats.values():
+            entry['megapixels'] = round(entry['megapixels'], 3)
+
+        return {
+            'files': len(records),
+            'images': len(task_seconds),
+            'formats': formats,
+            'sizes': {name: count for name, count in sizes.items() if count},
+            'megapixels': round(total_pixels / 1000000, 3),
+            'input_megabytes': round(total_bytes / 1024 / 1024, 3),
+            'largest': {'path': largest[0], 'megapixels': round(largest[1] / 1000000, 3)} if largest else None,
+            'unsupported': unsupported,
+            'unreadable': unreadable,
+            'too_large': too_large,
+            'strip_images': strip_images,
+            'prediction': {
+                'workers': workers,
+                'output_format': output_format.upper(),
+                'cpu_seconds': round(sum(task_seconds), 3),
+                'wall_seconds': round(CostModel.wall_seconds(task_seconds, workers), 3)
+            }
+        }
+
+    @staticmethod
+    def run(image_paths, cost_model=None, workers=1, scan_workers=None, **options):
+        """
+        扫描并汇总，结果中的 scan_seconds 为扫描文件头的耗时
+        """
+        start = time.perf_counter()
+        records = PreflightScanner.scan(image_paths, scan_workers)
+        scan_seconds = time.perf_counter() - start
+        summary = PreflightScanner.summarize(records, cost_model, workers, **options)
+        summary['scan_seconds'] = round(scan_seconds, 3)
+        return summary
@@ -0,0 +1,595 @@
+import io
+import os
+import time
+import zlib
+import struct
+import numpy as np
+from PIL import Image, TiffImagePlugin, TiffTags
+from src.core.image_processor import ImageProcessor
+from src.utils.logger import info, warning
+from src.utils.tracing import span
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+TIFF_SIGNATURES = (b'II*\x00', b'MM\x00*', b'II+\x00', b'MM\x00+')
+
+# 每个条带解码后（按RGBA计算）的目标字节数，条带行数 = 该值 / (宽度 * 4)
+STRIP_BYTES = 16 * 1024 * 1024
+
+
+def strip_rows(width, strip_bytes=STRIP_BYTES):
+    """
+    计算指定宽度的图片每个条带的行数
+    """
+    return max(1, strip_bytes // (width * 4))
+
+
+def open_strip_reader(file_path):
+    """
+    根据文件头打开条带读取器，不是PNG/TIFF文件时返回 None
+    只读取文件头，不解码像素
+    """
+    with open(file_path, 'rb') as f:
+        header = f.read(8)
+    if header == PNG_SIGNATURE:
+        return PNGStripReader(file_path)
+    if header[:4] in TIFF_SIGNATURES:
+        return TIFFStripReader(file_path)
+    return None
+
+
+class PNGStripReader:
+    """
+    按条带读取PNG图片
+
+    逐块解压IDAT数据，每凑齐一个条带的（已滤波的）行就构造一个只包含这些行的
+    小PNG交给Pillow解码。PNG的行滤波会引用上一行，因此在条带数据前补上前一个条带
+    最后一行的原始像素（滤波类型为 None），解码后再去掉这一行。
+
+    只支持8位、非隔行扫描的PNG（灰度、RGB、调色板、灰度+透明、RGBA）。
+    """
+
+    CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.ancillary = []
+        with open(file_path, 'rb') as f:
+            if f.read(8) != PNG_SIGNATURE:
+                raise ValueError("不是PNG文件")
+            chunk_type, data = self._read_chunk(f)
+            if chunk_type != b'IHDR':
+                raise ValueError("PNG文件缺少IHDR")
+            (width, height, self.bit_depth, self.color_type,
+             _, _, self.interlace) = struct.unpack('>IIBBBBB', data)
+            self.size = (width, height)
+            # 保留解码需要的调色板和透明信息
+            while True:
+                chunk_type, data = self._read_chunk(f)
+                if chunk_type == b'IDAT':
+                    break
+                if chunk_type == b'IEND':
+                    raise ValueError("PNG文件缺少IDAT")
+                if chunk_type in (b'PLTE', b'tRNS'):
+                    self.ancillary.append((chunk_type, data))
+
+    def check(self, rows_per_band=None):
+        """
+        检查是否支持分条带读取，不支持时抛出 ValueError
+        """
+        if self.bit_depth != 8 or self.color_type not in self.CHANNELS:
+            raise ValueError(f"不支持的PNG位深度或颜色类型: {self.bit_depth}/{self.color_type}")
+        if self.interlace:
+            raise ValueError("不支持隔行扫描的PNG")
+
+    @staticmethod
+    def _read_chunk(f):
+        header = f.read(8)
+        if len(header) < 8:
+            raise ValueError("PNG文件不完整")
+        length, chunk_type = struct.unpack('>I4s', header)
+        data = f.read(length)
+        f.read(4)
+        if len(data) < length:
+            raise ValueError("PNG文件不完整")
+        return chunk_type, data
+
+    def _idat_chunks(self, f):
+        """
+        依次返回所有IDAT块的数据（IDAT块在文件中必须连续）
+        """
+        f.seek(8)
+        in_idat = False
+        while True:
+            chunk_type, data = self._read_chunk(f)
+            if chunk_type == b'IDAT':
+                in_idat = True
+                yield data
+            elif in_idat or chunk_type == b'IEND':
+                return
+
+    def bands(self, rows_per_band):
+        """
+        依次返回 (起始行, 条带图片)
+        """
+        self.check()
+        width, height = self.size
+        stride = 1 + width * self.CHANNELS[self.color_type]
+        band_bytes = stride * rows_per_band
+        decompressor = zlib.decompressobj()
+        buffer = bytearray()
+        top = 0
+        previous_row = None
+
+        with open(self.file_path, 'rb') as f:
+            for data in self._idat_chunks(f):
+                while data:
+                    # 限制每次解压的输出大小，高压缩率的数据也不会一次展开到内存
+                    buffer += decompressor.decompress(data, band_bytes)
+                    data = decompressor.unconsumed_tail
+                    while len(buffer) >= band_bytes and top < height:
+                        rows = min(rows_per_band, height - top)
+                        band, previous_row = self._decode_band(buffer, rows, previous_row)
+                        del buffer[:rows * stride]
+                        yield top, band
+                        top += rows
+            buffer += decompressor.flush()
+
+        while top < height:
+            rows = min(rows_per_band, height - top)
+            if len(buffer) < rows * stride:
+                raise ValueError("PNG图片数据不完整")
+            band, previous_row = self._decode_band(buffer, rows, previous_row)
+            del buffer[:rows * stride]
+            yield top, band
+            top += rows
+
+    def _decode_band(self, buffer, rows, previous_row):
+        """
+        将 buffer 开头一个条带的已滤波行构造为小PNG并解码，返回 (条带图片, 最后一行的原始像素)
+        """
+        width = self.size[0]
+        stride = 1 + width * self.CHANNELS[self.color_type]
+        # 不压缩的zlib流，直接引用缓冲区，避免多次复制条带数据
+        compressor = zlib.compressobj(0)
+        pieces = []
+        if previous_row is not None:
+            pieces.append(compressor.compress(b'\x00' + previous_row))
+        with memoryview(buffer)[:rows * stride] as filtered:
+            pieces.append(compressor.compress(filtered))
+        pieces.append(compressor.flush())
+        total_rows = rows + (previous_row is not None)
+
+        crc = zlib.crc32(b'IDAT')
+        for piece in pieces:
+            crc = zlib.crc32(piece, crc)
+        ihdr = struct.pack('>IIBBBBB', width, total_rows, 8, self.color_type, 0, 0, 0)
+        data = b''.join([PNG_SIGNATURE, _chunk(b'IHDR', ihdr)]
+                        + [_chunk(chunk_type, chunk_data) for chunk_type, chunk_data in self.ancillary]
+                        + [struct.pack('>I4s', sum(len(piece) for piece in pieces), b'IDAT')] + pieces
+                        + [struct.pack('>I', crc & 0xffffffff), _chunk(b'IEND', b'')])
+        del pieces
+
+        band = Image.open(io.BytesIO(data))
+        band.load()
+        last_row = band.crop((0, total_rows - 1, width, total_rows)).tobytes()
+        if previous_row is not None:
+            band = band.crop((0, 1, width, total_rows))
+        return band, last_row
+
+
+class TIFFStripReader:
+    """
+    按条带读取TIFF图片
+
+    按文件中的条带（strip）或分块（tile）边界划分条带，把对应的压缩数据原样取出，
+    与原文件的图片标签一起构造一个只包含这些行的小TIFF交给Pillow解码，
+    因此支持Pillow能解码的所有压缩方式和预测器。
+    未压缩的8位图片可以按行读取，不受原文件条带大小的限制。
+
+    只读取第一页；不支持分平面存储（PlanarConfiguration=2）和旧式JPEG压缩。
+    """
+
+    # 构造小TIFF时复制的标签
+    COPIED_TAGS = (258, 259, 262, 266, 277, 284, 317, 320, 322, 323, 338, 339, 347, 529, 530, 532)
+    STRIP_OFFSETS, STRIP_BYTE_COUNTS, ROWS_PER_STRIP = 273, 279, 278
+    TILE_WIDTH, TILE_LENGTH, TILE_OFFSETS, TILE_BYTE_COUNTS = 322, 323, 324, 325
+    # 原始条带不能超过条带预算的倍数，否则无法限制内存
+    MAX_UNIT_FACTOR = 4
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, 'rb') as f:
+            # 直接使用TIFF插件读取文件头：Image.open 会拒绝超过解压炸弹阈值的大图，
+            # 而分条带处理的内存与图片尺寸无关
+            image = TiffImagePlugin.TiffImageFile(f)
+            self.size = image.size
+            self.mode = image.mode
+            self.prefix = image.tag_v2.prefix
+            self.tags = {tag: (image.tag_v2[tag], image.tag_v2.tagtype.get(tag))
+                         for tag in image.tag_v2.keys()}
+
+    def _tag(self, tag, default=None):
+        return self.tags[tag][0] if tag in self.tags else default
+
+    def check(self, rows_per_band=None):
+        """
+        检查是否支持分条带读取，不支持时抛出 ValueError
+        """
+        if self._tag(284, 1) != 1:
+            raise ValueError("不支持分平面存储的TIFF")
+        if self._tag(259, 1) == 6:
+            raise ValueError("不支持旧式JPEG压缩的TIFF")
+        if self.TILE_OFFSETS not in self.tags and self.STRIP_OFFSETS not in self.tags:
+            raise ValueError("TIFF文件缺少条带或分块信息")
+        if rows_per_band is not None and not self._row_addressable():
+            unit_rows = self._unit_rows()
+            if unit_rows > rows_per_band * self.MAX_UNIT_FACTOR:
+                raise ValueError(f"TIFF条带过大（{unit_rows} 行），无法分条带读取")
+
+    def _tiled(self):
+        return self.TILE_OFFSETS in self.tags
+
+    def _row_addressable(self):
+        """
+        未压缩的8位条带图片可以直接按行定位
+        """
+        bits = self._tag(258, (1,))
+        bits = bits if isinstance(bits, tuple) else (bits,)
+        return not self._tiled() and self._tag(259, 1) == 1 and all(value == 8 for value in bits)
+
+    def _unit_rows(self):
+        if self._tiled():
+            return self._tag(self.TILE_LENGTH)
+        return min(self._tag(self.ROWS_PER_STRIP, self.size[1]), self.size[1])
+
+    def bands(self, rows_per_band):
+        """
+        依次返回 (起始行, 条带图片)
+        """
+        self.check(rows_per_band)
+        width, height = self.size
+        offsets = self._tag(self.TILE_OFFSETS if self._tiled() else self.STRIP_OFFSETS)
+        byte_counts = self._tag(self.TILE_BYTE_COUNTS if self._tiled() else self.STRIP_BYTE_COUNTS)
+        offsets = offsets if isinstance(offsets, tuple) else (offsets,)
+        byte_counts = byte_counts if isinstance(byte_counts, tuple) else (byte_counts,)
+
+        with open(self.file_path, 'rb') as f:
+            if self._row_addressable():
+                strip_rows_count = self._unit_rows()
+                row_bytes = width * self._tag(277, 1)
+                for top in range(0, height, rows_per_band):
+                    rows = min(rows_per_band, height - top)
+                    data = bytearray()
+                    row = top
+                    while row < top + rows:
+                        # 同一原始条带内的连续行一次读取
+                        strip, row_in_strip = divmod(row, strip_rows_count)
+                        count = min(top + rows - row, strip_rows_count - row_in_strip)
+                        f.seek(offsets[strip] + row_in_strip * row_bytes)
+                        data += f.read(count * row_bytes)
+                        row += count
+                    yield top, self._decode_band(bytes(data), rows, [(0, len(data))], rows)
+                return
+
+            unit_rows = self._unit_rows()
+            units_across = -(-width // self._tag(self.TILE_WIDTH)) if self._tiled() else 1
+            # 条带行数取原始条带行数的整数倍
+            units_per_band = max(1, rows_per_band // unit_rows)
+            for first_unit_row in range(0, -(-height // unit_rows), units_per_band):
+                top = first_unit_row * unit_rows
+                rows = min(units_per_band * unit_rows, height - top)
+                data = bytearray()
+                units = []
+                first = first_unit_row * units_across
+                last = min(first + units_per_band * units_across, len(offsets))
+                for index in range(first, last):
+                    f.seek(offsets[index])
+                    units.append((len(data), byte_counts[index]))
+                    data += f.read(byte_counts[index])
+                yield top, self._decode_band(bytes(data), rows, units, unit_rows)
+
+    def _decode_band(self, data, rows, units, unit_rows):
+        """
+        用原始标签和条带数据构造小TIFF并解码
+        units 为各条带/分块在 data 中的 (偏移, 字节数)
+        """
+        endian = '<' if self.prefix == b'II' else '>'
+        ifd = TiffImagePlugin.ImageFileDirectory_v2(prefix=self.prefix)
+        ifd[256] = self.size[0]
+        ifd.tagtype[256] = TiffTags.LONG
+        ifd[257] = rows
+        ifd.tagtype[257] = TiffTags.LONG
+        for tag in self.COPIED_TAGS:
+            if tag in self.tags:
+                value, tag_type = self.tags[tag]
+                ifd[tag] = value
+                if tag_type is not None:
+                    ifd.tagtype[tag] = tag_type
+        offsets = tuple(offset for offset, _ in units)
+        counts = tuple(count for _, count in units)
+        if self._tiled():
+            ifd[self.TILE_OFFSETS] = offsets
+            ifd[self.TILE_BYTE_COUNTS] = counts
+            tags = (self.TILE_OFFSETS, self.TILE_BYTE_COUNTS)
+        else:
+            ifd[self.ROWS_PER_STRIP] = unit_rows
+            ifd[self.STRIP_OFFSETS] = offsets
+            ifd[self.STRIP_BYTE_COUNTS] = counts
+            tags = (self.ROWS_PER_STRIP, self.STRIP_OFFSETS, self.STRIP_BYTE_COUNTS)
+        for tag in tags:
+            ifd.tagtype[tag] = TiffTags.LONG
+
+        # 文件布局：文件头（8字节） + IFD + 像素数据
+        # Pillow 写出IFD时会把条带偏移加上IFD的结束位置，分块偏移需要自行换算为绝对位置
+        ifd_bytes = ifd.tobytes(8)
+        if self._tiled():
+            ifd[self.TILE_OFFSETS] = tuple(8 + len(ifd_bytes) + offset for offset in offsets)
+            ifd.tagtype[self.TILE_OFFSETS] = TiffTags.LONG
+            ifd_bytes = ifd.tobytes(8)
+
+        buffer = io.BytesIO()
+        buffer.write(self.prefix + struct.pack(endian + 'HI', 42, 8))
+        buffer.write(ifd_bytes)
+        buffer.write(data)
+        buffer.seek(0)
+
+        band = Image.open(buffer)
+        band.load()
+        return band
+
+
+class PNGStripWriter:
+    """
+    按条带写出PNG图片
+
+    每个条带先由Pillow的PNG编码器以不压缩的方式完成自适应行滤波，
+    取出滤波后的行数据送入整幅图片共用的zlib压缩流，压缩后的数据积累到一定大小
+    就写出一个IDAT块，内存占用只与条带大小有关。
+    先写入临时文件，全部行写完后再替换为目标文件。
+    """
+
+    COLOR_TYPES = {'L': 0, 'LA': 4, 'RGB': 2, 'RGBA': 6}
+    # 单个IDAT块的大小
+    IDAT_SIZE = 1024 * 1024
+
+    def __init__(self, file_path, size, mode, compress_level=6):
+        if mode not in self.COLOR_TYPES:
+            raise ValueError(f"分条带写出不支持的图片模式: {mode}")
+        self.file_path = file_path
+        self.size = tuple(size)
+        self.mode = mode
+        self.channels = len(mode)
+        self.rows_written = 0
+        self._previous_row = np.zeros(self.size[0] * self.channels, dtype=np.uint8)
+        self._compressor = zlib.compressobj(compress_level)
+        self._pending = bytearray()
+        self._temp_path = file_path + '.part'
+        self._file = open(self._temp_path, 'wb')
+        self._file.write(PNG_SIGNATURE)
+        self._file.write(_chunk(b'IHDR', struct.pack('>IIBBBBB', self.size[0], self.size[1], 8,
+                                                    self.COLOR_TYPES[mode], 0, 0, 0)))
+
+    def write(self, band):
+        """
+        写入紧接着上一个条带的若干整行
+        """
+        if band.mode != self.mode or band.width != self.size[0]:
+            raise ValueError(f"条带 {band.mode} {band.width} 与输出图片 {self.mode} {self.size[0]} 不一致")
+        if self.rows_written + band.height > self.size[1]:
+            raise ValueError("写入的行数超过图片高度")
+
+        # 由Pillow的PNG编码器（不压缩）完成自适应行滤波，再取出滤波后的行数据
+        encoded = io.BytesIO()
+        band.save(encoded, format='PNG', compress_level=0)
+        filtered = bytearray()
+        decompressor = zlib.decompressobj()
+        for chunk_type, data in _iter_chunks(encoded.getbuffer()):
+            if chunk_type == b'IDAT':
+                filtered += decompressor.decompress(data)
+        del encoded
+        if len(filtered) != band.height * (band.width * self.channels + 1):
+            raise ValueError("PNG编码器输出的行数据长度不正确")
+
+        # 条带第一行的滤波以全零行为上一行，按实际的上一行重新滤波
+        rows = np.asarray(band.crop((0, 0, band.width, 1)), dtype=np.uint8).reshape(1, -1)
+        filtered[:rows.shape[1] + 1] = self._filter(rows, self._previous_row, self.channels)
+        self._previous_row = np.asarray(band.crop((0, band.height - 1, band.width, band.height)),
+                                        dtype=np.uint8).reshape(-1)
+
+        self._pending += self._compressor.compress(filtered)
+        del filtered
+        while len(self._pending) >= self.IDAT_SIZE:
+            self._file.write(_chunk(b'IDAT', bytes(self._pending[:self.IDAT_SIZE])))
+            del self._pending[:self.IDAT_SIZE]
+        self.rows_written += band.height
+
+    @staticmethod
+    def _filter(rows, previous_row, bpp):
+        """
+        对若干行做自适应滤波（选择 None/Sub/Up/Average/Paeth 中有符号字节绝对值和最小的一种），
+        返回带滤波类型字节的行数据
+        """
+        count = rows.shape[0]
+        up = np.empty_like(rows)
+        up[0] = previous_row
+        up[1:] = rows[:-1]
+        left = np.zeros_like(rows)
+        left[:, bpp:] = rows[:, :-bpp]
+        up_left = np.zeros_like(rows)
+        up_left[:, bpp:] = up[:, :-bpp]
+
+        candidates = np.empty((5,) + rows.shape, dtype=np.uint8)
+        candidates[0] = rows
+        np.subtract(rows, left, out=candidates[1])
+        np.subtract(rows, up, out=candidates[2])
+        # (a + b) >> 1 的无溢出写法
+        np.subtract(rows, (left & up) + ((left ^ up) >> 1), out=candidates[3])
+
+        # Paeth：p = a + b - c，|p - a| = |b - c|，|p - b| = |a - c|，|p - c| = |(a - c) + (b - c)|
+        a = left.astype(np.int16)
+        b = up.astype(np.int16)
+        c = up_left.astype(np.int16)
+        pa = b - c
+        pb = a - c
+        pc = pa + pb
+        np.abs(pa, out=pa)
+        np.abs(pb, out=pb)
+        np.abs(pc, out=pc)
+        predictor = np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, up_left))
+        np.subtract(rows, predictor, out=candidates[4])
+
+        # 按有符号字节的绝对值和选择每行的滤波（int8 的 abs(-128) 按无符号解释正好是128）
+        scores = np.abs(candidates.view(np.int8)).view(np.uint8).sum(axis=2, dtype=np.uint32)
+        choice = scores.argmin(axis=0)
+        output = np.empty((count, rows.shape[1] + 1), dtype=np.uint8)
+        output[:, 0] = choice
+        output[:, 1:] = candidates[choice, np.arange(count)]
+        return output.tobytes()
+
+    def close(self):
+        """
+        写出剩余数据和IEND，替换为目标文件
+        """
+        if self.rows_written != self.size[1]:
+            raise ValueError(f"只写入了 {self.rows_written}/{self.size[1]} 行")
+        self._pending += self._compressor.flush()
+        if self._pending:
+            self._file.write(_chunk(b'IDAT', bytes(self._pending)))
+        self._file.write(_chunk(b'IEND', b''))
+        self._file.close()
+        os.replace(self._temp_path, self.file_path)
+
+    def abort(self):
+        """
+        放弃写出，删除临时文件
+        """
+        self._file.close()
+        try:
+            os.remove(self._temp_path)
+        except OSError:
+            pass
+
+
+def _iter_chunks(data):
+    """
+    依次返回PNG数据中各数据块的 (类型, 数据)
+    """
+    position = len(PNG_SIGNATURE)
+    while position + 8 <= len(data):
+        length, chunk_type = struct.unpack_from('>I4s', data, position)
+        yield chunk_type, data[position + 8:position + 8 + length]
+        position += 12 + length
+
+
+def _chunk(chunk_type, data):
+    """
+    生成一个PNG数据块：长度 + 类型 + 数据 + CRC
+    """
+    return b''.join([struct.pack('>I', len(data)), chunk_type, data,
+                     struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff)])
+
+
+class StripProcessor:
+    """
+    大图分条带处理（内存受限模式）
+
+    超过像素阈值的PNG/TIFF图片不再整图解码：按条带读取、只在水印覆盖的条带上合成水印、
+    逐条带压缩写出PNG，峰值内存只与条带大小（STRIP_BYTES）有关，与图片尺寸无关。
+    输出像素与整图处理完全一致。
+
+    需要调整大小或输出为JPEG时无法逐条带完成（Pillow的JPEG编码器只能一次编码整张图片），
+    这些图片仍按整图处理。
+    """
+
+    OUTPUT_FORMATS = ('PNG',)
+
+    @staticmethod
+    def can_process(image_path, pixel_threshold, output_format, resizing=False):
+        """
+        判断图片是否应该分条带处理：像素数超过阈值，且读取和输出格式都支持分条带
+        超过阈值但无法分条带处理时记录警告
+        """
+        try:
+            reader = open_strip_reader(image_path)
+        except Exception:
+            # 无法读取文件头，留给整图处理报告错误
+            return False
+        if reader is None or reader.size[0] * reader.size[1] <= pixel_threshold:
+            return False
+
+        reason = None
+        if output_format.upper() not in StripProcessor.OUTPUT_FORMATS:
+            reason = f"输出格式 {output_format} 不支持分条带写出"
+        elif resizing:
+            reason = "调整大小需要整幅图片"
+        else:
+            try:
+                reader.check(strip_rows(reader.size[0]))
+            except ValueError as e:
+                reason = str(e)
+        if reason:
+            warning(f"图片超过分条带处理阈值，但{reason}，使用整图处理: {image_path}")
+            return False
+        return True
+
+    @staticmethod
+    def process(image_path, output_path, watermark, keep_native_mode=False,
+                strip_bytes=STRIP_BYTES, compress_level=6, timings=None):
+        """
+        分条带处理一张图片并写出PNG
+        timings 不为 None 时填入读取、合成、保存的累计耗时（秒）、输入/输出字节数和像素数
+        """
+        try:
+            info(f"分条带处理图片: {image_path}")
+            reader = open_strip_reader(image_path)
+            if reader is None:
+                raise ValueError(f"不支持分条带读取的图片格式: {image_path}")
+            watermark = watermark.prepare()
+            width, height = reader.size
+            rows_per_band = strip_rows(width, strip_bytes)
+            elapsed = {'load': 0.0, 'watermark': 0.0, 'save': 0.0}
+
+            writer = None
+            try:
+                bands = reader.bands(rows_per_band)
+                while True:
+                    start = time.perf_counter()
+                    with span('load_strip', 'io'):
+                        item = next(bands, None)
+                        if item is None:
+                            break
+                        top, band = item
+                        band = ImageProcessor._convert_loaded(band, keep_native_mode)
+                    elapsed['load'] += time.perf_counter() - start
+
+                    start = time.perf_counter()
+                    with span('watermark_strip'):
+                        watermark.apply_to_band(band, (width, height), top)
+                    elapsed['watermark'] += time.perf_counter() - start
+
+                    start = time.perf_counter()
+                    with span('save_strip', 'io'):
+                        if writer is None:
+                            writer = PNGStripWriter(output_path, (width, height), band.mode, compress_level)
+                        writer.write(band)
+                    elapsed['save'] += time.perf_counter() - start
+
+                start = time.perf_counter()
+                if writer is None:
+                    raise ValueError("图片没有像素数据")
+                writer.close()
+                elapsed['save'] += time.perf_counter() - start
+            except BaseException:
+                if writer is not None:
+                    writer.abort()
+                raise
+
+            if timings is not None:
+                timings.update(elapsed)
+                timings['input_bytes'] = os.path.getsize(image_path)
+                timings['output_bytes'] = os.path.getsize(output_path)
+                timings['pixels'] = width * height
+            info(f"分条带处理完成: {output_path}, {-(-height // rows_per_band)} 个条带")
+            return output_path
+        except Exception as e:
+            raise Exception(f"分条带处理图片失败: {str(e)}")
@@ -1,18 +1,33 @@
 import os
+import threading
+from collections import OrderedDict
 from PIL import Image, ImageDraw, ImageFont
 import io
 from .image_processor import ImageProcessor
+from . import compositor
 import json
+import hashlib
 import os
 
 from src.utils.font_manager import font_manager
 from src.utils.logger import info, warning, error
+from src.utils.tracing import traced
 
 class Watermark:
     """
     水印处理类，提供文本水印和图片水印的添加功能
     """
     
+    # 文本水印分阶段渲染的缓存（LRU）：字形栅格 → 样式图层 → 旋转。
+    # 每个阶段的键只包含该阶段及其上游的参数，修改颜色、透明度或样式时复用已栅格化的字形，
+    # 只修改位置时图层本身直接复用（位置在合成时计算）。缓存的图层在多次调用之间共享，调用方不应修改它。
+    TEXT_STAGE_CACHE_SIZE = 16
+    _text_stage_caches = {
+        'glyph': OrderedDict(),
+        'styled': OrderedDict(),
+        'rotated': OrderedDict()
+    }
+    
     def __init__(self):
         # 默认水印配置
         self.watermark_type = 'text'  # 'text' 或 'image'
@@ -27,6 +42,9 @@ class Watermark:
         self.scale = 1.0  # 图片水印缩放比例
         self.has_shadow = False  # 是否添加阴影
         self.has_stroke = False  # 是否添加描边
+        self.tiled = False  # 是否平铺水印
+        self.tile_spacing = 50  # 平铺间距
+        self.relative_size = None  # 水印宽度占图片宽度的比例，None 表示使用固定尺寸
         
     def set_text_watermark(self, text, font_name=None, font_size=24, 
                           font_color=(255, 255, 255, 128), opacity=50):
@@ -77,68 +95,85 @@ class Watermark:
         self.has_shadow = has_shadow
         self.has_stroke = has_stroke
     
-    def apply_watermark(self, image):
+    def set_tiling(self, tiled=True, spacing=50):
+        """
+        设置水印平铺
+        平铺时水印从左上角开始按 水印尺寸 + 间距 的步长铺满整张图片，忽略位置设置
+        """
+        self.tiled = tiled
+        self.tile_spacing = spacing
+    
+    def set_relative_size(self, relative_size=None):
+        """
+        设置水印相对图片的尺寸
+        relative_size 为水印宽度占图片宽度的比例（0-1），水印按比例缩放；None 表示使用固定尺寸
+        """
+        if relative_size is not None and not 0 < relative_size <= 1:
+            raise ValueError(f"水印相对尺寸必须在0到1之间: {relative_size}")
+        self.relative_size = relative_size
+    
+    @traced('Watermark.apply_watermark')
+    def apply_watermark(self, image, in_place=False, source_size=None, parallel_threshold=None):
         """
         应用水印到图片
+        in_place 为 True 时使用区域合成模式：直接在原图（RGB/RGBA）上合成水印覆盖的区域，
+        不复制整张图片，原图会被修改
+        source_size 为图片缩放前的原始尺寸（按输出尺寸加载的图片），水印按原图计算后再等比缩放
+        需要合成的像素数达到 parallel_threshold 时分条带并行合成（结果不变）
         """
-        if self.watermark_type == 'text':
-            return self._apply_text_watermark(image)
+        if source_size and tuple(source_size) != image.size:
+            return self._apply_scaled(image, tuple(source_size), in_place, parallel_threshold)
+        
+        if self.tiled:
+            watermark_image = image if in_place else image.copy()
+            return ImageProcessor._apply_tiled_layer(
+                watermark_image, None, self.tile_spacing, lambda: self.render_layer(image.size),
+                parallel_threshold, self.layer_opacity)
+        
+        if in_place:
+            layer = self.render_layer(image.size)
+            position = self._calculate_position(image.width, image.height, layer.width, layer.height)
+            return ImageProcessor.composite_region(image, layer, position, parallel_threshold, self.layer_opacity)
+        
+        # 按比例缩放的图片水印与文本水印一样，先渲染图层再粘贴
+        if self.watermark_type == 'text' or (self.watermark_type == 'image' and self.relative_size):
+            return self._apply_text_watermark(image, parallel_threshold)
         elif self.watermark_type == 'image':
             return self._apply_image_watermark(image)
         else:
             raise ValueError(f"不支持的水印类型: {self.watermark_type}")
     
-    def _apply_text_watermark(self, image):
+    def _apply_scaled(self, image, source_size, in_place=False, parallel_threshold=None):
+        """
+        在已缩放的图片上添加与原图效果一致的水印
+        """
+        layer, position, spacing = self._output_placement(self.render_layer(source_size), source_size, image.size)
+        watermark_image = image if in_place else image.copy()
+        if self.tiled:
+            return ImageProcessor._apply_tiled_layer(watermark_image, None, spacing, lambda: layer,
+                                                     parallel_threshold, self.layer_opacity)
+        return ImageProcessor.paste_layer(watermark_image, layer, position, parallel_threshold, self.layer_opacity)
+    
+    def _output_placement(self, layer, source_size, image_size):
+        """
+        将按原图尺寸 source_size 渲染的图层、位置和平铺间距缩放到输出尺寸 image_size
+        返回 (缩放后的图层, 位置, 平铺间距)
+        """
+        scale_x = image_size[0] / source_size[0]
+        scale_y = image_size[1] / source_size[1]
+        pos_x, pos_y = self._calculate_position(source_size[0], source_size[1], layer.width, layer.height)
+        layer, spacing = ImageProcessor.scale_tiled_layer(layer, self.tile_spacing, source_size, image_size)
+        return layer, (round(pos_x * scale_x), round(pos_y * scale_y)), spacing
+    
+    def _apply_text_watermark(self, image, parallel_threshold=None):
         """
         应用文本水印
         """
         # 创建一个可绘制的副本
         watermark_image = image.copy()
-        draw = ImageDraw.Draw(watermark_image, 'RGBA')
-        
-        # 加载字体
-        font = font_manager.load_font(self.font_name, self.font_size)
-        
-        if font is None:
-            warning("无法加载任何字体，使用默认字体")
-            font = ImageFont.load_default()
-        
-        # 获取文本尺寸
-        text_width, text_height = self._get_text_size(draw, self.text, font)
-        
-        # 创建文本图像
-        text_img = Image.new('RGBA', (text_width + 20, text_height + 20), (255, 255, 255, 0))
-        text_draw = ImageDraw.Draw(text_img)
-        
-        # 计算文本在图像中的位置
-        text_x, text_y = 10, 10
-        
-        # 如果需要添加阴影或描边
-        if self.has_stroke:
-            # 添加描边
-            stroke_width = 2
-            stroke_color = (0, 0, 0, self.font_color[3] // 2)  # 半透明黑色
-            text_draw.text((text_x - stroke_width, text_y), self.text, font=font, fill=stroke_color)
-            text_draw.text((text_x + stroke_width, text_y), self.text, font=font, fill=stroke_color)
-            text_draw.text((text_x, text_y - stroke_width), self.text, font=font, fill=stroke_color)
-            text_draw.text((text_x, text_y + stroke_width), self.text, font=font, fill=stroke_color)
-            text_draw.text((text_x - stroke_width, text_y - stroke_width), self.text, font=font, fill=stroke_color)
-            text_draw.text((text_x + stroke_width, text_y - stroke_width), self.text, font=font, fill=stroke_color)
-            text_draw.text((text_x - stroke_width, text_y + stroke_width), self.text, font=font, fill=stroke_color)
-            text_draw.text((text_x + stroke_width, text_y + stroke_width), self.text, font=font, fill=stroke_color)
-        
-        if self.has_shadow:
-            # 添加阴影
-            shadow_offset = 2
-            shadow_color = (0, 0, 0, self.font_color[3] // 2)  # 半透明黑色
-            text_draw.text((text_x + shadow_offset, text_y + shadow_offset), self.text, font=font, fill=shadow_color)
         
-        # 添加主文本
-        text_draw.text((text_x, text_y), self.text, font=font, fill=self.font_color)
-        
-        # 旋转文本
-        if self.rotation != 0:
-            text_img = text_img.rotate(self.rotation, expand=True, resample=Image.BICUBIC)
+        # 渲染水印图层
+        text_img = self.render_layer(watermark_image.size)
         
         # 计算最终位置
         img_width, img_height = watermark_image.size
@@ -147,9 +182,8 @@ class Watermark:
         pos_x, pos_y = self._calculate_position(img_width, img_height, wm_width, wm_height)
         
         # 粘贴水印
-        watermark_image.paste(text_img, (pos_x, pos_y), text_img)
-        
-        return watermark_image
+        return ImageProcessor.paste_layer(watermark_image, text_img, (pos_x, pos_y), parallel_threshold,
+                                          self.layer_opacity)
     
     def _apply_image_watermark(self, image):
         """
@@ -165,6 +199,151 @@ class Watermark:
             self.rotation
         )
     
+    @property
+    def layer_opacity(self):
+        """
+        合成 render_layer 图层时使用的透明度（0-100）
+        图片水印的透明度不在图层中，合成时与混合一起完成；文本水印的透明度已在字体颜色的alpha中
+        """
+        return self.opacity if self.watermark_type == 'image' else 100
+    
+    def render_layer(self, image_size=None):
+        """
+        渲染水印图层（已完成描边、阴影和旋转处理的RGBA图像），合成时使用 layer_opacity 的透明度
+        未设置相对尺寸时图层与目标图片无关，同一配置可以在多张图片之间复用；
+        设置了相对尺寸时需要传入目标图片尺寸 image_size，图层按图片宽度缩放
+        """
+        if self.watermark_type == 'text':
+            layer = self._render_text_layer()
+        elif self.watermark_type == 'image':
+            layer = ImageProcessor.prepare_image_watermark(self.watermark_path, self.scale, self.rotation)
+        else:
+            raise ValueError(f"不支持的水印类型: {self.watermark_type}")
+        
+        if self.relative_size and image_size:
+            layer = self._scale_layer(layer, image_size[0])
+        return layer
+    
+    def _scale_layer(self, layer, img_width):
+        """
+        将水印图层按相对尺寸缩放到目标图片宽度
+        """
+        wm_width = max(1, round(img_width * self.relative_size))
+        wm_height = max(1, round(layer.height * wm_width / layer.width))
+        if (wm_width, wm_height) == layer.size:
+            return layer
+        return layer.resize((wm_width, wm_height), Image.LANCZOS)
+    
+    def _render_text_layer(self):
+        """
+        渲染文本水印图层
+        按阶段渲染并缓存，处理顺序与直接绘制相同：带透明度绘制文本、描边和阴影，然后旋转
+        """
+        # 没有alpha通道的颜色按不透明处理
+        fill = tuple(self.font_color[:3]) + (self.font_color[3] if len(self.font_color) > 3 else 255,)
+        glyph_key = (self.text, self.font_name, self.font_size)
+        styled_key = glyph_key + (fill, self.has_shadow, self.has_stroke)
+        rotated_key = styled_key + (self.rotation,)
+        
+        layer = ImageProcessor._cache_get(self._text_stage_caches['rotated'], rotated_key)
+        if layer is not None:
+            return layer
+        
+        return self._text_stage('rotated', rotated_key, lambda: self._rotate_text_layer(
+            self._text_stage('styled', styled_key, lambda: self._draw_text_layer(
+                self._text_stage('glyph', glyph_key, lambda: self._rasterize_text(*glyph_key)),
+                *styled_key[3:])),
+            self.rotation))
+    
+    def _text_stage(self, stage, key, render):
+        """
+        读取文本渲染阶段的缓存，未命中时调用 render 生成并缓存
+        """
+        cache = self._text_stage_caches[stage]
+        value = ImageProcessor._cache_get(cache, key)
+        if value is None:
+            value = render()
+            ImageProcessor._cache_put(cache, key, value, self.TEXT_STAGE_CACHE_SIZE)
+        return value
+    
+    @staticmethod
+    def clear_text_cache():
+        """
+        清除文本水印分阶段渲染的缓存
+        """
+        with ImageProcessor._watermark_cache_lock:
+            for cache in Watermark._text_stage_caches.values():
+                cache.clear()
+    
+    def _measure_text(self, text, font_name, font_size):
+        """
+        加载字体并测量文本尺寸，返回 (字体, 文本, 文本宽度, 文本高度)
+        """
+        # 加载字体
+        font = font_manager.load_font(font_name, font_size)
+        
+        if font is None:
+            warning("无法加载任何字体，使用默认字体")
+            font = ImageFont.load_default()
+        
+        # 获取文本尺寸
+        draw = ImageDraw.Draw(Image.new('RGBA', (1, 1)), 'RGBA')
+        text_width, text_height = self._get_text_size(draw, text, font)
+        return font, text, text_width, text_height
+    
+    def _rasterize_text(self, text, font_name, font_size):
+        """
+        字形阶段：将文本栅格化为与文本图层同尺寸的灰度蒙版，文本位于 (10, 10)
+        """
+        font, text, text_width, text_height = self._measure_text(text, font_name, font_size)
+        glyph = Image.new('L', (text_width + 20, text_height + 20), 0)
+        ImageDraw.Draw(glyph).text((10, 10), text, font=font, fill=255)
+        return glyph
+    
+    @staticmethod
+    def _draw_text_layer(glyph, fill, has_shadow, has_stroke):
+        """
+        样式阶段：用字形蒙版绘制描边、阴影和主文本
+        以蒙版填充颜色与直接用字体绘制文本的结果逐像素一致
+        """
+        # 创建文本图像
+        text_img = Image.new('RGBA', glyph.size, (255, 255, 255, 0))
+        text_draw = ImageDraw.Draw(text_img)
+        
+        # 如果需要添加阴影或描边
+        if has_stroke:
+            # 添加描边
+            stroke_width = 2
+            stroke_color = (0, 0, 0, fill[3] // 2)  # 半透明黑色
+            for dx, dy in ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (1, -1), (-1, 1), (1, 1)):
+                text_draw.bitmap((dx * stroke_width, dy * stroke_width), glyph, fill=stroke_color)
+        
+        if has_shadow:
+            # 添加阴影
+            shadow_offset = 2
+            shadow_color = (0, 0, 0, fill[3] // 2)  # 半透明黑色
+            text_draw.bitmap((shadow_offset, shadow_offset), glyph, fill=shadow_color)
+        
+        # 添加主文本
+        text_draw.bitmap((0, 0), glyph, fill=fill)
+        return text_img
+    
+    @staticmethod
+    def _rotate_text_layer(text_img, rotation):
+        """
+        旋转阶段
+        """
+        if rotation != 0:
+            text_img = text_img.rotate(rotation, expand=True, resample=Image.BICUBIC)
+        return text_img
+    
+    def prepare(self):
+        """
+        预渲染水印，返回可在多张图片上复用的 PreparedWatermark
+        批量处理时只需调用一次，避免逐张图片重复加载字体和绘制图层
+        """
+        return PreparedWatermark(self)
+    
     def _calculate_position(self, img_width, img_height, wm_width, wm_height):
         """
         计算水印位置
@@ -227,9 +406,21 @@ class Watermark:
             'rotation': self.rotation,
             'scale': self.scale,
             'has_shadow': self.has_shadow,
-            'has_stroke': self.has_stroke
+            'has_stroke': self.has_stroke,
+            'tiled': self.tiled,
+            'tile_spacing': self.tile_spacing,
+            'relative_size': self.relative_size
         }
     
+    def fingerprint(self):
+        """
+        计算水印配置的规范化哈希（SHA-256）
+        配置相同的水印得到相同的指纹，与字典顺序、元组或列表的表示方式无关
+        """
+        canonical = json.dumps(self.to_dict(), sort_keys=True, ensure_ascii=False,
+                               separators=(',', ':'), default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    
     def from_dict(self, config_dict):
         """
         从字典加载水印配置
@@ -237,4 +428,216 @@ class Watermark:
         """
         for key, value in config_dict.items():
             if hasattr(self, key):
-                setattr(self, key, value)
\ No newline at end of file
+                # JSON模板中的元组会被保存为列表，颜色和坐标需要还原为元组
+                if key in ('font_color', 'position') and isinstance(value, list):
+                    value = tuple(value)
+                setattr(self, key, value)
+
+
+class PreparedWatermark:
+    """
+    预渲染水印
+    在创建时根据 Watermark 配置渲染一次最终的RGBA图层，
+    之后按图片尺寸缓存已定位的叠加层，同尺寸的图片只需一次混合
+    """
+    
+    # 已定位叠加层缓存的尺寸种类上限（键为 宽, 高, 模式）
+    OVERLAY_CACHE_SIZE = 16
+    # 平铺条带缓存的宽度种类上限
+    TILED_OVERLAY_CACHE_SIZE = 4
+    
+    def __init__(self, watermark):
+        # 保存配置快照，避免原水印对象后续被修改影响已渲染的图层
+        self.watermark = Watermark()
+        self.watermark.from_dict(watermark.to_dict())
+        self.layer = self.watermark.render_layer()
+        self.opacity = self.watermark.layer_opacity
+        # 预乘alpha（并按透明度缩放）的图层，供合成引擎在每张图片上复用
+        self.prepared_layer = compositor.PreparedLayer(self.layer, self.opacity)
+        # 按相对尺寸缩放后的图层，键为图片宽度
+        self._scaled_layers = OrderedDict()
+        # 按图片尺寸缓存的已定位叠加层
+        self._overlays = OrderedDict()
+        # 平铺模式下按图片宽度缓存的平铺条带
+        self._tiled_overlays = OrderedDict()
+        # 按输出尺寸缩放的图层，键为 (原图尺寸, 输出尺寸)
+        self._output_layers = OrderedDict()
+        self._cache_lock = threading.Lock()
+    
+    @traced('PreparedWatermark.apply_watermark')
+    def apply_watermark(self, image, in_place=False, source_size=None, parallel_threshold=None):
+        """
+        应用水印到图片
+        in_place 为 True 时使用区域合成模式，直接修改原图
+        source_size 为图片缩放前的原始尺寸，水印按原图计算后再等比缩放
+        需要合成的像素数达到 parallel_threshold 时分条带并行合成（结果不变）
+        """
+        source_size = tuple(source_size) if source_size else None
+        if source_size == image.size:
+            source_size = None
+        
+        if self.watermark.tiled:
+            return self._apply_tiled(image if in_place else image.copy(), source_size, parallel_threshold)
+        
+        if in_place:
+            return ImageProcessor.composite_overlay(image, self.overlay_for(image, source_size),
+                                                    parallel_threshold)
+        
+        watermark_image = image.copy()
+        if watermark_image.mode in ImageProcessor.NATIVE_COMPOSITE_MODES:
+            return compositor.composite_overlay(watermark_image, self.overlay_for(watermark_image, source_size),
+                                                parallel_threshold)
+        
+        layer, _, position, _ = self._placement_for(image.size, source_size)
+        return ImageProcessor.paste_layer(watermark_image, layer, position, opacity=self.opacity)
+    
+    def overlay_for(self, image, source_size=None):
+        """
+        获取与图片尺寸和模式对应的已定位叠加层（compositor.PositionedOverlay）
+        source_size 不为 None 时叠加层按原图尺寸计算后缩放到图片尺寸
+        """
+        key = (image.width, image.height, image.mode, source_size)
+        with self._cache_lock:
+            overlay = self._overlays.get(key)
+            if overlay is not None:
+                self._overlays.move_to_end(key)
+                return overlay
+        
+        _, prepared_layer, position, _ = self._placement_for(image.size, source_size)
+        overlay = compositor.PositionedOverlay(prepared_layer, position, image.size)
+        
+        with self._cache_lock:
+            self._overlays[key] = overlay
+            while len(self._overlays) > self.OVERLAY_CACHE_SIZE:
+                self._overlays.popitem(last=False)
+        return overlay
+    
+    def _placement_for(self, image_size, source_size=None):
+        """
+        获取图片上的水印 (PIL图层, PreparedLayer, 位置, 平铺间距)
+        source_size 不为 None 时使用按原图计算后缩放到图片尺寸的结果
+        """
+        if source_size is None:
+            layer, prepared_layer = self._layer_for_width(image_size[0])
+            position = self.watermark._calculate_position(
+                image_size[0], image_size[1], layer.width, layer.height)
+            return layer, prepared_layer, position, self.watermark.tile_spacing
+        
+        key = (source_size, tuple(image_size))
+        with self._cache_lock:
+            placement = self._output_layers.get(key)
+            if placement is not None:
+                self._output_layers.move_to_end(key)
+                return placement
+        
+        source_layer, _ = self._layer_for_width(source_size[0])
+        layer, position, spacing = self.watermark._output_placement(source_layer, source_size, image_size)
+        placement = (layer, compositor.PreparedLayer(layer, self.opacity), position, spacing)
+        
+        with self._cache_lock:
+            self._output_layers[key] = placement
+            while len(self._output_layers) > self.OVERLAY_CACHE_SIZE:
+                self._output_layers.popitem(last=False)
+        return placement
+    
+    def _layer_for_width(self, img_width):
+        """
+        获取用于指定图片宽度的水印图层 (PIL图层, PreparedLayer)
+        未设置相对尺寸时所有图片共用同一个图层
+        """
+        if not self.watermark.relative_size:
+            return self.layer, self.prepared_layer
+        
+        with self._cache_lock:
+            layers = self._scaled_layers.get(img_width)
+            if layers is not None:
+                self._scaled_layers.move_to_end(img_width)
+                return layers
+        
+        layer = self.watermark._scale_layer(self.layer, img_width)
+        layers = (layer, compositor.PreparedLayer(layer, self.opacity))
+        
+        with self._cache_lock:
+            self._scaled_layers[img_width] = layers
+            while len(self._scaled_layers) > self.OVERLAY_CACHE_SIZE:
+                self._scaled_layers.popitem(last=False)
+        return layers
+    
+    def prepare(self):
+        """
+        已经是预渲染水印，直接返回自身
+        """
+        return self
+    
+    def to_dict(self):
+        """
+        返回渲染该图层所用的水印配置
+        """
+        return self.watermark.to_dict()
+    
+    def fingerprint(self):
+        """
+        返回渲染该图层所用水印配置的指纹
+        """
+        return self.watermark.fingerprint()
+    
+    def _apply_tiled(self, image, source_size=None, parallel_threshold=None):
+        """
+        平铺水印（原地修改），同宽度图片复用同一个平铺条带
+        """
+        layer, prepared_layer, _, spacing = self._placement_for(image.size, source_size)
+        if image.mode not in ImageProcessor.NATIVE_COMPOSITE_MODES or spacing < 0:
+            return ImageProcessor._apply_tiled_layer(image, None, spacing, lambda: layer, opacity=self.opacity)
+        
+        overlay = self._tiled_overlay_for(prepared_layer, image.width, spacing, source_size)
+        return compositor.composite_tiled(image, overlay, parallel_threshold=parallel_threshold)
+    
+    def _tiled_overlay_for(self, prepared_layer, width, spacing, source_size=None):
+        """
+        获取指定宽度的平铺条带（compositor.TiledOverlay）
+        """
+        key = width if source_size is None else (width, source_size)
+        with self._cache_lock:
+            overlay = self._tiled_overlays.get(key)
+            if overlay is None:
+                overlay = compositor.TiledOverlay(prepared_layer, width, spacing)
+                self._tiled_overlays[key] = overlay
+                while len(self._tiled_overlays) > self.TILED_OVERLAY_CACHE_SIZE:
+                    self._tiled_overlays.popitem(last=False)
+            else:
+                self._tiled_overlays.move_to_end(key)
+        return overlay
+    
+    def apply_to_band(self, band, canvas_size, offset_y):
+        """
+        将水印合成到大图的一个水平条带上（原地修改），用于分条带处理
+        
+        band 为整幅画布中从第 offset_y 行开始的若干整行，canvas_size 为整幅画布尺寸；
+        水印位置按整幅画布计算，只合成与该条带相交的部分，
+        各条带的结果拼接后与整幅图片应用水印的结果一致
+        """
+        layer, prepared_layer, position, spacing = self._placement_for(canvas_size)
+        native = band.mode in ImageProcessor.NATIVE_COMPOSITE_MODES
+        
+        if not self.watermark.tiled:
+            pos_x, pos_y = position
+            if native:
+                return compositor.composite(band, prepared_layer, (pos_x, pos_y - offset_y))
+            return ImageProcessor.paste_layer(band, layer, (pos_x, pos_y - offset_y), opacity=self.opacity)
+        
+        if native and spacing >= 0:
+            overlay = self._tiled_overlay_for(prepared_layer, canvas_size[0], spacing)
+            return compositor.composite_tiled(band, overlay, offset_y)
+        
+        # 其他模式或负间距：逐个粘贴与条带相交的水印（与 _apply_tiled_layer 的顺序一致）
+        step_x = layer.width + spacing
+        step_y = layer.height + spacing
+        if native:
+            tile = prepared_layer
+        else:
+            tile = compositor.fade_layer(layer, self.opacity) if self.opacity != 100 else layer
+        for x in range(0, canvas_size[0], step_x):
+            for y in range(0, canvas_size[1], step_y):
+                if y + layer.height > offset_y and y < offset_y + band.height:
+                    ImageProcessor.paste_layer(band, tile, (x, y - offset_y))
+        return band
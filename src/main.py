@@ -1,5 +1,6 @@
 import os
 import sys
+import multiprocessing
 from PyQt6 import QtWidgets
 from PyQt6 import QtGui
 
@@ -69,4 +70,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # 打包后的应用使用多进程批量处理时需要
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,107 @@
+class EditState:
+    """
+    非破坏性编辑状态
+
+    原图只解码一次并保持不变，已应用的水印保存为渲染配方：按顺序排列的 (槽位, 渲染函数)。
+    每个槽位（如文本水印、图片水印）最多一个水印，再次应用同一槽位时替换原来的水印而不是叠加。
+    渲染函数 render(image, source_size=None) 返回添加水印后的新图片，
+    通常是持有已渲染图层的 PreparedWatermark 方法，重新合成时复用图层。
+    撤销/重做只在配方之间切换，不保存图片。
+    """
+
+    def __init__(self, original):
+        self.original = original
+        self.history = [()]
+        self.index = 0
+
+    @property
+    def recipe(self):
+        """
+        当前的渲染配方
+        """
+        return self.history[self.index]
+
+    def apply(self, slot, render):
+        """
+        应用水印：替换同一槽位的水印（保持其顺序），没有时追加到最后
+        """
+        self._push(self.replace(self.recipe, slot, render))
+
+    def remove(self, slot):
+        """
+        移除槽位中的水印，槽位为空时不产生新的历史记录
+        """
+        recipe = self.replace(self.recipe, slot, None)
+        if recipe != self.recipe:
+            self._push(recipe)
+
+    def _push(self, recipe):
+        """
+        记录新的配方，丢弃可以重做的历史
+        """
+        del self.history[self.index + 1:]
+        self.history.append(recipe)
+        self.index += 1
+
+    def can_undo(self):
+        return self.index > 0
+
+    def can_redo(self):
+        return self.index < len(self.history) - 1
+
+    def undo(self):
+        """
+        撤销到上一个配方，返回是否发生了变化
+        """
+        if not self.can_undo():
+            return False
+        self.index -= 1
+        return True
+
+    def redo(self):
+        """
+        重做到下一个配方，返回是否发生了变化
+        """
+        if not self.can_redo():
+            return False
+        self.index += 1
+        return True
+
+    @staticmethod
+    def replace(recipe, slot, render):
+        """
+        返回把槽位 slot 替换为 render 后的配方，render 为 None 时移除该槽位
+        """
+        steps = []
+        replaced = False
+        for step_slot, step_render in recipe:
+            if step_slot == slot:
+                replaced = True
+                if render is not None:
+                    steps.append((slot, render))
+            else:
+                steps.append((step_slot, step_render))
+        if not replaced and render is not None:
+            steps.append((slot, render))
+        return tuple(steps)
+
+    @staticmethod
+    def compose(recipe):
+        """
+        将配方合并为一个渲染函数，配方为空时返回 None（直接显示原图）
+        """
+        if not recipe:
+            return None
+
+        def render(image, source_size=None):
+            for _, step_render in recipe:
+                image = step_render(image, source_size=source_size)
+            return image
+        return render
+
+    def render(self, recipe=None):
+        """
+        在原图上按配方（默认为当前配方）合成，返回新图片；配方为空时返回原图
+        """
+        render = self.compose(self.recipe if recipe is None else recipe)
+        return self.original if render is None else render(self.original)
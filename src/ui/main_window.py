@@ -8,22 +8,25 @@ from PyQt6 import QtCore
 from PyQt6.QtWidgets import (
     QMainWindow, QApplication, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QPushButton, QFileDialog, QSplitter, QTabWidget,
-    QScrollArea, QMessageBox, QProgressBar, QStatusBar, QMenuBar,
+    QMessageBox, QProgressBar, QStatusBar, QMenuBar,
     QMenu, QToolBar, QGroupBox, QFormLayout, QComboBox,
     QSpinBox, QDoubleSpinBox, QColorDialog, QFontDialog, QCheckBox,
     QSlider, QToolButton, QListWidget, QListWidgetItem, QFrame, QLineEdit
 )
 from PyQt6.QtGui import (
-    QPixmap, QImage, QFont, QIcon, QColor, QPainter, QPen, QBrush,
+    QFont, QIcon, QColor, QPainter, QPen, QBrush,
     QAction  # QAction在QtGui模块中
 )
 from PyQt6.QtCore import (
-    Qt, QSize, QRect, QPoint, QThread, pyqtSignal
+    Qt, QSize, QRect, QPoint, QThread, QTimer, pyqtSignal
 )
 
 from src.core.image_processor import ImageProcessor
 from src.core.watermark import Watermark
 from src.core.batch_processor import BatchProcessor
+from src.ui.edit_state import EditState
+from src.ui.preview_renderer import PreviewRenderer
+from src.ui.preview_view import PreviewView, rotated_size, layer_to_qimage
 from src.utils.template_manager import TemplateManager
 from src.utils.config import ConfigManager
 from src.utils.logger import info, warning, error
@@ -34,6 +37,18 @@ class MainWindow(QtWidgets.QMainWindow):
     主窗口类，应用程序的主要界面
     """
     
+    # 调整水印设置后等待多少毫秒再渲染预览
+    PREVIEW_DEBOUNCE_MS = 80
+    
+    # 位置下拉框选项对应的水印位置，"自定义"使用在预览中拖动水印得到的坐标
+    POSITION_KEYS = {
+        "左上": 'top-left',
+        "右上": 'top-right',
+        "左下": 'bottom-left',
+        "右下": 'bottom-right',
+        "居中": 'center'
+    }
+    
     def __init__(self):
         super().__init__()
         
@@ -44,13 +59,36 @@ class MainWindow(QtWidgets.QMainWindow):
         self.config_manager = ConfigManager()
         self.template_manager = TemplateManager()
         
-        # 当前打开的图片路径
+        # 当前打开的图片路径和解码后的原图（原图不会被修改，水印只在预览和导出时合成）
         self.current_image_path = None
         self.current_image = None
+        # 已应用水印的渲染配方和撤销历史
+        self.edit_state = None
         
         # 当前水印对象
         self.current_watermark = Watermark()
         
+        # 后台预览渲染线程，水印合成和图片转换不在界面线程中执行
+        self.preview_renderer = PreviewRenderer(self)
+        self.preview_renderer.rendered.connect(self.on_preview_rendered)
+        self.preview_renderer.failed.connect(self.on_preview_failed)
+        self.preview_renderer.start()
+        # 是否在预览中显示按当前设置添加的水印（调整设置后开启，应用水印、撤销或打开图片后关闭）
+        self.live_preview = False
+        # 最近一次请求的预览底图对应的配方，配方不变时只需更新覆盖层
+        self.preview_base_recipe = None
+        # 在预览中拖动水印得到的自定义位置（原图坐标）
+        self.custom_position = None
+        # 当前覆盖层图层对应的水印设置和图层尺寸，设置不变时只更新覆盖层的变换
+        self.overlay_key = None
+        self.overlay_size = None
+        
+        # 预览防抖定时器，连续调整设置时只在停顿后渲染一次
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(self.PREVIEW_DEBOUNCE_MS)
+        self.preview_timer.timeout.connect(self.update_preview)
+        
         # 初始化UI
         self.init_ui()
         
@@ -101,6 +139,37 @@ class MainWindow(QtWidgets.QMainWindow):
         
         # 创建状态栏
         self.create_status_bar()
+        
+        # 水印设置改变时刷新实时预览
+        self.connect_preview_signals()
+    
+    def connect_preview_signals(self):
+        """
+        将各水印设置控件的变化连接到实时预览
+        """
+        signals = [
+            self.findChild(QTabWidget).currentChanged,
+            # 文本水印
+            self.watermark_text_edit.textChanged,
+            self.opacity_slider.valueChanged,
+            self.position_combo.currentIndexChanged,
+            self.rotation_slider.valueChanged,
+            self.font_size_spin.valueChanged,
+            self.shadow_check.toggled,
+            self.stroke_check.toggled,
+            self.tile_check.toggled,
+            self.tile_spacing_spin.valueChanged,
+            # 图片水印
+            self.watermark_image_path_edit.textChanged,
+            self.image_opacity_slider.valueChanged,
+            self.scale_spin.valueChanged,
+            self.image_position_combo.currentIndexChanged,
+            self.image_rotation_slider.valueChanged,
+            self.image_tile_check.toggled,
+            self.image_tile_spacing_spin.valueChanged
+        ]
+        for signal in signals:
+            signal.connect(self.schedule_preview)
     
     def create_menu_bar(self):
         """
@@ -157,11 +226,17 @@ class MainWindow(QtWidgets.QMainWindow):
         edit_menu = menu_bar.addMenu("编辑")
         
         # 撤销动作
-        undo_action = QAction("撤销", self)
-        undo_action.setShortcut("Ctrl+Z")
-        # TODO: 实现撤销功能
-        undo_action.triggered.connect(lambda: None)
-        edit_menu.addAction(undo_action)
+        self.undo_action = QAction("撤销", self)
+        self.undo_action.setShortcut("Ctrl+Z")
+        self.undo_action.triggered.connect(self.undo)
+        edit_menu.addAction(self.undo_action)
+        
+        # 重做动作
+        self.redo_action = QAction("重做", self)
+        self.redo_action.setShortcut("Ctrl+Y")
+        self.redo_action.triggered.connect(self.redo)
+        edit_menu.addAction(self.redo_action)
+        self.update_edit_actions()
         
         # 分隔线
         edit_menu.addSeparator()
@@ -569,17 +644,12 @@ class MainWindow(QtWidgets.QMainWindow):
         right_panel = QWidget()
         right_layout = QVBoxLayout(right_panel)
         
-        # 预览区域
-        self.preview_label = QLabel("请打开一张图片")
-        self.preview_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.preview_label.setMinimumSize(400, 300)
-        self.preview_label.setStyleSheet("background-color: #f0f0f0;")
-        
-        # 滚动区域
-        scroll_area = QScrollArea()
-        scroll_area.setWidget(self.preview_label)
-        scroll_area.setWidgetResizable(True)
-        right_layout.addWidget(scroll_area)
+        # 预览区域（底图和可拖动的水印覆盖层）
+        self.preview_view = PreviewView()
+        self.preview_view.setMinimumSize(400, 300)
+        self.preview_view.show_message("请打开一张图片")
+        self.preview_view.overlay_moved.connect(self.on_overlay_moved)
+        right_layout.addWidget(self.preview_view)
         
         # 图片信息
         self.image_info_label = QLabel("未加载图片")
@@ -707,10 +777,15 @@ class MainWindow(QtWidgets.QMainWindow):
             self.current_image = ImageProcessor.load_image(file_path)
             info(f"图片加载成功: {os.path.basename(file_path)}")
             
-            # 更新预览
+            # 更新预览（新图片先显示原图，丢弃上一张图片尚未完成的渲染）
             info("更新图片预览")
+            self.preview_renderer.set_image(self.current_image)
+            self.edit_state = EditState(self.current_image)
+            self.update_edit_actions()
+            self.live_preview = False
+            self.preview_view.set_image_size(*self.current_image.size)
             self.update_preview()
-            info("预览更新完成")
+            info("已请求渲染预览")
             
             # 更新图片信息
             info("更新图片信息")
@@ -751,7 +826,7 @@ class MainWindow(QtWidgets.QMainWindow):
                 
                 # 保存图片
                 ImageProcessor.save_image(
-                    self.current_image,
+                    self.export_image(),
                     self.current_image_path,
                     format=output_settings['format'],
                     quality=output_settings['quality']
@@ -804,7 +879,7 @@ class MainWindow(QtWidgets.QMainWindow):
                 
                 # 保存图片
                 ImageProcessor.save_image(
-                    self.current_image,
+                    self.export_image(),
                     file_path,
                     format=output_settings['format'],
                     quality=output_settings['quality']
@@ -825,171 +900,373 @@ class MainWindow(QtWidgets.QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "错误", f"保存图片失败: {str(e)}")
     
+    def export_image(self):
+        """
+        返回要保存的图片：在原图上按已应用的配方合成
+        预览中正在显示（尚未应用）的水印替换同一类型的已应用水印后一起合成
+        """
+        return self.edit_state.render(self.preview_recipe(include_live=True))
+    
+    def current_slot(self):
+        """
+        当前标签页对应的配方槽位（每种水印最多应用一个，再次应用时替换）
+        """
+        return 'image' if self.findChild(QTabWidget).currentIndex() == 1 else 'text'
+    
+    def preview_recipe(self, include_live):
+        """
+        返回预览使用的配方
+        调整设置时当前槽位的已应用水印被实时水印替换：include_live 为 True 时合成实时水印，
+        否则从配方中移除（由覆盖层显示）
+        """
+        recipe = self.edit_state.recipe
+        if not self.live_preview:
+            return recipe
+        if not include_live:
+            return EditState.replace(recipe, self.current_slot(), None)
+        render = self.build_watermark_render()
+        return recipe if render is None else EditState.replace(recipe, self.current_slot(), render)
+    
     def apply_watermark(self):
         """
-        应用水印到当前图片
+        应用水印：将当前设置记录到渲染配方中，替换同一类型的已应用水印
+        原图不变，预览按新配方重新合成
         """
         if not self.current_image:
             QMessageBox.warning(self, "警告", "请先打开一张图片")
             return
         
         try:
-            # 获取当前选中的标签页（文本水印或图片水印）
-            tab_widget = self.findChild(QTabWidget)
-            current_tab_index = tab_widget.currentIndex()
+            render = self.build_watermark_render(show_warnings=True)
+            if render is None:
+                return
             
-            if current_tab_index == 0:  # 文本水印
-                # 获取文本水印设置
-                text = self.watermark_text_edit.text()
-                font_str = self.font_label.text()
-                color_str = self.color_preview.styleSheet()[len("background-color: "):]
-                opacity = self.opacity_slider.value() / 100.0
-                rotation = self.rotation_slider.value()
-                font_size = self.font_size_spin.value()
-                position = self.position_combo.currentText()
-                
-                # 获取高级设置
-                has_shadow = self.shadow_check.isChecked()
-                has_stroke = self.stroke_check.isChecked()
-                use_tile = self.tile_check.isChecked()
-                tile_spacing = self.tile_spacing_spin.value()
-                
-                # 尝试从字体信息中解析字体名称
-                font_name = "Arial"
-                try:
-                    parts = font_str.split(",")
-                    if len(parts) > 0:
-                        font_name = parts[0].strip()
-                except Exception:
-                    pass
-                
-                # 构建字体信息
-                font = (font_name, font_size)
-                
-                # 更新当前水印设置
-                self.current_watermark.watermark_type = 'text'
-                self.current_watermark.text = text
-                self.current_watermark.font_name = font_name
-                self.current_watermark.font_size = font_size
-                # 转换颜色为RGBA
-                q_color = QColor(color_str)
-                self.current_watermark.font_color = (q_color.red(), q_color.green(), q_color.blue(), int(255 * opacity))
-                self.current_watermark.opacity = opacity * 100  # 存储为0-100的整数
-                self.current_watermark.rotation = rotation
-                self.current_watermark.position = position
-                self.current_watermark.has_shadow = has_shadow
-                self.current_watermark.has_stroke = has_stroke
-                
-                # 应用文本水印
-                if use_tile:
-                    # 使用平铺水印
-                    watermarked_image = ImageProcessor.add_tiled_watermark(
-                        self.current_image,
+            self.edit_state.apply(self.current_slot(), render)
+            self.show_recipe()
+            
+            # 更新状态
+            self.status_label.setText("已应用水印")
+            
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"应用水印失败: {str(e)}")
+    
+    def undo(self):
+        """
+        撤销上一次应用水印
+        """
+        if self.edit_state and self.edit_state.undo():
+            self.show_recipe()
+            self.status_label.setText("已撤销")
+    
+    def redo(self):
+        """
+        重做撤销的应用水印
+        """
+        if self.edit_state and self.edit_state.redo():
+            self.show_recipe()
+            self.status_label.setText("已重做")
+    
+    def show_recipe(self):
+        """
+        结束实时预览，显示当前配方的合成结果
+        """
+        self.live_preview = False
+        self.preview_timer.stop()
+        self.update_preview()
+        self.update_edit_actions()
+    
+    def update_edit_actions(self):
+        """
+        更新撤销/重做菜单项的可用状态
+        """
+        self.undo_action.setEnabled(bool(self.edit_state and self.edit_state.can_undo()))
+        self.redo_action.setEnabled(bool(self.edit_state and self.edit_state.can_redo()))
+    
+    def build_watermark_render(self, show_warnings=False):
+        """
+        根据当前标签页的水印设置生成渲染函数 render(image, source_size=None)，返回添加水印后的新图片
+        image 为缩小的预览代理图时 source_size 为原图尺寸，水印按原图计算后等比缩放
+        设置在界面线程中读取，渲染函数只使用读取到的值，可以在后台线程中执行
+        设置无效时返回 None，show_warnings 为 True 时提示原因
+        """
+        # 获取当前选中的标签页（文本水印或图片水印）
+        tab_widget = self.findChild(QTabWidget)
+        current_tab_index = tab_widget.currentIndex()
+        
+        if current_tab_index == 0:  # 文本水印
+            # 获取文本水印设置
+            text = self.watermark_text_edit.text()
+            font_str = self.font_label.text()
+            color_str = self.color_preview.styleSheet()[len("background-color: "):]
+            opacity = self.opacity_slider.value() / 100.0
+            rotation = self.rotation_slider.value()
+            font_size = self.font_size_spin.value()
+            position = self.watermark_position(self.position_combo)
+            
+            # 获取高级设置
+            has_shadow = self.shadow_check.isChecked()
+            has_stroke = self.stroke_check.isChecked()
+            use_tile = self.tile_check.isChecked()
+            tile_spacing = self.tile_spacing_spin.value()
+            
+            # 尝试从字体信息中解析字体名称
+            font_name = "Arial"
+            try:
+                parts = font_str.split(",")
+                if len(parts) > 0:
+                    font_name = parts[0].strip()
+            except Exception:
+                pass
+            
+            # 更新当前水印设置
+            self.current_watermark.watermark_type = 'text'
+            self.current_watermark.text = text
+            self.current_watermark.font_name = font_name
+            self.current_watermark.font_size = font_size
+            # 转换颜色为RGBA
+            q_color = QColor(color_str)
+            font_color = (q_color.red(), q_color.green(), q_color.blue(), int(255 * opacity))
+            self.current_watermark.font_color = font_color
+            self.current_watermark.opacity = opacity * 100  # 存储为0-100的整数
+            self.current_watermark.rotation = rotation
+            self.current_watermark.position = position
+            self.current_watermark.has_shadow = has_shadow
+            self.current_watermark.has_stroke = has_stroke
+            
+            # 应用文本水印
+            if use_tile:
+                # 使用平铺水印
+                def render(image, source_size=None):
+                    return ImageProcessor.add_tiled_watermark(
+                        image,
                         text,
                         font_name=font_name,
                         font_size=font_size,
-                        font_color=(q_color.red(), q_color.green(), q_color.blue(), int(255 * opacity)),
+                        font_color=font_color,
                         rotation=rotation,
-                        spacing=tile_spacing
+                        spacing=tile_spacing,
+                        source_size=source_size
                     )
-                else:
-                    # 应用阴影和描边效果
-                    watermark = Watermark()
-                    watermark.set_text_watermark(text, font_name, font_size, (q_color.red(), q_color.green(), q_color.blue()), opacity * 100)
-                    watermark.set_position(position)
-                    watermark.set_rotation(rotation)
-                    watermark.set_style(has_shadow, has_stroke)
-                    watermarked_image = watermark.apply_watermark(self.current_image)
-            elif current_tab_index == 1:  # 图片水印
-                # 获取图片水印设置
-                image_path = self.watermark_image_path_edit.text()
-                
-                if not image_path or not os.path.exists(image_path):
+                return render
+            
+            # 应用阴影和描边效果
+            watermark = Watermark()
+            watermark.set_text_watermark(text, font_name, font_size, font_color[:3], opacity * 100)
+            watermark.set_position(position)
+            watermark.set_rotation(rotation)
+            watermark.set_style(has_shadow, has_stroke)
+            # 预渲染的图层和已定位的叠加层在重新合成时复用
+            return watermark.prepare().apply_watermark
+        
+        elif current_tab_index == 1:  # 图片水印
+            # 获取图片水印设置
+            image_path = self.watermark_image_path_edit.text()
+            
+            if not image_path or not os.path.exists(image_path):
+                if show_warnings:
                     QMessageBox.warning(self, "警告", "请先选择一个有效的水印图片")
-                    return
-                
-                opacity = self.image_opacity_slider.value() / 100.0
-                scale = self.scale_spin.value()
-                rotation = self.image_rotation_slider.value()
-                position = self.image_position_combo.currentText()
-                
-                # 获取高级设置
-                use_tile = self.image_tile_check.isChecked()
-                tile_spacing = self.image_tile_spacing_spin.value()
-                
-                # 更新当前水印设置
-                self.current_watermark.watermark_type = 'image'
-                self.current_watermark.watermark_path = image_path
-                self.current_watermark.opacity = opacity * 100  # 存储为0-100的整数
-                self.current_watermark.scale = scale
-                self.current_watermark.rotation = rotation
-                self.current_watermark.position = position
-                
-                # 应用图片水印
-                if use_tile:
-                    # 使用平铺水印
-                    watermarked_image = ImageProcessor.add_tiled_image_watermark(
-                        self.current_image,
+                return None
+            
+            opacity = self.image_opacity_slider.value() / 100.0
+            scale = self.scale_spin.value()
+            rotation = self.image_rotation_slider.value()
+            position = self.watermark_position(self.image_position_combo)
+            
+            # 获取高级设置
+            use_tile = self.image_tile_check.isChecked()
+            tile_spacing = self.image_tile_spacing_spin.value()
+            
+            # 更新当前水印设置
+            self.current_watermark.watermark_type = 'image'
+            self.current_watermark.watermark_path = image_path
+            self.current_watermark.opacity = opacity * 100  # 存储为0-100的整数
+            self.current_watermark.scale = scale
+            self.current_watermark.rotation = rotation
+            self.current_watermark.position = position
+            
+            # 应用图片水印
+            if use_tile:
+                # 使用平铺水印
+                def render(image, source_size=None):
+                    return ImageProcessor.add_tiled_image_watermark(
+                        image,
                         image_path,
                         opacity=opacity * 100,
                         scale=scale,
                         rotation=rotation,
-                        spacing=tile_spacing
-                    )
-                else:
-                    # 应用普通图片水印
-                    watermarked_image = ImageProcessor.add_image_watermark(
-                        self.current_image,
-                        image_path,
-                        position=position,
-                        opacity=opacity * 100,
-                        scale=scale,
-                        rotation=rotation
+                        spacing=tile_spacing,
+                        source_size=source_size
                     )
-            else:
-                QMessageBox.warning(self, "警告", "请选择水印类型")
-                return
+                return render
             
-            # 更新当前图片
-            self.current_image = watermarked_image
+            # 应用普通图片水印（与 ImageProcessor.add_image_watermark 效果相同，并支持按原图尺寸缩放）
+            watermark = Watermark()
+            watermark.set_image_watermark(image_path, opacity * 100, scale)
+            watermark.set_position(position)
+            watermark.set_rotation(rotation)
+            return watermark.prepare().apply_watermark
+        
+        if show_warnings:
+            QMessageBox.warning(self, "警告", "请选择水印类型")
+        return None
+    
+    def watermark_position(self, combo):
+        """
+        返回位置下拉框对应的水印位置
+        选择"自定义"但还没有拖动过水印时使用右下角（与 Watermark 的默认位置相同）
+        """
+        text = combo.currentText()
+        if text in self.POSITION_KEYS:
+            return self.POSITION_KEYS[text]
+        return self.custom_position or 'bottom-right'
+    
+    def build_watermark_overlay(self):
+        """
+        根据当前标签页的水印设置生成覆盖层参数 (图层键, 图层生成函数, 位置, 旋转角度, 不透明度)
+        图层不含旋转和透明度（由覆盖层变换实现），图层键相同时不需要重新生成图层；
+        平铺水印或设置无效时返回 None
+        """
+        tab_widget = self.findChild(QTabWidget)
+        current_tab_index = tab_widget.currentIndex()
+        
+        if current_tab_index == 0:  # 文本水印
+            if self.tile_check.isChecked():
+                return None
+            text = self.watermark_text_edit.text()
+            font_str = self.font_label.text()
+            font_name = font_str.split(",")[0].strip() or "Arial"
+            q_color = QColor(self.color_preview.styleSheet()[len("background-color: "):])
+            font_color = (q_color.red(), q_color.green(), q_color.blue())
+            font_size = self.font_size_spin.value()
+            style = (self.shadow_check.isChecked(), self.stroke_check.isChecked())
             
-            # 更新预览
-            self.update_preview()
+            def render_layer():
+                watermark = Watermark()
+                watermark.set_text_watermark(text, font_name, font_size, font_color, 100)
+                watermark.set_style(*style)
+                return watermark.render_layer()
+            key = ('text', text, font_name, font_size, font_color, style)
+            rotation = self.rotation_slider.value()
+            opacity = self.opacity_slider.value() / 100.0
+            position = self.watermark_position(self.position_combo)
+        
+        elif current_tab_index == 1:  # 图片水印
+            image_path = self.watermark_image_path_edit.text()
+            if self.image_tile_check.isChecked() or not image_path or not os.path.exists(image_path):
+                return None
+            scale = self.scale_spin.value()
             
-            # 更新状态
-            self.status_label.setText("已应用水印")
+            def render_layer():
+                return ImageProcessor.prepare_image_watermark(image_path, scale, 0)
+            key = ('image', image_path, scale)
+            rotation = self.image_rotation_slider.value()
+            opacity = self.image_opacity_slider.value() / 100.0
+            position = self.watermark_position(self.image_position_combo)
+        
+        else:
+            return None
+        
+        return key, render_layer, position, rotation, opacity
+    
+    def update_overlay(self):
+        """
+        按当前设置更新预览中的水印覆盖层
+        水印可以用覆盖层显示时返回 True，否则隐藏覆盖层并返回 False
+        """
+        overlay = self.build_watermark_overlay() if self.live_preview and self.current_image else None
+        if overlay is None:
+            self.preview_view.clear_overlay()
+            return False
+        
+        key, render_layer, position, rotation, opacity = overlay
+        try:
+            q_image = None
+            if key != self.overlay_key:
+                layer = render_layer()
+                q_image = layer_to_qimage(layer)
+                self.overlay_key = key
+                self.overlay_size = layer.size
             
+            if not isinstance(position, tuple):
+                # 预设位置按旋转后的外接矩形计算，与合成时一致
+                watermark = Watermark()
+                watermark.set_position(position)
+                bound_width, bound_height = rotated_size(*self.overlay_size, rotation)
+                position = watermark._calculate_position(
+                    self.current_image.width, self.current_image.height,
+                    round(bound_width), round(bound_height))
+            self.preview_view.set_overlay(q_image, position, rotation, opacity)
+            return True
         except Exception as e:
-            QMessageBox.critical(self, "错误", f"应用水印失败: {str(e)}")
+            self.overlay_key = None
+            self.preview_view.clear_overlay()
+            warning(f"更新水印覆盖层失败: {str(e)}")
+            return False
+    
+    def on_overlay_moved(self, x, y):
+        """
+        在预览中拖动水印后，将位置切换为"自定义"并记录新坐标
+        """
+        self.custom_position = (x, y)
+        tab_widget = self.findChild(QTabWidget)
+        combo = self.image_position_combo if tab_widget.currentIndex() == 1 else self.position_combo
+        combo.setCurrentText("自定义")
+        self.schedule_preview()
+    
+    def schedule_preview(self, *args):
+        """
+        水印设置改变后刷新实时预览
+        能用覆盖层显示的水印立即更新覆盖层，不重新合成图片；
+        其他情况（平铺水印）由定时器防抖，连续调整滑块时只在停顿后渲染一次
+        """
+        if not self.current_image:
+            return
+        self.live_preview = True
+        if self.update_overlay():
+            # 底图（不含当前槽位的水印）有变化时才需要重新渲染
+            if self.preview_recipe(include_live=False) != self.preview_base_recipe:
+                self.update_preview()
+            return
+        self.preview_timer.start()
+    
+    def preview_display_size(self):
+        """
+        预览区域的尺寸 (宽, 高)
+        """
+        return self.preview_view.display_size()
     
     def update_preview(self):
         """
         更新预览图像
+        请求后台渲染线程渲染预览，调整水印设置后预览显示按当前设置添加水印的效果
         """
         if not self.current_image:
-            self.preview_label.setText("请打开一张图片")
+            self.preview_view.show_message("请打开一张图片")
             return
         
         try:
-            # 将PIL图像转换为QPixmap
-            image_rgb = self.current_image.convert('RGB')
-            width, height = image_rgb.size
-            image_data = image_rgb.tobytes()
-            
-            q_image = QImage(image_data, width, height, 3 * width, QImage.Format.Format_RGB888)
-            pixmap = QPixmap.fromImage(q_image)
-            
-            # 调整预览大小以适应标签
-            scaled_pixmap = pixmap.scaled(
-                self.preview_label.size(),
-                Qt.AspectRatioMode.KeepAspectRatio,
-                Qt.TransformationMode.SmoothTransformation
-            )
-            
-            self.preview_label.setPixmap(scaled_pixmap)
-            
+            # 实时水印用覆盖层显示时底图不合成实时水印
+            overlay = self.update_overlay()
+            self.preview_base_recipe = self.preview_recipe(include_live=not overlay)
+            self.preview_renderer.request(EditState.compose(self.preview_base_recipe),
+                                          self.preview_display_size())
         except Exception as e:
-            self.preview_label.setText(f"预览失败: {str(e)}")
+            self.status_label.setText(f"预览失败: {str(e)}")
+    
+    def on_preview_rendered(self, generation, q_image):
+        """
+        后台渲染完成（在界面线程中调用）
+        只显示最新一次请求的预览，过时的结果直接忽略
+        """
+        if generation == self.preview_renderer.latest_generation():
+            self.preview_view.set_base(q_image)
+    
+    def on_preview_failed(self, generation, message):
+        """
+        后台渲染失败（在界面线程中调用）
+        """
+        if generation == self.preview_renderer.latest_generation():
+            self.status_label.setText(f"预览失败: {message}")
     
     def update_image_info(self):
         """
@@ -1099,9 +1376,9 @@ class MainWindow(QtWidgets.QMainWindow):
         """
         super().resizeEvent(event)
         
-        # 更新预览
+        # 更新预览（防抖，拖动窗口边缘时只在停顿后渲染）
         if self.current_image:
-            self.update_preview()
+            self.preview_timer.start()
     
     def closeEvent(self, event):
         """
@@ -1110,6 +1387,10 @@ class MainWindow(QtWidgets.QMainWindow):
         # 保存配置
         self.save_config()
         
+        # 停止预览渲染线程
+        self.preview_timer.stop()
+        self.preview_renderer.stop()
+        
         # 接受关闭事件
         event.accept()
     
@@ -1171,6 +1452,7 @@ class MainWindow(QtWidgets.QMainWindow):
         if ok:
             # 更新字体标签
             self.font_label.setText(f"{font.family()}, {font.pointSize()}pt")
+            self.schedule_preview()
     
     def select_color(self):
         """
@@ -1193,6 +1475,7 @@ class MainWindow(QtWidgets.QMainWindow):
         if color.isValid():
             # 更新颜色预览
             self.color_preview.setStyleSheet(f"background-color: {color.name()};")
+            self.schedule_preview()
     
     def select_watermark_image(self):
         """
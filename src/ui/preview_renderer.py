@@ -0,0 +1,179 @@
+import threading
+from PIL import Image
+from PyQt6.QtCore import QThread, pyqtSignal
+from PyQt6.QtGui import QImage
+
+from src.core.image_processor import ImageProcessor
+from src.utils.logger import error
+
+
+class ProxyPyramid:
+    """
+    预览用的多分辨率代理图像金字塔
+
+    第0层为原图，之后每层宽高减半（reduce 盒式缩小），按需生成并缓存。
+    预览选用不小于显示尺寸的最小一层，合成和转换的像素数取决于预览区域的大小，而不是原图大小。
+    """
+
+    def __init__(self, image):
+        self.base = image
+        self.levels = [image]
+
+    @property
+    def size(self):
+        return self.base.size
+
+    def level_index(self, display_size):
+        """
+        返回按比例缩放到 display_size 内时不需要放大的最小一层的层号
+        display_size 无效时返回 0（原图）
+        """
+        if not display_size or display_size[0] <= 0 or display_size[1] <= 0:
+            return 0
+        ratio = min(display_size[0] / self.base.width, display_size[1] / self.base.height)
+        target_width, target_height = self.base.width * ratio, self.base.height * ratio
+        index = 0
+        while True:
+            level = self.level(index + 1)
+            if level is None or level.width < target_width or level.height < target_height:
+                return index
+            index += 1
+
+    def level(self, index):
+        """
+        返回第 index 层，图片已无法再缩小时返回 None
+        """
+        while len(self.levels) <= index:
+            previous = self.levels[-1]
+            if previous.width < 2 or previous.height < 2:
+                return None
+            if previous.mode not in ImageProcessor.RESAMPLE_MODES:
+                previous = previous.convert('RGBA')
+            self.levels.append(previous.reduce(2))
+        return self.levels[index]
+
+
+class PreviewRenderer(QThread):
+    """
+    后台预览渲染线程
+
+    水印合成、模式转换和 tobytes 都在本线程中执行，界面线程只负责把结果显示出来。
+    底图（原图）不会被渲染结果替换。渲染请求只保留最新的一个，新的请求会替换尚未开始的旧请求；
+    正在渲染的旧请求完成后发现已被取代时直接丢弃结果，不再转换和发送。
+    预览在代理金字塔中接近显示尺寸的一层上合成（水印按原图尺寸等比缩放）；
+    之后每空闲 REFINE_DELAY 秒在更精细的一层上重新渲染，直到原图，以同一请求编号逐步发送更高质量的结果，
+    每一步的耗时不超过上一步的约4倍，期间有新请求时停止细化。
+
+    结果通过 rendered 信号返回界面线程：(请求编号, 缩放到显示尺寸的 QImage)。
+    """
+
+    rendered = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+    # 空闲多少秒后在原图上重新渲染最新的预览
+    REFINE_DELAY = 0.5
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._condition = threading.Condition()
+        self._pyramid = None
+        self._epoch = 0
+        self._generation = 0
+        self._preview = None
+        self._refine = None
+        self._stopping = False
+
+    def set_image(self, image):
+        """
+        设置新的底图，丢弃尚未执行的请求，正在执行的请求的结果也不再发送
+        """
+        with self._condition:
+            self._pyramid = ProxyPyramid(image)
+            self._epoch += 1
+            self._generation += 1
+            self._preview = None
+            self._refine = None
+
+    def request(self, render=None, display_size=None):
+        """
+        提交渲染请求，返回请求编号
+        render(image, source_size=原图尺寸) 返回在 image 上添加水印的新图片，
+        image 可能是缩小的代理图，水印需要按 source_size 等比缩放；None 表示直接显示底图；
+        display_size 为 (宽, 高) 时结果按比例缩放到该尺寸内再转换为 QImage
+        """
+        with self._condition:
+            self._generation += 1
+            self._preview = (self._generation, self._epoch, render, display_size)
+            self._refine = None
+            self._condition.notify()
+            return self._generation
+
+    def latest_generation(self):
+        """
+        返回最近一次请求的编号
+        """
+        with self._condition:
+            return self._generation
+
+    def stop(self):
+        """
+        停止渲染线程并等待其退出
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self.wait()
+
+    def run(self):
+        """
+        渲染线程主循环：渲染最新的预览请求，空闲时细化最近一次预览
+        """
+        while True:
+            with self._condition:
+                while not self._stopping and self._preview is None:
+                    if self._refine is None:
+                        self._condition.wait()
+                    elif not self._condition.wait(self.REFINE_DELAY) and self._refine is not None:
+                        break
+                if self._stopping:
+                    return
+                index = None
+                if self._preview is not None:
+                    job, self._preview = self._preview, None
+                else:
+                    job, index = self._refine
+                self._refine = None
+                generation, epoch, render, display_size = job
+                pyramid = self._pyramid
+
+            try:
+                if index is None:
+                    index = pyramid.level_index(display_size)
+                source = pyramid.level(index)
+                image = render(source, source_size=pyramid.size) if render is not None else source
+                with self._condition:
+                    if epoch != self._epoch or generation != self._generation:
+                        continue
+                    if render is not None and index > 0:
+                        self._refine = (job, index - 1)
+                self.rendered.emit(generation, self.to_qimage(image, display_size))
+            except Exception as e:
+                error(f"预览渲染失败: {str(e)}")
+                self.failed.emit(generation, str(e))
+
+    @staticmethod
+    def to_qimage(image, display_size=None):
+        """
+        将PIL图片转换为RGB888的 QImage（拥有自己的像素数据）
+        指定显示尺寸时先按比例缩放，只转换显示需要的像素
+        """
+        if display_size and display_size[0] > 0 and display_size[1] > 0:
+            ratio = min(display_size[0] / image.width, display_size[1] / image.height)
+            size = (max(1, round(image.width * ratio)), max(1, round(image.height * ratio)))
+            if size != image.size:
+                if image.mode not in ImageProcessor.RESAMPLE_MODES:
+                    image = image.convert('RGBA')
+                image = image.resize(size, Image.LANCZOS, reducing_gap=ImageProcessor.REDUCING_GAP)
+        image = image.convert('RGB')
+        width, height = image.size
+        return QImage(image.tobytes(), width, height, 3 * width, QImage.Format.Format_RGB888).copy()
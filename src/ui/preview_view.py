@@ -0,0 +1,156 @@
+import math
+from PyQt6.QtCore import Qt, QRectF, pyqtSignal
+from PyQt6.QtGui import QImage, QPixmap, QPainter, QColor
+from PyQt6.QtWidgets import QGraphicsView, QGraphicsScene, QGraphicsPixmapItem, QGraphicsItem
+
+
+def rotated_size(width, height, rotation):
+    """
+    返回宽高为 (width, height) 的图层旋转 rotation 度（扩展画布）后的尺寸
+    """
+    angle = math.radians(rotation)
+    cos, sin = abs(math.cos(angle)), abs(math.sin(angle))
+    return width * cos + height * sin, width * sin + height * cos
+
+
+def layer_to_qimage(layer):
+    """
+    将PIL水印图层转换为保留透明度的 QImage（拥有自己的像素数据）
+    """
+    layer = layer.convert('RGBA')
+    width, height = layer.size
+    return QImage(layer.tobytes(), width, height, 4 * width, QImage.Format.Format_RGBA8888).copy()
+
+
+class WatermarkOverlayItem(QGraphicsPixmapItem):
+    """
+    水印覆盖层，可以用鼠标拖动，松开鼠标时通知预览视图
+    """
+
+    def __init__(self, view):
+        super().__init__()
+        self.view = view
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
+        self.setTransformationMode(Qt.TransformationMode.SmoothTransformation)
+        self.setCursor(Qt.CursorShape.OpenHandCursor)
+        self.setZValue(1)
+
+    def mouseReleaseEvent(self, event):
+        super().mouseReleaseEvent(event)
+        self.view.overlay_released()
+
+
+class PreviewView(QGraphicsView):
+    """
+    分层预览视图
+
+    场景坐标与原图像素坐标一致：底图是渲染线程生成的显示尺寸的图片，按比例放大铺满整张原图；
+    水印作为独立的覆盖层绘制在底图之上，位置、旋转和透明度只修改覆盖层的变换，不需要重新合成图片。
+    水印位置与 Watermark 相同，指旋转后水印外接矩形的左上角。
+    """
+
+    # 拖动水印后发送新位置（原图坐标）
+    overlay_moved = pyqtSignal(int, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setScene(QGraphicsScene(self))
+        self.setRenderHints(QPainter.RenderHint.SmoothPixmapTransform | QPainter.RenderHint.Antialiasing)
+        self.setBackgroundBrush(QColor('#f0f0f0'))
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setAlignment(Qt.AlignmentFlag.AlignCenter)
+
+        self.base_item = QGraphicsPixmapItem()
+        self.base_item.setTransformationMode(Qt.TransformationMode.SmoothTransformation)
+        self.scene().addItem(self.base_item)
+        self.overlay_item = WatermarkOverlayItem(self)
+        self.overlay_item.setVisible(False)
+        self.scene().addItem(self.overlay_item)
+        self.message_item = self.scene().addSimpleText("")
+        self.image_size = None
+
+    def show_message(self, text):
+        """
+        清空预览并显示提示文字
+        """
+        self.image_size = None
+        self.base_item.setPixmap(QPixmap())
+        self.overlay_item.setVisible(False)
+        self.message_item.setText(text)
+        self.message_item.setVisible(True)
+        self.setSceneRect(self.message_item.boundingRect())
+        self.resetTransform()
+
+    def set_image_size(self, width, height):
+        """
+        设置原图尺寸（场景大小）
+        """
+        self.image_size = (width, height)
+        self.message_item.setVisible(False)
+        self.setSceneRect(QRectF(0, 0, width, height))
+        self.fit()
+
+    def set_base(self, q_image):
+        """
+        显示底图，q_image 为按比例缩放到任意尺寸的原图
+        """
+        if self.image_size is None:
+            return
+        self.base_item.setPixmap(QPixmap.fromImage(q_image))
+        self.base_item.setScale(self.image_size[0] / max(1, q_image.width()))
+
+    def set_overlay(self, q_image, position, rotation=0, opacity=1.0):
+        """
+        显示水印覆盖层
+        q_image 为未旋转、不透明度为100%的水印图层（原图像素尺寸），None 表示沿用当前图层；
+        position 为旋转后外接矩形左上角的原图坐标，rotation 与 PIL 相同为逆时针角度，opacity 为0-1
+        """
+        item = self.overlay_item
+        if q_image is not None:
+            item.setPixmap(QPixmap.fromImage(q_image))
+        width, height = item.pixmap().width(), item.pixmap().height()
+        bound_width, bound_height = rotated_size(width, height, rotation)
+        item.setTransformOriginPoint(width / 2, height / 2)
+        item.setRotation(-rotation)
+        item.setOpacity(opacity)
+        item.setPos(position[0] + (bound_width - width) / 2, position[1] + (bound_height - height) / 2)
+        item.setVisible(True)
+
+    def clear_overlay(self):
+        """
+        隐藏水印覆盖层
+        """
+        self.overlay_item.setVisible(False)
+
+    def overlay_position(self):
+        """
+        返回覆盖层旋转后外接矩形左上角的原图坐标
+        """
+        rect = self.overlay_item.sceneBoundingRect()
+        return round(rect.x()), round(rect.y())
+
+    def overlay_released(self):
+        """
+        拖动水印结束
+        """
+        x, y = self.overlay_position()
+        self.overlay_moved.emit(x, y)
+
+    def display_size(self):
+        """
+        底图需要的显示尺寸 (宽, 高)
+        """
+        size = self.viewport().size()
+        return size.width(), size.height()
+
+    def fit(self):
+        """
+        按比例缩放场景以完整显示原图
+        """
+        if self.image_size is not None:
+            self.fitInView(self.sceneRect(), Qt.AspectRatioMode.KeepAspectRatio)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.fit()
@@ -11,6 +11,7 @@ sys.path.append(base_path)
 
 # 导入日志模块
 from .logger import info, warning, error
+from .tracing import traced
 
 class FontManager:
     """
@@ -52,6 +53,7 @@ class FontManager:
         self.local_font_dir = os.path.join(base_path, 'resources', 'fonts')
         info(f"本地字体目录: {self.local_font_dir}")
     
+    @traced('FontManager.load_font', 'font')
     def load_font(self, font_name=None, font_size=24):
         """
         加载指定的字体
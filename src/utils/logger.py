@@ -80,6 +80,17 @@ class Logger:
             except Exception as e:
                 print(f"创建日志目录失败: {str(e)}")
     
+    def set_console_level(self, level):
+        """
+        设置控制台输出的日志级别（文件日志不受影响）
+        level 可以是 logging 级别常量或 'INFO'、'WARNING' 等名称
+        """
+        if isinstance(level, str):
+            level = getattr(logging, level.upper())
+        for handler in self.logger.handlers:
+            if isinstance(handler, logging.StreamHandler) and not isinstance(handler, RotatingFileHandler):
+                handler.setLevel(level)
+    
     def debug(self, message):
         """
         记录调试信息
@@ -133,4 +144,8 @@ def error(message):
 
 
 def critical(message):
-    global_logger.critical(message)
\ No newline at end of file
+    global_logger.critical(message)
+
+
+def set_console_level(level):
+    global_logger.set_console_level(level)
@@ -0,0 +1,303 @@
+import os
+import json
+import time
+import uuid
+import atexit
+import shutil
+import pstats
+import cProfile
+import functools
+import threading
+import multiprocessing
+from multiprocessing import util as mp_util
+from contextlib import contextmanager
+
+from .logger import info, warning
+
+# 环境变量：设置后在导入时自动开启，工作进程通过继承环境变量同步开启
+TRACE_ENV = 'PHOTOWATERMARK_TRACE'
+PROFILE_ENV = 'PHOTOWATERMARK_PROFILE_DIR'
+# 负责合并追踪文件的进程ID（开启追踪的进程），工作进程据此知道自己不是主进程
+OWNER_ENV = 'PHOTOWATERMARK_TRACE_OWNER'
+
+
+class Tracer:
+    """
+    性能追踪器
+    记录各处理阶段的时间段（span），输出 Chrome trace-event 格式的JSON文件，
+    可以在 chrome://tracing 或 Perfetto 中按进程和线程查看时间线；
+    可选地为每个进程保存一份 cProfile 统计。
+
+    每个进程把事件逐行追加到 <追踪文件>.parts/ 下各自的文件中（工作进程随时可能退出，
+    不能依赖进程结束时统一写出），开启追踪的主进程在 finish() 时合并为最终的追踪文件。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.trace_path = None
+        self.profile_dir = None
+        self.is_owner = False
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+        self._named_threads = set()
+        self._profilers = {}
+        self._shared_profiler = False
+
+    def enable(self, trace_path=None, profile_dir=None, owner=True):
+        """
+        开启追踪，trace_path 为追踪文件路径，profile_dir 为 cProfile 统计的保存目录
+        owner 为 True 时由当前进程负责合并追踪文件，并通过环境变量让子进程同步开启
+        """
+        if self.enabled:
+            return
+        if not trace_path and not profile_dir:
+            raise ValueError("追踪文件和性能分析目录至少需要指定一个")
+
+        self.trace_path = os.path.abspath(trace_path) if trace_path else None
+        self.profile_dir = os.path.abspath(profile_dir) if profile_dir else None
+        self.is_owner = owner
+        try:
+            if owner:
+                if self.trace_path:
+                    shutil.rmtree(self._parts_dir(), ignore_errors=True)
+                    os.makedirs(self._parts_dir(), exist_ok=True)
+                    os.environ[TRACE_ENV] = self.trace_path
+                if self.profile_dir:
+                    os.makedirs(self.profile_dir, exist_ok=True)
+                    os.environ[PROFILE_ENV] = self.profile_dir
+                os.environ[OWNER_ENV] = str(os.getpid())
+        except Exception as e:
+            raise Exception(f"开启性能追踪失败: {str(e)}")
+
+        self.enabled = True
+        self._reset_process_state()
+        if owner:
+            atexit.register(self.finish)
+        else:
+            # 工作进程退出时（multiprocessing 的清理阶段）保存 cProfile 统计并关闭文件
+            mp_util.Finalize(self, self._close_process, exitpriority=10)
+        # fork 方式创建的子进程不会重新导入本模块，需要在子进程中重置状态
+        mp_util.register_after_fork(self, Tracer._after_fork)
+        self._ensure_profiler()
+
+    def _parts_dir(self):
+        return self.trace_path + '.parts'
+
+    def _reset_process_state(self):
+        """
+        重置每个进程独立的状态：事件文件、已命名线程和 cProfile
+        """
+        for profiler in self._profilers.values():
+            profiler.disable()
+        self._file = None
+        self._pid = os.getpid()
+        self._named_threads = set()
+        self._profilers = {}
+        self._shared_profiler = False
+
+    def _after_fork(self):
+        """
+        fork 出的工作进程中重新初始化（父进程的文件句柄和 cProfile 不能继续使用）
+        """
+        if not self.enabled:
+            return
+        self._lock = threading.Lock()
+        self.is_owner = False
+        self._reset_process_state()
+        mp_util.Finalize(self, self._close_process, exitpriority=10)
+        self._ensure_profiler()
+
+    def _ensure_profiler(self):
+        """
+        为当前线程启动 cProfile
+        Python 3.12 起 cProfile 同时覆盖所有线程，只能有一个实例，此时只保留第一个
+        """
+        if not self.profile_dir or self._shared_profiler:
+            return
+        thread_id = threading.get_ident()
+        if thread_id in self._profilers:
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            self._shared_profiler = True
+            return
+        self._profilers[thread_id] = profiler
+
+    def _write_event(self, event):
+        """
+        追加一条事件到当前进程的事件文件
+        """
+        with self._lock:
+            if self._file is None:
+                file_name = f"{self._pid}-{uuid.uuid4().hex[:8]}.jsonl"
+                self._file = open(os.path.join(self._parts_dir(), file_name), 'a', encoding='utf-8')
+                self._file.write(json.dumps({
+                    'name': 'process_name', 'ph': 'M', 'pid': self._pid, 'tid': 0,
+                    'args': {'name': f"{multiprocessing.current_process().name} ({self._pid})"}
+                }, ensure_ascii=False) + '\n')
+
+            thread_id = threading.get_native_id()
+            if thread_id not in self._named_threads:
+                self._named_threads.add(thread_id)
+                self._file.write(json.dumps({
+                    'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': thread_id,
+                    'args': {'name': threading.current_thread().name}
+                }, ensure_ascii=False) + '\n')
+
+            event['pid'] = self._pid
+            event['tid'] = thread_id
+            self._file.write(json.dumps(event, ensure_ascii=False, default=str) + '\n')
+            self._file.flush()
+
+    @contextmanager
+    def span(self, name, category='watermark', **args):
+        """
+        记录一个时间段，未开启追踪时不做任何事
+        """
+        if not self.enabled:
+            yield
+            return
+        if self.profile_dir:
+            self._ensure_profiler()
+        if not self.trace_path:
+            yield
+            return
+
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            event = {'name': name, 'cat': category, 'ph': 'X',
+                     'ts': start / 1000, 'dur': (end - start) / 1000}
+            if args:
+                event['args'] = args
+            try:
+                self._write_event(event)
+            except Exception as e:
+                warning(f"写入追踪事件失败: {str(e)}")
+
+    def _close_process(self):
+        """
+        关闭当前进程的事件文件并保存 cProfile 统计
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        self._dump_profile()
+
+    def _dump_profile(self):
+        """
+        合并当前进程各线程的 cProfile 统计并保存为 <进程名>-<进程ID>.prof
+        """
+        if not self.profile_dir or not self._profilers or self._pid != os.getpid():
+            return
+        profilers = list(self._profilers.values())
+        self._profilers = {}
+        try:
+            stats = None
+            for profiler in profilers:
+                profiler.disable()
+                if stats is None:
+                    stats = pstats.Stats(profiler)
+                else:
+                    stats.add(profiler)
+            name = multiprocessing.current_process().name
+            stats.dump_stats(os.path.join(self.profile_dir, f"{name}-{self._pid}.prof"))
+        except Exception as e:
+            warning(f"保存性能分析结果失败: {str(e)}")
+
+    def finish(self):
+        """
+        结束追踪（仅开启追踪的主进程）：保存 cProfile 统计，合并所有进程的事件为最终的追踪文件
+        应在工作进程全部退出后调用
+        """
+        if not self.enabled or not self.is_owner:
+            return
+        self.enabled = False
+        self._close_process()
+        for name in (TRACE_ENV, PROFILE_ENV, OWNER_ENV):
+            os.environ.pop(name, None)
+        if not self.trace_path:
+            return
+
+        parts_dir = self._parts_dir()
+        events = []
+        try:
+            for file_name in sorted(os.listdir(parts_dir)):
+                with open(os.path.join(parts_dir, file_name), 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            events.append(json.loads(line))
+                        except ValueError:
+                            # 进程被强制结束时可能留下写了一半的行
+                            continue
+            with open(self.trace_path, 'w', encoding='utf-8') as f:
+                json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+            shutil.rmtree(parts_dir, ignore_errors=True)
+            info(f"性能追踪已保存: {self.trace_path}, {len(events)} 个事件")
+        except Exception as e:
+            raise Exception(f"保存性能追踪失败: {str(e)}")
+
+
+# 全局追踪器实例
+tracer = Tracer()
+
+
+def enable(trace_path=None, profile_dir=None):
+    """
+    开启性能追踪
+    """
+    tracer.enable(trace_path, profile_dir)
+
+
+def finish():
+    """
+    结束性能追踪并写出追踪文件
+    """
+    tracer.finish()
+
+
+def span(name, category='watermark', **args):
+    """
+    记录一个时间段（上下文管理器）
+    """
+    return tracer.span(name, category, **args)
+
+
+def traced(name, category='watermark'):
+    """
+    装饰器：开启追踪时记录函数的执行时间段
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _enable_from_env():
+    """
+    根据环境变量开启追踪；由其他进程开启时当前进程只负责写出自己的事件
+    """
+    trace_path = os.environ.get(TRACE_ENV)
+    profile_dir = os.environ.get(PROFILE_ENV)
+    if not trace_path and not profile_dir:
+        return
+    owner_pid = os.environ.get(OWNER_ENV)
+    owner = owner_pid is None or owner_pid == str(os.getpid())
+    try:
+        tracer.enable(trace_path, profile_dir, owner=owner)
+    except Exception as e:
+        warning(str(e))
+
+
+_enable_from_env()
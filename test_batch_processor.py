@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量处理测试脚本
+验证BatchProcessor各执行模式的输出和回调行为
+"""
+
+import os
+import json
+import sys
+import tempfile
+import shutil
+import threading
+import time
+import unittest
+import numpy as np
+from PIL import Image, ImageDraw
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from core import compositor
+from core.watermark import Watermark
+from core.batch_processor import BatchProcessor
+from core.pipeline import PipelineStage, StagedPipeline
+from core.job_journal import JobJournal
+from core.output_cache import OutputCache
+
+
+class TestBatchProcessor(unittest.TestCase):
+    """测试类，用于验证BatchProcessor的批量处理功能"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.test_dir, "output")
+
+        # 创建测试图片
+        self.image_paths = []
+        for i in range(6):
+            image = Image.new('RGB', (320, 200), color=(40 * i, 120, 200))
+            draw = ImageDraw.Draw(image)
+            draw.rectangle([(20, 20), (300, 180)], outline='white', width=3)
+            image_path = os.path.join(self.test_dir, f"batch_{i}.jpg")
+            image.save(image_path, quality=90)
+            self.image_paths.append(image_path)
+
+        # 创建水印对象
+        self.watermark = Watermark()
+        self.watermark.set_text_watermark("Batch", font_size=24, opacity=70)
+        self.watermark.set_position("center")
+
+    def tearDown(self):
+        """清理测试资源"""
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def run_batch(self, processor, image_paths, **kwargs):
+        """运行批量处理并等待完成回调"""
+        finished = threading.Event()
+        results = {'progress': [], 'errors': [], 'complete': None}
+
+        def on_progress(progress, image_path=None):
+            results['progress'].append((progress, image_path))
+
+        def on_error(message, image_path=None):
+            results['errors'].append((message, image_path))
+
+        def on_complete(result):
+            results['complete'] = result
+            finished.set()
+
+        processor.set_callbacks(progress_callback=on_progress,
+                                complete_callback=on_complete,
+                                error_callback=on_error)
+        processor.start_processing(image_paths, self.output_dir, self.watermark, **kwargs)
+        self.assertTrue(finished.wait(timeout=60), "批量处理超时")
+        return results
+
+    def expected_outputs(self, image_paths):
+        """计算预期的输出文件路径"""
+        return [os.path.join(self.output_dir,
+                             os.path.splitext(os.path.basename(path))[0] + '.png')
+                for path in image_paths]
+
+    def test_invalid_execution_mode(self):
+        """测试无效的执行模式"""
+        with self.assertRaises(ValueError):
+            BatchProcessor(execution_mode='gpu')
+        with self.assertRaises(ValueError):
+            BatchProcessor(execution_mode='process', max_workers=0)
+        with self.assertRaises(ValueError):
+            BatchProcessor(execution_mode='pipeline').set_pipeline_workers(writer_workers=0)
+
+    def test_parallel_modes_match_thread_mode(self):
+        """测试多进程模式、流水线模式与单线程模式的输出一致"""
+        thread_results = self.run_batch(BatchProcessor(), self.image_paths)
+        thread_outputs = {path: Image.open(path).tobytes()
+                          for path in self.expected_outputs(self.image_paths)}
+        self.assertEqual(thread_results['errors'], [])
+
+        pipeline_processor = BatchProcessor(execution_mode='pipeline')
+        pipeline_processor.set_pipeline_workers(reader_workers=2, compositor_workers=2,
+                                                writer_workers=1, queue_size=1)
+        for processor in (BatchProcessor(execution_mode='process', max_workers=2),
+                          pipeline_processor):
+            shutil.rmtree(self.output_dir)
+            results = self.run_batch(processor, self.image_paths)
+
+            self.assertEqual(results['errors'], [])
+            self.assertEqual(results['complete']['processed_count'], len(self.image_paths))
+            self.assertEqual(results['progress'][-1][0], 100)
+            for path, data in thread_outputs.items():
+                self.assertEqual(Image.open(path).tobytes(), data)
+
+    def test_region_compositing_matches_default_output(self):
+        """测试区域合成模式输出的JPEG与默认模式一致"""
+        self.run_batch(BatchProcessor(), self.image_paths, output_format='JPEG')
+        jpeg_outputs = [os.path.splitext(path)[0] + '.jpg'
+                        for path in self.expected_outputs(self.image_paths)]
+        expected = {path: Image.open(path).tobytes() for path in jpeg_outputs}
+        shutil.rmtree(self.output_dir)
+
+        processor = BatchProcessor()
+        processor.set_region_compositing(True)
+        results = self.run_batch(processor, self.image_paths, output_format='JPEG')
+
+        self.assertEqual(results['errors'], [])
+        for path, data in expected.items():
+            self.assertEqual(Image.open(path).tobytes(), data)
+
+    def test_parallel_compositing_matches_default_output(self):
+        """测试各执行模式下并行合成的输出与默认模式一致"""
+        self.run_batch(BatchProcessor(), self.image_paths)
+        expected = {path: Image.open(path).tobytes() for path in self.expected_outputs(self.image_paths)}
+        shutil.rmtree(self.output_dir)
+
+        # 批量处理器通过 src.core 导入合成引擎，与测试导入的 core 是两份模块，需要同时设置
+        compositors = {compositor, sys.modules['src.core.compositor']}
+        for module in compositors:
+            module.set_parallel_workers(3)
+        try:
+            for mode in BatchProcessor.EXECUTION_MODES:
+                processor = BatchProcessor(execution_mode=mode, max_workers=2)
+                processor.set_parallel_compositing(1)
+                results = self.run_batch(processor, self.image_paths)
+                self.assertEqual(results['errors'], [])
+                for path, data in expected.items():
+                    self.assertEqual(Image.open(path).tobytes(), data)
+                shutil.rmtree(self.output_dir)
+        finally:
+            for module in compositors:
+                module.set_parallel_workers(None)
+
+        with self.assertRaises(ValueError):
+            BatchProcessor().set_parallel_compositing(-1)
+
+    def test_reduced_decoding_matches_full_resize(self):
+        """测试缩小解码模式的输出尺寸正确且与先加水印再缩小的结果接近"""
+        self.run_batch(BatchProcessor(), self.image_paths, resize_percentage=50)
+        outputs = self.expected_outputs(self.image_paths)
+        expected = {path: np.asarray(Image.open(path), dtype=float) for path in outputs}
+        shutil.rmtree(self.output_dir)
+
+        for mode in BatchProcessor.EXECUTION_MODES:
+            processor = BatchProcessor(execution_mode=mode, max_workers=2)
+            processor.set_reduced_decoding(True)
+            results = self.run_batch(processor, self.image_paths, resize_percentage=50)
+            self.assertEqual(results['errors'], [])
+            self.assertEqual(results['complete']['stats']['stages']['resize']['count'], 0)
+            for path, data in expected.items():
+                result = np.asarray(Image.open(path), dtype=float)
+                self.assertEqual(result.shape, data.shape)
+                self.assertLess(np.abs(result - data).mean(), 3)
+            shutil.rmtree(self.output_dir)
+
+    def test_size_grouping(self):
+        """测试按图片尺寸分组处理"""
+        small_path = os.path.join(self.test_dir, "small.jpg")
+        Image.new('RGB', (100, 80), color='red').save(small_path)
+        broken_path = os.path.join(self.test_dir, "broken.jpg")
+        with open(broken_path, 'wb') as f:
+            f.write(b"not an image")
+
+        image_paths = [small_path, self.image_paths[0], broken_path, self.image_paths[1]]
+        self.assertEqual(BatchProcessor._group_by_size(image_paths),
+                         [small_path, self.image_paths[0], self.image_paths[1], broken_path])
+
+        processor = BatchProcessor()
+        results = self.run_batch(processor, image_paths)
+        self.assertEqual([path for _, path in results['progress']],
+                         [small_path, self.image_paths[0], self.image_paths[1]])
+        self.assertEqual([path for _, path in results['errors']], [broken_path])
+
+        processor.set_size_grouping(False)
+        results = self.run_batch(processor, image_paths)
+        self.assertEqual([path for _, path in results['progress']],
+                         [small_path, self.image_paths[0], self.image_paths[1]])
+        self.assertEqual(results['complete']['processed_count'], 3)
+
+    def test_journal_resumes_unfinished_images(self):
+        """测试任务日志跳过已完成的图片，只重新处理改变或缺失的部分"""
+        journal_path = os.path.join(self.test_dir, "job.journal")
+        for mode in ('thread', 'process', 'pipeline'):
+            processor = BatchProcessor(execution_mode=mode, max_workers=2)
+            processor.set_journal(journal_path)
+            results = self.run_batch(processor, self.image_paths)
+            self.assertEqual(results['complete']['processed_count'], len(self.image_paths) if mode == 'thread' else 0)
+
+        # 修改一张输入图片，删除一张输出图片
+        changed_path, missing_path = self.image_paths[1], self.image_paths[4]
+        Image.new('RGB', (320, 200), color='black').save(changed_path, quality=90)
+        stat = os.stat(changed_path)
+        os.utime(changed_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        os.remove(self.expected_outputs([missing_path])[0])
+
+        results = self.run_batch(processor, self.image_paths)
+        complete = results['complete']
+        self.assertEqual(complete['processed_count'], 2)
+        self.assertEqual(complete['skipped_count'], 4)
+        self.assertEqual(complete['total_count'], 6)
+        self.assertEqual(sorted(path for _, path in results['progress']), sorted([changed_path, missing_path]))
+        self.assertEqual(results['progress'][-1][0], 100)
+
+        # 水印配置改变后旧记录作废
+        self.watermark.set_text_watermark("Changed", font_size=24)
+        results = self.run_batch(processor, self.image_paths)
+        self.assertEqual(results['complete']['processed_count'], 6)
+        self.assertEqual(results['complete']['skipped_count'], 0)
+
+    def test_journal_ignores_truncated_record(self):
+        """测试崩溃时写了一半的日志行被忽略"""
+        journal_path = os.path.join(self.test_dir, "job.journal")
+        output_path = os.path.join(self.test_dir, "out.png")
+        open(output_path, 'wb').close()
+
+        journal = JobJournal(journal_path, 'abc').open()
+        journal.record(self.image_paths[0], output_path)
+        journal.close()
+        with open(journal_path, 'a', encoding='utf-8') as f:
+            f.write('{"input": "/partial')
+
+        journal = JobJournal(journal_path, 'abc').open()
+        self.assertTrue(journal.is_completed(self.image_paths[0]))
+        self.assertFalse(journal.is_completed(self.image_paths[1]))
+        journal.record(self.image_paths[1], output_path)
+        journal.close()
+
+        journal = JobJournal(journal_path, 'abc').open()
+        self.assertTrue(journal.is_completed(self.image_paths[1]))
+        journal.close()
+        self.assertFalse(JobJournal(journal_path, 'other').open().is_completed(self.image_paths[0]))
+
+    def test_output_cache_reuses_outputs_across_runs(self):
+        """测试输出缓存在多次运行之间复用输出文件"""
+        cache_dir = os.path.join(self.test_dir, "cache")
+        first_outputs = None
+        for mode in ('thread', 'process', 'pipeline'):
+            processor = BatchProcessor(execution_mode=mode, max_workers=2)
+            processor.set_output_cache(cache_dir)
+            shutil.rmtree(self.output_dir, ignore_errors=True)
+            results = self.run_batch(processor, self.image_paths)
+
+            self.assertEqual(results['errors'], [])
+            self.assertEqual(results['complete']['processed_count'], 6)
+            self.assertEqual(results['complete']['cached_count'], 0 if mode == 'thread' else 6)
+            outputs = {path: Image.open(path).tobytes() for path in self.expected_outputs(self.image_paths)}
+            if first_outputs is None:
+                first_outputs = outputs
+            self.assertEqual(outputs, first_outputs)
+
+        # 输出文件已是缓存文件的硬链接时直接跳过
+        results = self.run_batch(processor, self.image_paths)
+        self.assertEqual(results['complete']['cached_count'], 6)
+
+        # 水印改变后重新生成，且不会改写缓存中的旧文件
+        self.watermark.set_text_watermark("Other", font_size=30)
+        results = self.run_batch(processor, self.image_paths)
+        self.assertEqual(results['complete']['cached_count'], 0)
+        self.watermark.set_text_watermark("Batch", font_size=24, opacity=70)
+        results = self.run_batch(processor, self.image_paths)
+        self.assertEqual(results['complete']['cached_count'], 6)
+        for path, data in first_outputs.items():
+            self.assertEqual(Image.open(path).tobytes(), data)
+
+    def test_process_mode_hashes_inputs_off_dispatcher_thread(self):
+        """测试多进程模式下输入文件的摘要在查询线程池中计算，不在调度线程中串行计算"""
+        missing_path = os.path.join(self.test_dir, "missing.jpg")
+        image_paths = self.image_paths[:3] + [missing_path] + self.image_paths[3:]
+        for run in range(2):
+            processor = BatchProcessor(execution_mode='process', max_workers=2)
+            processor.set_size_grouping(False)
+            processor.set_output_cache(os.path.join(self.test_dir, "cache"))
+            hashing_threads = []
+            input_digest = processor.output_cache.input_digest
+
+            def record_thread(image_path):
+                hashing_threads.append(threading.current_thread().name)
+                return input_digest(image_path)
+
+            processor.output_cache.input_digest = record_thread
+            results = self.run_batch(processor, image_paths)
+
+            self.assertEqual(results['complete']['processed_count'], 6)
+            self.assertEqual(results['complete']['cached_count'], 6 if run else 0)
+            self.assertEqual([path for _, path in results['errors']], [missing_path])
+            self.assertEqual(sorted(path for _, path in results['progress']), sorted(self.image_paths))
+            self.assertEqual(len(hashing_threads), 7)
+            self.assertTrue(all(name.startswith('cache-lookup') for name in hashing_threads))
+
+    def test_output_cache_evicts_least_recently_used(self):
+        """测试输出缓存超出大小上限时按LRU淘汰"""
+        cache_dir = os.path.join(self.test_dir, "cache")
+        output_size = None
+        cache = OutputCache(cache_dir, max_size=10 ** 9, use_links=False)
+        for index, image_path in enumerate(self.image_paths[:3]):
+            output_path = os.path.join(self.test_dir, f"out_{index}.jpg")
+            shutil.copyfile(image_path, output_path)
+            output_size = os.path.getsize(output_path)
+            cache.store(OutputCache.make_key(cache.input_digest(image_path), 'fp'), output_path)
+        cache.save()
+
+        cache = OutputCache(cache_dir, max_size=output_size * 2 + 1, use_links=False)
+        keys = [OutputCache.make_key(cache.input_digest(path), 'fp') for path in self.image_paths[:3]]
+        self.assertTrue(cache.restore(keys[0], os.path.join(self.test_dir, "restored.jpg")))
+        output_path = os.path.join(self.test_dir, "out_3.jpg")
+        shutil.copyfile(self.image_paths[3], output_path)
+        cache.store(OutputCache.make_key(cache.input_digest(self.image_paths[3]), 'fp'), output_path)
+
+        self.assertLessEqual(cache.total_size, cache.max_size)
+        self.assertIn(keys[0], cache.entries)
+        self.assertNotIn(keys[1], cache.entries)
+        self.assertNotIn(keys[2], cache.entries)
+
+    def test_process_mode_reports_errors(self):
+        """测试多进程模式下的错误回调"""
+        broken_path = os.path.join(self.test_dir, "broken.jpg")
+        with open(broken_path, 'wb') as f:
+            f.write(b"not an image")
+
+        processor = BatchProcessor(execution_mode='process', max_workers=2)
+        results = self.run_batch(processor, self.image_paths[:2] + [broken_path])
+
+        self.assertEqual(results['complete']['processed_count'], 2)
+        self.assertEqual(results['complete']['total_count'], 3)
+        self.assertEqual([path for _, path in results['errors']], [broken_path])
+
+
+    def test_stage_stats_in_every_mode(self):
+        """测试各执行模式的分阶段耗时统计和JSON导出"""
+        input_bytes = sum(os.path.getsize(path) for path in self.image_paths)
+        for mode in BatchProcessor.EXECUTION_MODES:
+            processor = BatchProcessor(execution_mode=mode, max_workers=2)
+            results = self.run_batch(processor, self.image_paths, resize_percentage=50)
+            stats = results['complete']['stats']
+
+            self.assertEqual(stats['processed_images'], 6)
+            self.assertEqual(stats['input_megabytes'], round(input_bytes / 1024 / 1024, 3))
+            self.assertGreater(stats['output_megabytes'], 0)
+            self.assertEqual(stats['megapixels'], round(6 * 320 * 200 / 1000000, 3))
+            self.assertGreater(stats['images_per_second'], 0)
+            for stage in ('load', 'watermark', 'resize', 'save'):
+                stage_stats = stats['stages'][stage]
+                self.assertEqual(stage_stats['count'], 6)
+                self.assertLessEqual(stage_stats['p50_seconds'], stage_stats['p95_seconds'])
+                self.assertLessEqual(stage_stats['p95_seconds'], stage_stats['max_seconds'])
+
+        # 不调整大小时没有 resize 阶段；缓存命中只计入图片数和字节数
+        processor = BatchProcessor()
+        processor.set_output_cache(os.path.join(self.test_dir, "cache"))
+        self.run_batch(processor, self.image_paths)
+        stats = self.run_batch(processor, self.image_paths)['complete']['stats']
+        self.assertEqual((stats['images'], stats['cached_images']), (6, 6))
+        self.assertEqual(stats['stages']['load']['count'], 0)
+        self.assertIsNone(stats['stages']['resize']['p50_seconds'])
+
+        stats_path = os.path.join(self.test_dir, "stats.json")
+        processor.export_stats(stats_path)
+        with open(stats_path, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['cached_images'], 6)
+
+
+class TestStagedPipeline(unittest.TestCase):
+    """测试类，用于验证分阶段流水线的背压和错误传递"""
+
+    def test_backpressure_limits_in_flight_items(self):
+        """测试下游变慢时在途任务数量受队列容量限制"""
+        lock = threading.Lock()
+        state = {'in_flight': 0, 'max_in_flight': 0}
+
+        def read(value):
+            with lock:
+                state['in_flight'] += 1
+                state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+            return value
+
+        def write(value):
+            time.sleep(0.002)
+            with lock:
+                state['in_flight'] -= 1
+            return value * 2
+
+        results = {}
+        pipeline = StagedPipeline([
+            PipelineStage('reader', read, workers=2),
+            PipelineStage('writer', write, workers=1)
+        ], queue_size=2)
+        pipeline.run(((i, i) for i in range(50)),
+                     result_callback=lambda key, value: results.__setitem__(key, value))
+
+        self.assertEqual(results, {i: i * 2 for i in range(50)})
+        # 写入阶段的输入队列(2) + 正在写入的任务(1) + 阻塞在put上的读取线程(2)
+        self.assertLessEqual(state['max_in_flight'], 2 + 1 + 2)
+
+    def test_errors_are_reported_per_item(self):
+        """测试阶段异常只影响对应任务"""
+        def read(value):
+            if value == 3:
+                raise ValueError("bad item")
+            return value
+
+        results, errors = [], []
+        pipeline = StagedPipeline([
+            PipelineStage('reader', read, workers=2),
+            PipelineStage('writer', lambda value: value, workers=2)
+        ])
+        pipeline.run(((i, i) for i in range(6)),
+                     result_callback=lambda key, value: results.append(key),
+                     error_callback=lambda key, exc: errors.append(key))
+
+        self.assertEqual(sorted(results), [0, 1, 2, 4, 5])
+        self.assertEqual(errors, [3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量处理统计测试脚本
+验证最近秩百分位数和分阶段耗时汇总
+"""
+
+import os
+import sys
+import unittest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from core.batch_stats import BatchStats, percentile
+
+
+class TestBatchStats(unittest.TestCase):
+    """测试类，用于验证批量处理统计"""
+
+    def test_percentile_nearest_rank(self):
+        """测试最近秩百分位数取排序后第 ceil(p*n) 个值"""
+        self.assertIsNone(percentile([], 0.5))
+        self.assertEqual(percentile([7], 0.5), 7)
+        self.assertEqual(percentile([2, 1], 0.5), 1)
+        self.assertEqual(percentile(list(range(1, 11)), 0.5), 5)
+        self.assertEqual(percentile(list(range(1, 21)), 0.95), 19)
+        self.assertEqual(percentile(list(range(100, 0, -1)), 0.95), 95)
+        self.assertEqual(percentile(list(range(1, 11)), 0), 1)
+        self.assertEqual(percentile(list(range(1, 11)), 1), 10)
+
+    def test_summary_stage_percentiles(self):
+        """测试汇总中各阶段的计数、p50/p95/最大值和数据量"""
+        stats = BatchStats()
+        stats.start()
+        for seconds in range(1, 21):
+            stats.record({'load': seconds, 'save': seconds / 10,
+                          'input_bytes': 1024 * 1024, 'output_bytes': 512 * 1024, 'pixels': 1000000})
+        stats.record_cached(1024 * 1024, 512 * 1024)
+        stats.finish()
+        summary = stats.summary()
+
+        load = summary['stages']['load']
+        self.assertEqual(load['count'], 20)
+        self.assertEqual(load['total_seconds'], 210)
+        self.assertEqual((load['p50_seconds'], load['p95_seconds'], load['max_seconds']), (10, 19, 20))
+        self.assertEqual(summary['stages']['save']['p95_seconds'], 1.9)
+        self.assertEqual(summary['stages']['resize']['count'], 0)
+        self.assertIsNone(summary['stages']['resize']['p50_seconds'])
+
+        self.assertEqual((summary['images'], summary['processed_images'], summary['cached_images']), (21, 20, 1))
+        # 缓存命中的字节数单独统计
+        self.assertEqual((summary['input_megabytes'], summary['cached_input_megabytes']), (20, 1))
+        self.assertEqual((summary['output_megabytes'], summary['cached_output_megabytes']), (10, 0.5))
+        self.assertEqual(summary['megapixels'], 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基准测试脚本的测试
+验证语料生成、结果输出和基线比较
+"""
+
+import os
+import sys
+import json
+import tempfile
+import shutil
+import unittest
+from PIL import Image
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from benchmarks import run_benchmarks
+from benchmarks.corpus import generate_corpus, image_size
+
+
+class TestBenchmarks(unittest.TestCase):
+    """测试类，用于验证基准测试的语料、结果和基线比较"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.test_dir = tempfile.mkdtemp()
+        self.corpus_dir = os.path.join(self.test_dir, "corpus")
+
+    def tearDown(self):
+        """清理测试资源"""
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_corpus_formats_and_sizes(self):
+        """测试语料覆盖各格式和模式，JPEG 只生成RGB"""
+        entries = generate_corpus(self.corpus_dir, [0.02], ['JPEG', 'PNG', 'TIFF'], ['RGB', 'RGBA'])
+        self.assertEqual(sorted((entry['format'], entry['mode']) for entry in entries),
+                         [('JPEG', 'RGB'), ('PNG', 'RGB'), ('PNG', 'RGBA'), ('TIFF', 'RGB'), ('TIFF', 'RGBA')])
+        for entry in entries:
+            with Image.open(entry['path']) as image:
+                self.assertEqual(image.size, image_size(0.02))
+                self.assertEqual(image.mode, entry['mode'])
+
+        # 已存在的语料直接复用
+        mtimes = [os.stat(entry['path']).st_mtime_ns for entry in entries]
+        entries = generate_corpus(self.corpus_dir, [0.02], ['JPEG', 'PNG', 'TIFF'], ['RGB', 'RGBA'])
+        self.assertEqual([os.stat(entry['path']).st_mtime_ns for entry in entries], mtimes)
+
+    def test_run_writes_results_and_detects_regressions(self):
+        """测试运行结果写入JSON，并在超出基线容差时返回退出码1"""
+        output_path = os.path.join(self.test_dir, "results.json")
+        args = ['--sizes', '0.02', '--formats', 'JPEG', '--modes', 'RGB', '--repeat', '1',
+                '--corpus-dir', self.corpus_dir, '--batch-images', '2', '--batch-modes', 'thread']
+        self.assertEqual(run_benchmarks.main(args + ['--output', output_path]), 0)
+
+        with open(output_path, 'r', encoding='utf-8') as f:
+            results = json.load(f)
+        ids = {result['id'] for result in results['results']}
+        for name in run_benchmarks.IMAGE_BENCHMARKS:
+            self.assertIn(f"{name}/-/0.02MP/RGB", ids)
+        self.assertIn("load_image/JPEG/0.02MP/RGB", ids)
+        self.assertIn("save_image/JPEG/0.02MP/RGB", ids)
+        batch = next(result for result in results['results'] if result['name'] == 'batch_thread')
+        self.assertGreater(batch['images_per_second'], 0)
+
+        # 基线中的耗时远小于本次结果时视为回归
+        baseline = json.loads(json.dumps(results))
+        for result in baseline['results']:
+            result['min_seconds'] /= 100
+        baseline_path = os.path.join(self.test_dir, "baseline.json")
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f)
+        self.assertEqual(run_benchmarks.main(args + ['--benchmarks', 'resize_image',
+                                                     '--baseline', baseline_path]), 1)
+
+    def test_compare_results_tolerance(self):
+        """测试基线比较的耗时和内存容差"""
+        baseline = {'results': [
+            {'id': 'a', 'min_seconds': 1.0, 'peak_rss_mb': 100, 'peak_rss_per_case': True},
+            {'id': 'b', 'min_seconds': 1.0, 'peak_rss_mb': 100, 'peak_rss_per_case': False}
+        ]}
+        current = {'results': [
+            {'id': 'a', 'min_seconds': 1.1, 'peak_rss_mb': 140, 'peak_rss_per_case': True},
+            {'id': 'b', 'min_seconds': 1.3, 'peak_rss_mb': 400, 'peak_rss_per_case': False},
+            {'id': 'new', 'min_seconds': 9.0}
+        ]}
+        regressions = run_benchmarks.compare_results(current, baseline, tolerance=0.15, memory_tolerance=0.25)
+        self.assertEqual([(item['id'], item['metric']) for item in regressions],
+                         [('a', 'peak_rss_mb'), ('b', 'min_seconds')])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+命令行入口测试脚本
+验证 python -m src.cli 的批量处理、NDJSON输出以及不依赖PyQt6
+"""
+
+import os
+import sys
+import json
+import tempfile
+import shutil
+import subprocess
+import unittest
+from PIL import Image
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from core.watermark import Watermark
+from utils.template_manager import TemplateManager
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestCommandLine(unittest.TestCase):
+    """测试类，用于验证命令行批量处理"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.test_dir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.test_dir, "input")
+        self.output_dir = os.path.join(self.test_dir, "output")
+        self.templates_dir = os.path.join(self.test_dir, "templates")
+        self.config_dir = os.path.join(self.test_dir, "config")
+        os.makedirs(os.path.join(self.input_dir, "nested"))
+
+        for i in range(3):
+            Image.new('RGB', (160, 120), color=(60 * i, 80, 120)).save(
+                os.path.join(self.input_dir, f"photo_{i}.jpg"))
+        Image.new('RGB', (160, 120), color='white').save(
+            os.path.join(self.input_dir, "nested", "deep.png"))
+        with open(os.path.join(self.input_dir, "notes.txt"), 'w') as f:
+            f.write("not an image")
+
+        watermark = Watermark()
+        watermark.set_text_watermark("CLI", font_size=20, opacity=60)
+        watermark.set_position((12, 8))
+        TemplateManager(self.templates_dir).save_template("cli", watermark)
+
+    def tearDown(self):
+        """清理测试资源"""
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def run_cli(self, *args):
+        """运行命令行并解析标准输出中的NDJSON事件"""
+        completed = subprocess.run(
+            [sys.executable, '-m', 'src.cli'] + list(args) +
+            ['--templates-dir', self.templates_dir, '--config-dir', self.config_dir],
+            cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=120)
+        events = [json.loads(line) for line in completed.stdout.splitlines() if line.strip()]
+        return completed.returncode, events
+
+    def test_batch_emits_ndjson_progress_and_summary(self):
+        """测试批量处理输出进度事件和吞吐量汇总"""
+        returncode, events = self.run_cli('batch', self.input_dir, '-r', '-t', 'cli',
+                                          '-o', self.output_dir, '--workers', '2',
+                                          '--format', 'jpg', '--suffix', '_wm')
+        self.assertEqual(returncode, 0)
+        self.assertEqual(events[0]['event'], 'start')
+        self.assertEqual(events[0]['total'], 4)
+        self.assertEqual([event['event'] for event in events[1:-1]], ['progress'] * 4)
+
+        summary = events[-1]
+        self.assertEqual(summary['event'], 'summary')
+        self.assertEqual(summary['processed'], 4)
+        self.assertEqual(summary['failed'], 0)
+        self.assertGreater(summary['images_per_second'], 0)
+        self.assertEqual(summary['stats']['stages']['save']['count'], 4)
+        self.assertEqual(sorted(os.listdir(self.output_dir)),
+                         ['deep_wm.jpg', 'photo_0_wm.jpg', 'photo_1_wm.jpg', 'photo_2_wm.jpg'])
+
+    def test_batch_resumes_from_journal(self):
+        """测试使用任务日志重新运行时跳过已完成的图片"""
+        journal_path = os.path.join(self.test_dir, "job.journal")
+        args = ('batch', self.input_dir, '-t', 'cli', '-o', self.output_dir, '--journal', journal_path)
+        returncode, events = self.run_cli(*args)
+        self.assertEqual((returncode, events[-1]['processed'], events[-1]['skipped']), (0, 3, 0))
+
+        os.remove(os.path.join(self.output_dir, "photo_1_watermarked.png"))
+        returncode, events = self.run_cli(*args)
+        self.assertEqual((returncode, events[-1]['processed'], events[-1]['skipped']), (0, 1, 2))
+        # 字节吞吐量只统计实际处理的图片
+        input_bytes = os.path.getsize(os.path.join(self.input_dir, "photo_1.jpg"))
+        self.assertEqual(events[-1]['input_megabytes'], round(input_bytes / 1024 / 1024, 3))
+
+    def test_batch_uses_output_cache(self):
+        """测试使用输出缓存时第二次运行全部命中"""
+        cache_dir = os.path.join(self.test_dir, "cache")
+        args = ('batch', self.input_dir, '-t', 'cli', '-o', self.output_dir, '--cache-dir', cache_dir)
+        returncode, events = self.run_cli(*args)
+        self.assertEqual((returncode, events[-1]['processed'], events[-1]['cached']), (0, 3, 0))
+
+        returncode, events = self.run_cli(*args)
+        self.assertEqual((returncode, events[-1]['processed'], events[-1]['cached']), (0, 3, 3))
+        self.assertEqual(events[-1]['input_megabytes'], 0)
+        self.assertGreater(events[-1]['cached_megabytes'], 0)
+
+    def test_batch_reports_errors_and_missing_template(self):
+        """测试处理失败时的错误事件和退出码"""
+        with open(os.path.join(self.input_dir, "broken.jpg"), 'wb') as f:
+            f.write(b"not an image")
+
+        returncode, events = self.run_cli('batch', os.path.join(self.input_dir, '*.jpg'),
+                                          '-t', 'cli', '-o', self.output_dir, '--mode', 'pipeline')
+        self.assertEqual(returncode, 1)
+        self.assertEqual([event['path'] for event in events if event['event'] == 'error'],
+                         [os.path.join(self.input_dir, "broken.jpg")])
+        self.assertEqual(events[-1]['processed'], 3)
+
+        returncode, events = self.run_cli('batch', self.input_dir, '-t', 'missing', '-o', self.output_dir)
+        self.assertEqual(returncode, 2)
+        self.assertEqual(events[-1]['event'], 'fatal')
+
+    def test_preflight_reports_failures_and_prediction(self):
+        """测试预检报告不支持和无法读取的文件，并输出汇总和耗时预测"""
+        with open(os.path.join(self.input_dir, "broken.jpg"), 'wb') as f:
+            f.write(b"not an image")
+
+        completed = subprocess.run(
+            [sys.executable, '-m', 'src.cli', 'preflight', self.input_dir, '-r', '--workers', '2',
+             '--format', 'jpg', '--config-dir', self.config_dir],
+            cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=120)
+        events = [json.loads(line) for line in completed.stdout.splitlines() if line.strip()]
+        self.assertEqual(completed.returncode, 1)
+        self.assertEqual([(event['event'], os.path.basename(event['path'])) for event in events[:-1]],
+                         [('unsupported', 'notes.txt'), ('unreadable', 'broken.jpg')])
+
+        summary = events[-1]
+        self.assertEqual(summary['event'], 'summary')
+        self.assertEqual((summary['files'], summary['images']), (6, 4))
+        self.assertEqual(summary['formats']['JPEG']['count'], 3)
+        self.assertEqual(summary['prediction']['workers'], 2)
+        self.assertEqual(summary['prediction']['output_format'], 'JPEG')
+        self.assertGreater(summary['prediction']['wall_seconds'], 0)
+        self.assertEqual(os.listdir(self.test_dir).count("output"), 0)
+
+    def test_import_does_not_load_pyqt(self):
+        """测试导入命令行模块不会加载PyQt6"""
+        completed = subprocess.run(
+            [sys.executable, '-c',
+             "import sys, src.cli; print(any(name.startswith('PyQt6') for name in sys.modules))"],
+            cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=60)
+        self.assertEqual(completed.stdout.strip(), 'False')
+
+
+    def test_batch_writes_chrome_trace_and_profiles(self):
+        """测试 --trace 合并各工作进程的时间线，--profile-dir 为每个进程保存 cProfile 统计"""
+        trace_path = os.path.join(self.test_dir, "trace.json")
+        profile_dir = os.path.join(self.test_dir, "profiles")
+        returncode, events = self.run_cli('--trace', trace_path, '--profile-dir', profile_dir,
+                                          'batch', self.input_dir, '-t', 'cli', '-o', self.output_dir,
+                                          '--workers', '2')
+        self.assertEqual(returncode, 0)
+
+        with open(trace_path, 'r', encoding='utf-8') as f:
+            trace_events = json.load(f)['traceEvents']
+        spans = [event for event in trace_events if event['ph'] == 'X']
+        self.assertEqual(len([event for event in spans if event['name'] == 'ImageProcessor.save_image']), 3)
+        self.assertEqual({event['name'] for event in spans},
+                         {'process_image', 'ImageProcessor.load_image', 'PreparedWatermark.apply_watermark',
+                          'ImageProcessor.save_image', 'FontManager.load_font'})
+        self.assertTrue(all(event['dur'] >= 0 for event in spans))
+        self.assertFalse(os.path.exists(trace_path + '.parts'))
+
+        worker_pids = {event['pid'] for event in spans}
+        profiles = os.listdir(profile_dir)
+        for pid in worker_pids:
+            self.assertTrue(any(name.endswith(f"-{pid}.prof") for name in profiles))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成引擎测试脚本
+验证NumPy合成引擎与Pillow的 Image.paste 逐像素一致
+"""
+
+import os
+import sys
+import tempfile
+import shutil
+import unittest
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from core import compositor
+from core.image_processor import ImageProcessor
+from core.watermark import Watermark
+
+
+def pillow_tile(image, layer, spacing):
+    """使用Pillow逐个粘贴平铺水印，作为参考结果"""
+    result = image.copy()
+    for x in range(0, image.width, layer.width + spacing):
+        for y in range(0, image.height, layer.height + spacing):
+            result.paste(layer, (x, y), layer)
+    return result
+
+
+def pillow_fade(layer, opacity):
+    """使用Pillow原有方式按透明度缩放图层的alpha"""
+    layer = layer.copy()
+    if opacity != 100:
+        alpha = layer.split()[3]
+        alpha = alpha.point(lambda p: p * opacity / 100)
+        layer.putalpha(alpha)
+    return layer
+
+
+def pillow_paste(image, layer, position, opacity=100):
+    """使用Pillow原有方式粘贴水印，作为参考结果"""
+    result = image.copy()
+    layer = pillow_fade(layer, opacity)
+    result.paste(layer, position, layer)
+    return result
+
+
+class TestCompositor(unittest.TestCase):
+    """测试类，用于验证合成引擎的像素一致性"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.rng = np.random.default_rng(20240601)
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """清理测试资源"""
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def random_image(self, width, height, channels):
+        """生成随机像素图片"""
+        data = self.rng.integers(0, 256, (height, width, channels), dtype=np.uint8)
+        return Image.fromarray(data)
+
+    def assertImagesEqual(self, first, second):
+        """断言两张图片逐像素一致"""
+        self.assertEqual(first.mode, second.mode)
+        self.assertEqual(first.size, second.size)
+        self.assertEqual(first.tobytes(), second.tobytes())
+
+    def test_opacity_lut_matches_point(self):
+        """测试透明度查找表与 point(lambda) 结果一致"""
+        gradient = Image.frombytes('L', (256, 1), bytes(range(256)))
+        for opacity in (0, 1, 33, 50, 99, 100):
+            expected = gradient.point(lambda p: p * opacity / 100).tobytes()
+            self.assertEqual(compositor.opacity_lut(opacity).tobytes(), expected)
+
+    def test_composite_matches_pillow_paste(self):
+        """测试随机图片在各种透明度和位置下与Pillow结果一致"""
+        positions = [(0, 0), (13, 7), (-9, -4), (70, 45), (-30, 20), (200, 200)]
+        for channels in (3, 4):
+            for opacity in (100, 70, 33, 1, 0):
+                base = self.random_image(96, 64, channels)
+                layer = self.random_image(37, 29, 4)
+                for position in positions:
+                    expected = pillow_paste(base, layer, position, opacity)
+                    result = compositor.composite(base.copy(), layer, position, opacity)
+                    self.assertImagesEqual(result, expected)
+
+    def test_prepared_layer_reuse(self):
+        """测试预乘图层可以在多张图片上复用"""
+        layer = self.random_image(20, 20, 4)
+        prepared = compositor.PreparedLayer(layer, opacity=45)
+        for _ in range(3):
+            base = self.random_image(50, 40, 3)
+            self.assertImagesEqual(compositor.composite(base.copy(), prepared, (15, 10)),
+                                   pillow_paste(base, layer, (15, 10), 45))
+
+    def test_text_rendering_matches_pillow(self):
+        """测试抗锯齿文字图层与Pillow结果一致"""
+        layer = Image.new('RGBA', (160, 50), (255, 255, 255, 0))
+        ImageDraw.Draw(layer).text((5, 5), "Watermark", font=ImageFont.load_default(),
+                                   fill=(255, 255, 255, 128))
+        layer = layer.rotate(25, expand=True, resample=Image.BICUBIC)
+        base = self.random_image(300, 200, 4)
+        self.assertImagesEqual(compositor.composite(base.copy(), layer, (40, 30)),
+                               pillow_paste(base, layer, (40, 30)))
+
+    def test_rejects_unsupported_modes(self):
+        """测试合成引擎拒绝非RGB/RGBA图片"""
+        with self.assertRaises(ValueError):
+            compositor.composite(Image.new('L', (10, 10)), Image.new('RGBA', (4, 4)), (0, 0))
+
+    def test_watermark_paths_match_pillow_reference(self):
+        """测试各水印接口与Pillow参考实现一致"""
+        base = self.random_image(240, 160, 4)
+        logo_path = os.path.join(self.test_dir, "logo.png")
+        logo = self.random_image(30, 20, 4)
+        logo.save(logo_path)
+
+        # 图片水印
+        expected_logo = logo.resize((45, 30), Image.LANCZOS).rotate(15, expand=True,
+                                                                    resample=Image.BICUBIC)
+        wm_width, wm_height = expected_logo.size
+        position = ((240 - wm_width) // 2, (160 - wm_height) // 2)
+        self.assertImagesEqual(
+            ImageProcessor.add_image_watermark(base, logo_path, 'center', 40, 1.5, 15),
+            pillow_paste(base, expected_logo, position, 40))
+
+        # 平铺图片水印
+        expected = base.copy()
+        tile = logo.copy()
+        alpha = tile.split()[3].point(lambda p: p * 60 / 100)
+        tile.putalpha(alpha)
+        for x in range(0, 240, 30 + 10):
+            for y in range(0, 160, 20 + 10):
+                expected.paste(tile, (x, y), tile)
+        self.assertImagesEqual(
+            ImageProcessor.add_tiled_image_watermark(base, logo_path, 60, 1.0, 0, 10), expected)
+
+        # Watermark类的文本水印（RGB图片）
+        rgb_base = base.convert('RGB')
+        watermark = Watermark()
+        watermark.set_text_watermark("Engine", font_size=26, opacity=65)
+        watermark.set_style(has_shadow=True, has_stroke=True)
+        watermark.set_rotation(10)
+        layer = watermark.render_layer()
+        position = watermark._calculate_position(240, 160, layer.width, layer.height)
+        self.assertImagesEqual(watermark.apply_watermark(rgb_base),
+                               pillow_paste(rgb_base, layer, position))
+
+
+class TestTiledCompositing(unittest.TestCase):
+    """测试类，用于验证单次平铺合成与逐个粘贴结果一致"""
+
+    def setUp(self):
+        """设置测试环境"""
+        rng = np.random.default_rng(7)
+        self.base = Image.fromarray(rng.integers(0, 256, (170, 230, 4), dtype=np.uint8))
+        self.test_dir = tempfile.mkdtemp()
+        self.logo_path = os.path.join(self.test_dir, "logo.png")
+        self.logo = Image.fromarray(rng.integers(0, 256, (18, 26, 4), dtype=np.uint8))
+        self.logo.save(self.logo_path)
+        ImageProcessor.clear_watermark_cache()
+
+    def tearDown(self):
+        """清理测试资源"""
+        ImageProcessor.clear_watermark_cache()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_tiled_overlay_matches_per_tile_paste(self):
+        """测试平铺条带与逐个粘贴一致（含负间距回退）"""
+        for base in (self.base, self.base.convert('RGB')):
+            for spacing in (0, 7, 50, -5):
+                expected = pillow_tile(base, self.logo, spacing)
+                result = ImageProcessor.add_tiled_image_watermark(base, self.logo_path, 100, 1.0, 0, spacing)
+                self.assertEqual(result.tobytes(), expected.tobytes())
+
+    def test_tiled_text_matches_per_tile_paste(self):
+        """测试平铺文本水印与逐个粘贴一致"""
+        layer = ImageProcessor._render_tiled_text("Tile", None, 18, (0, 128, 0, 64), -15)
+        expected = pillow_tile(self.base, layer, 12)
+        result = ImageProcessor.add_tiled_watermark(self.base, "Tile", font_size=18,
+                                                    font_color=(0, 128, 0, 64), rotation=-15, spacing=12)
+        self.assertEqual(result.tobytes(), expected.tobytes())
+
+    def test_tiled_overlay_is_cached_per_width(self):
+        """测试同宽度图片复用平铺条带"""
+        ImageProcessor.add_tiled_image_watermark(self.base, self.logo_path, 80, 1.0, 0, 10)
+        ImageProcessor.add_tiled_image_watermark(self.base.crop((0, 0, 230, 90)), self.logo_path, 80, 1.0, 0, 10)
+        self.assertEqual(len(ImageProcessor._tiled_overlay_cache), 1)
+
+        ImageProcessor.add_tiled_image_watermark(self.base.crop((0, 0, 120, 90)), self.logo_path, 80, 1.0, 0, 10)
+        self.assertEqual(len(ImageProcessor._tiled_overlay_cache), 2)
+
+    def test_watermark_tiling(self):
+        """测试Watermark平铺设置及预渲染水印的条带复用"""
+        watermark = Watermark()
+        watermark.set_image_watermark(self.logo_path, opacity=70, scale=0.8)
+        watermark.set_tiling(True, spacing=15)
+        # 图片水印的透明度在合成时处理，图层本身不含透明度
+        layer = pillow_fade(watermark.render_layer(), 70)
+
+        prepared = watermark.prepare()
+        for base in (self.base, self.base.convert('RGB')):
+            expected = pillow_tile(base, layer, 15)
+            self.assertEqual(watermark.apply_watermark(base).tobytes(), expected.tobytes())
+            self.assertEqual(prepared.apply_watermark(base).tobytes(), expected.tobytes())
+        self.assertEqual(len(prepared._tiled_overlays), 1)
+
+        restored = Watermark()
+        restored.from_dict(watermark.to_dict())
+        self.assertTrue(restored.tiled)
+        self.assertEqual(restored.tile_spacing, 15)
+
+
+class TestParallelCompositing(unittest.TestCase):
+    """测试类，用于验证大图分条带并行合成与串行结果一致"""
+
+    def setUp(self):
+        """设置测试环境"""
+        rng = np.random.default_rng(11)
+        self.base = Image.fromarray(rng.integers(0, 256, (600, 410, 4), dtype=np.uint8))
+        self.layer = Image.fromarray(rng.integers(0, 256, (350, 300, 4), dtype=np.uint8))
+        compositor.set_parallel_workers(4)
+
+    def tearDown(self):
+        """恢复默认线程数"""
+        compositor.set_parallel_workers(None)
+
+    def test_composite_bands_match_serial(self):
+        """测试按行分条带并行混合与串行结果一致（含越界位置）"""
+        for base in (self.base, self.base.convert('RGB')):
+            for position in ((30, 40), (-50, -20), (200, 400)):
+                expected = compositor.composite(base.copy(), self.layer, position, 70)
+                result = compositor.composite(base.copy(), self.layer, position, 70, parallel_threshold=1)
+                self.assertEqual(result.tobytes(), expected.tobytes())
+
+    def test_watermark_parallel_matches_serial(self):
+        """测试定位水印和平铺水印的并行合成与串行结果一致"""
+        positioned = Watermark()
+        positioned.set_text_watermark("Parallel", font_size=120, opacity=60)
+        positioned.set_rotation(20)
+        tiled = Watermark()
+        tiled.set_text_watermark("Tile", font_size=24, opacity=50)
+        tiled.set_rotation(30)
+        tiled.set_tiling(True, spacing=10)
+
+        for watermark in (positioned, tiled):
+            prepared = watermark.prepare()
+            for base in (self.base, self.base.convert('RGB')):
+                expected = prepared.apply_watermark(base)
+                self.assertEqual(prepared.apply_watermark(base, parallel_threshold=1).tobytes(),
+                                 expected.tobytes())
+                self.assertEqual(watermark.apply_watermark(base, parallel_threshold=1).tobytes(),
+                                 expected.tobytes())
+                in_place = base.copy()
+                prepared.apply_watermark(in_place, in_place=True, parallel_threshold=1)
+                self.assertEqual(in_place.tobytes(), expected.tobytes())
+
+    def test_readonly_image_is_copied_before_dispatch(self):
+        """测试只读图片在分发前复制，各条带写入同一份像素数据"""
+        image = Image.frombuffer('RGBA', self.base.size, self.base.tobytes(), 'raw', 'RGBA', 0, 1)
+        self.assertTrue(image.readonly)
+        expected = compositor.composite(self.base.copy(), self.layer, (10, 10))
+        result = compositor.composite(image, self.layer, (10, 10), parallel_threshold=1)
+        self.assertFalse(result.readonly)
+        self.assertEqual(result.tobytes(), expected.tobytes())
+
+    def test_parallel_threshold_and_workers(self):
+        """测试阈值和线程数决定是否并行合成"""
+        self.assertTrue(compositor._should_parallelize(100, 100))
+        self.assertFalse(compositor._should_parallelize(99, 100))
+        self.assertFalse(compositor._should_parallelize(100, None))
+
+        compositor.set_parallel_workers(1)
+        self.assertFalse(compositor._should_parallelize(100, 1))
+        with self.assertRaises(ValueError):
+            compositor.set_parallel_workers(0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+非破坏性编辑状态测试脚本
+验证渲染配方的应用、替换、撤销/重做以及在原图上重新合成
+"""
+
+import os
+import sys
+import unittest
+from PIL import Image
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from core.watermark import Watermark
+from ui.edit_state import EditState
+
+
+class TestEditState(unittest.TestCase):
+    """测试类，用于验证非破坏性编辑状态"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.image = Image.new('RGBA', (300, 200), color=(30, 90, 160, 255))
+        self.state = EditState(self.image)
+
+    def text_render(self, text, position='center'):
+        """创建文本水印的渲染函数"""
+        watermark = Watermark()
+        watermark.set_text_watermark(text, font_size=30, opacity=80)
+        watermark.set_position(position)
+        return watermark.prepare().apply_watermark
+
+    def test_apply_replaces_same_slot(self):
+        """测试再次应用同一槽位时替换而不是叠加，不同槽位按应用顺序合成"""
+        first = self.text_render("First")
+        second = self.text_render("Second")
+        logo = self.text_render("Logo", 'top-left')
+        self.state.apply('text', first)
+        self.state.apply('image', logo)
+        self.state.apply('text', second)
+        self.assertEqual(self.state.recipe, (('text', second), ('image', logo)))
+
+        expected = logo(second(self.image))
+        self.assertEqual(self.state.render().tobytes(), expected.tobytes())
+        # 原图保持不变
+        self.assertEqual(self.image.getpixel((150, 100)), (30, 90, 160, 255))
+
+    def test_undo_redo(self):
+        """测试撤销/重做在配方之间切换，新的应用丢弃可重做的历史"""
+        self.assertFalse(self.state.undo())
+        self.assertIs(self.state.render(), self.image)
+
+        first = self.text_render("First")
+        second = self.text_render("Second")
+        self.state.apply('text', first)
+        self.state.apply('text', second)
+        self.assertTrue(self.state.undo())
+        self.assertEqual(self.state.recipe, (('text', first),))
+        self.assertTrue(self.state.redo())
+        self.assertEqual(self.state.recipe, (('text', second),))
+
+        self.state.undo()
+        self.state.undo()
+        self.assertEqual(self.state.recipe, ())
+        self.state.apply('text', first)
+        self.assertFalse(self.state.can_redo())
+        self.assertEqual(len(self.state.history), 2)
+
+    def test_remove_and_compose(self):
+        """测试移除槽位以及合并后的渲染函数支持按原图尺寸缩放"""
+        self.state.remove('text')
+        self.assertEqual(len(self.state.history), 1)
+        self.assertIsNone(EditState.compose(()))
+
+        render = self.text_render("Scaled")
+        self.state.apply('text', render)
+        composed = EditState.compose(self.state.recipe)
+        small = self.image.resize((150, 100))
+        self.assertEqual(composed(small, source_size=self.image.size).tobytes(),
+                         render(small, source_size=self.image.size).tobytes())
+
+        self.state.remove('text')
+        self.assertEqual(self.state.recipe, ())
+        self.assertTrue(self.state.undo())
+        self.assertEqual(self.state.recipe, (('text', render),))
+
+
+if __name__ == "__main__":
+    unittest.main()
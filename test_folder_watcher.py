@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+热文件夹监视测试脚本
+验证FolderWatcher的新文件发现、写入去抖和延迟报告
+"""
+
+import os
+import io
+import sys
+import time
+import tempfile
+import shutil
+import threading
+import unittest
+from PIL import Image
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from core.watermark import Watermark
+from core.folder_watcher import FolderWatcher
+
+
+class TestFolderWatcher(unittest.TestCase):
+    """测试类，用于验证热文件夹监视功能"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.test_dir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.test_dir, "input")
+        self.output_dir = os.path.join(self.input_dir, "output")
+        os.makedirs(self.input_dir)
+
+        self.watermark = Watermark()
+        self.watermark.set_text_watermark("Watch", font_size=20, opacity=70)
+
+        self.results = []
+        self.errors = []
+        self.event = threading.Event()
+
+    def tearDown(self):
+        """清理测试资源"""
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def create_watcher(self, **kwargs):
+        """创建使用轮询的监视器并记录回调结果"""
+        options = dict(execution_mode='thread', max_workers=2, settle_time=0.3,
+                       poll_interval=0.05, use_native_events=False)
+        options.update(kwargs)
+        watcher = FolderWatcher([self.input_dir], self.output_dir, self.watermark, **options)
+
+        def on_file(result):
+            self.results.append(result)
+            self.event.set()
+
+        def on_error(message, image_path=None):
+            self.errors.append((message, image_path))
+            self.event.set()
+
+        watcher.set_callbacks(file_callback=on_file, error_callback=on_error)
+        return watcher
+
+    def wait_for_results(self, count, timeout=10):
+        """等待指定数量的处理结果"""
+        deadline = time.time() + timeout
+        while len(self.results) + len(self.errors) < count and time.time() < deadline:
+            self.event.wait(0.05)
+            self.event.clear()
+        return len(self.results) + len(self.errors) >= count
+
+    def image_bytes(self, color):
+        """生成JPEG图片数据"""
+        buffer = io.BytesIO()
+        Image.new('RGB', (200, 150), color=color).save(buffer, format='JPEG')
+        return buffer.getvalue()
+
+    def test_new_files_are_processed_with_latency(self):
+        """测试新文件被处理并报告延迟，已有文件和输出目录被忽略"""
+        Image.new('RGB', (200, 150), color='gray').save(os.path.join(self.input_dir, "existing.jpg"))
+        watcher = self.create_watcher()
+        watcher.start()
+        try:
+            Image.new('RGB', (200, 150), color='red').save(os.path.join(self.input_dir, "new.jpg"))
+            self.assertTrue(self.wait_for_results(1))
+            time.sleep(0.5)
+        finally:
+            watcher.stop()
+
+        self.assertEqual(self.errors, [])
+        self.assertEqual(len(self.results), 1)
+        result = self.results[0]
+        self.assertEqual(result['image_path'], os.path.join(self.input_dir, "new.jpg"))
+        self.assertEqual(result['output_path'], os.path.join(self.output_dir, "new.png"))
+        self.assertGreaterEqual(result['latency'], result['settle'])
+        self.assertGreaterEqual(result['settle'], 0.3)
+        self.assertEqual(os.listdir(self.output_dir), ["new.png"])
+
+    def test_partially_written_file_is_debounced(self):
+        """测试写入中的文件在稳定后才处理，且只处理一次"""
+        data = self.image_bytes('blue')
+        image_path = os.path.join(self.input_dir, "upload.jpg")
+        watcher = self.create_watcher()
+        watcher.start()
+        try:
+            with open(image_path, 'wb') as f:
+                for offset in range(0, len(data), 256):
+                    f.write(data[offset:offset + 256])
+                    f.flush()
+                    time.sleep(0.02)
+            self.assertTrue(self.wait_for_results(1))
+            time.sleep(0.5)
+        finally:
+            watcher.stop()
+
+        self.assertEqual(self.errors, [])
+        self.assertEqual(len(self.results), 1)
+
+    def test_process_pool_and_existing_files(self):
+        """测试常驻进程池处理启动时已有的文件，修改后的文件重新处理"""
+        image_path = os.path.join(self.input_dir, "existing.jpg")
+        with open(image_path, 'wb') as f:
+            f.write(self.image_bytes('green'))
+        watcher = self.create_watcher(execution_mode='process', process_existing=True)
+        watcher.start()
+        try:
+            self.assertTrue(self.wait_for_results(1))
+            with open(image_path, 'wb') as f:
+                f.write(self.image_bytes('yellow') + b'\0')
+            self.assertTrue(self.wait_for_results(2))
+        finally:
+            watcher.stop()
+
+        self.assertEqual(self.errors, [])
+        self.assertEqual(watcher.processed_count, 2)
+
+    def test_output_dir_must_differ_from_input(self):
+        """测试输出目录不能与监视目录相同"""
+        with self.assertRaises(ValueError):
+            FolderWatcher([self.input_dir], self.input_dir, self.watermark)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内存预算调度测试脚本
+验证根据文件头估算内存、按估算值排序以及按预算控制同时处理的图片
+"""
+
+import os
+import sys
+import zlib
+import struct
+import tempfile
+import shutil
+import threading
+import time
+import unittest
+from PIL import Image
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from core.watermark import Watermark
+from core.batch_processor import BatchProcessor
+from core.memory_budget import MemoryEstimator, MemoryBudget, pixel_bytes
+
+
+def write_png_header(path, width, height):
+    """写出只有文件头的RGB PNG（像素数据不完整），用于超过解压炸弹阈值的尺寸"""
+    def chunk(chunk_type, data):
+        return (struct.pack('>I', len(data)) + chunk_type + data
+                + struct.pack('>I', zlib.crc32(chunk_type + data)))
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+                + chunk(b'IDAT', zlib.compress(b'\x00' * 64)) + chunk(b'IEND', b''))
+
+
+class TestMemoryEstimator(unittest.TestCase):
+    """测试类，用于验证根据文件头估算内存"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """清理测试资源"""
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def save(self, name, size, mode='RGB'):
+        """保存测试图片并返回路径"""
+        path = os.path.join(self.test_dir, name)
+        Image.new(mode, size).save(path)
+        return path
+
+    def test_pixel_bytes(self):
+        """测试各模式每像素字节数"""
+        self.assertEqual(pixel_bytes('RGB'), 3)
+        self.assertEqual(pixel_bytes('RGBA'), 4)
+        self.assertEqual(pixel_bytes('L'), 1)
+        self.assertEqual(pixel_bytes('I;16'), 2)
+        self.assertEqual(pixel_bytes('F'), 4)
+
+    def test_estimate_follows_processing_steps(self):
+        """测试估算值包含解码、模式转换、副本和调整大小的缓冲区"""
+        path = self.save("photo.jpg", (400, 300))
+        pixels = 400 * 300
+        # 解码RGB + 转换RGBA + 合成副本
+        self.assertEqual(MemoryEstimator.estimate(path), pixels * (3 + 4 + 4))
+        # 区域合成保留RGB，不复制
+        self.assertEqual(MemoryEstimator.estimate(path, region_compositing=True), pixels * 3)
+        # 调整大小增加输出尺寸的缓冲区
+        self.assertEqual(MemoryEstimator.estimate(path, region_compositing=True, resize_percentage=50),
+                         pixels * 3 + 200 * 150 * 3)
+        # JPEG缩小解码只解码到接近输出尺寸
+        reduced = MemoryEstimator.estimate(path, resize_percentage=25, reduced_decoding=True)
+        self.assertLess(reduced, MemoryEstimator.estimate(path, resize_percentage=25))
+
+        self.assertIsNone(MemoryEstimator.estimate(os.path.join(self.test_dir, "missing.jpg")))
+
+    def test_estimate_strip_processing(self):
+        """测试分条带处理的大图只计条带缓冲区"""
+        path = self.save("scan.png", (400, 300), 'RGBA')
+        full = MemoryEstimator.estimate(path)
+        strips = MemoryEstimator.estimate(path, strip_threshold=1000)
+        self.assertEqual(strips, MemoryEstimator.estimate(path, strip_threshold=1000, output_format='PNG'))
+        self.assertNotEqual(strips, full)
+        self.assertEqual(MemoryEstimator.estimate(path, strip_threshold=1000, output_format='JPEG'), full)
+
+    def test_estimate_above_decompression_bomb_limit(self):
+        """测试超过解压炸弹阈值的大图按文件头估算，而不是当作无法读取"""
+        path = os.path.join(self.test_dir, "huge.png")
+        write_png_header(path, 20000, 10000)
+        with self.assertRaises(Image.DecompressionBombError):
+            Image.open(path)
+        pixels = 20000 * 10000
+        self.assertEqual(MemoryEstimator.estimate(path), pixels * (3 + 4 + 4))
+        strips = MemoryEstimator.estimate(path, strip_threshold=1000)
+        self.assertLess(strips, pixels)
+        self.assertEqual([item[0] for item in MemoryEstimator.schedule([self.save("small.png", (10, 10)), path])][0],
+                         path)
+
+    def test_schedule_largest_first(self):
+        """测试按估算值从大到小排序，相同估算值保持原有顺序，无法读取的图片按 unknown_cost 计算"""
+        broken = os.path.join(self.test_dir, "broken.jpg")
+        with open(broken, 'wb') as f:
+            f.write(b"not an image")
+        small_a = self.save("small_a.jpg", (100, 100))
+        large = self.save("large.jpg", (500, 400))
+        small_b = self.save("small_b.jpg", (100, 100))
+        scheduled = MemoryEstimator.schedule([broken, small_a, large, small_b])
+        self.assertEqual([path for path, _ in scheduled], [large, small_a, small_b, broken])
+        self.assertEqual(scheduled[-1][1], 0)
+
+        # 按预算调度时无法读取的图片按整个预算计算
+        scheduled = MemoryEstimator.schedule([small_a, broken, large], unknown_cost=10 ** 9)
+        self.assertEqual(scheduled[0], (broken, 10 ** 9))
+
+
+class TestMemoryBudget(unittest.TestCase):
+    """测试类，用于验证内存预算的占用和释放"""
+
+    def test_try_acquire_and_release(self):
+        """测试预算不足时拒绝，释放后可以继续占用"""
+        budget = MemoryBudget(100)
+        self.assertTrue(budget.try_acquire(60))
+        self.assertTrue(budget.try_acquire(40))
+        self.assertFalse(budget.try_acquire(1))
+        budget.release(60)
+        self.assertTrue(budget.try_acquire(50))
+        self.assertEqual(budget.peak, 100)
+
+        with self.assertRaises(ValueError):
+            MemoryBudget(0)
+
+    def test_oversized_task_runs_alone(self):
+        """测试超过预算的任务只在没有其他任务时开始"""
+        budget = MemoryBudget(100)
+        self.assertTrue(budget.try_acquire(10))
+        self.assertFalse(budget.try_acquire(500))
+        budget.release(10)
+        self.assertTrue(budget.try_acquire(500))
+        self.assertFalse(budget.try_acquire(0 + 1))
+
+    def test_blocking_acquire(self):
+        """测试阻塞等待直到其他任务释放，取消时放弃等待"""
+        budget = MemoryBudget(100)
+        budget.try_acquire(80)
+        releaser = threading.Timer(0.2, budget.release, args=(80,))
+        releaser.start()
+        start = time.perf_counter()
+        self.assertTrue(budget.acquire(50))
+        self.assertGreaterEqual(time.perf_counter() - start, 0.1)
+        releaser.join()
+
+        cancelled = threading.Event()
+        threading.Timer(0.2, cancelled.set).start()
+        self.assertFalse(budget.acquire(80, cancel_check=cancelled.is_set, poll_interval=0.05))
+        self.assertEqual(budget.in_flight, 50)
+
+
+class TestBatchMemoryBudget(unittest.TestCase):
+    """测试类，用于验证批量处理按内存预算调度"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.test_dir, "output")
+        self.image_paths = []
+        for index, size in enumerate([(120, 90), (600, 450), (200, 150), (120, 90), (400, 300)]):
+            path = os.path.join(self.test_dir, f"image_{index}.jpg")
+            Image.new('RGB', size, (index * 40, 80, 120)).save(path)
+            self.image_paths.append(path)
+        self.watermark = Watermark()
+        self.watermark.set_text_watermark("Budget", font_size=20, opacity=60)
+
+    def tearDown(self):
+        """清理测试资源"""
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def run_batch(self, processor):
+        """运行批量处理并返回 (处理顺序, 完成结果, 错误)"""
+        finished = threading.Event()
+        results = {'order': [], 'errors': [], 'complete': None}
+        processor.set_callbacks(
+            progress_callback=lambda progress, path=None: results['order'].append(path),
+            complete_callback=lambda result: (results.update(complete=result), finished.set()),
+            error_callback=lambda message, path=None: results['errors'].append(message))
+        processor.start_processing(self.image_paths, self.output_dir, self.watermark)
+        self.assertTrue(finished.wait(timeout=60), "批量处理超时")
+        return results
+
+    def test_budget_limits_in_flight_estimates(self):
+        """测试各执行模式下输出与不设预算时一致，同时处理的估算内存不超过预算"""
+        expected_results = self.run_batch(BatchProcessor())
+        outputs = sorted(os.listdir(self.output_dir))
+        expected = {name: Image.open(os.path.join(self.output_dir, name)).tobytes() for name in outputs}
+        shutil.rmtree(self.output_dir)
+        self.assertNotIn('memory', expected_results['complete']['stats'])
+
+        costs = dict(MemoryEstimator.schedule(self.image_paths))
+        largest = max(costs.values())
+        for mode in BatchProcessor.EXECUTION_MODES:
+            processor = BatchProcessor(execution_mode=mode, max_workers=3)
+            processor.set_size_grouping(False)
+            processor.set_memory_budget(largest + 1)
+            results = self.run_batch(processor)
+            self.assertEqual(results['errors'], [])
+            self.assertEqual(sorted(os.listdir(self.output_dir)), outputs)
+            for name, data in expected.items():
+                self.assertEqual(Image.open(os.path.join(self.output_dir, name)).tobytes(), data)
+            shutil.rmtree(self.output_dir)
+
+            memory = results['complete']['stats']['memory']
+            self.assertLessEqual(memory['peak_estimated_megabytes'], (largest + 1) / 1024 / 1024 + 0.001)
+            self.assertGreaterEqual(memory['peak_estimated_megabytes'], round(largest / 1024 / 1024, 3))
+            self.assertEqual(processor._budget.in_flight, 0)
+            if mode == 'thread':
+                # 单线程顺序处理，完成顺序即调度顺序
+                self.assertEqual(results['order'][0], self.image_paths[1])
+                self.assertEqual(results['order'][-1], self.image_paths[3])
+
+    def test_budget_smaller_than_single_image(self):
+        """测试预算小于单张图片时逐张处理，批次仍能完成"""
+        processor = BatchProcessor(execution_mode='pipeline')
+        processor.set_memory_budget(1024)
+        results = self.run_batch(processor)
+        self.assertEqual(results['errors'], [])
+        self.assertEqual(results['complete']['processed_count'], len(self.image_paths))
+        costs = dict(MemoryEstimator.schedule(self.image_paths))
+        self.assertEqual(results['complete']['stats']['memory']['peak_estimated_megabytes'],
+                         round(max(costs.values()) / 1024 / 1024, 3))
+
+        with self.assertRaises(ValueError):
+            processor.set_memory_budget(0)
+
+
+if __name__ == "__main__":
+    unittest.main()
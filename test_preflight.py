@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量任务预检测试脚本
+验证只读取文件头的扫描、统计汇总和耗时预测
+"""
+
+import os
+import sys
+import json
+import zlib
+import struct
+import tempfile
+import shutil
+import unittest
+from PIL import Image
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from core import preflight
+from core.preflight import PreflightScanner, CostModel, size_bucket
+
+
+class TestPreflightScanner(unittest.TestCase):
+    """测试类，用于验证文件头扫描和汇总"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.test_dir = tempfile.mkdtemp()
+        self.paths = []
+        for index, (name, size) in enumerate([("a.jpg", (1000, 800)), ("b.png", (2000, 1500)),
+                                               ("c.tif", (300, 200)), ("d.jpg", (500, 400))]):
+            path = os.path.join(self.test_dir, name)
+            Image.new('RGB', size, (index * 50, 0, 0)).save(path)
+            self.paths.append(path)
+        self.broken = os.path.join(self.test_dir, "broken.jpg")
+        with open(self.broken, 'wb') as f:
+            f.write(b"not an image")
+        self.notes = os.path.join(self.test_dir, "notes.txt")
+        with open(self.notes, 'w') as f:
+            f.write("notes")
+
+    def tearDown(self):
+        """清理测试资源"""
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_scan_file_status(self):
+        """测试扫描结果区分正常、不支持和无法读取的文件"""
+        record = PreflightScanner.scan_file(self.paths[1])
+        self.assertEqual((record['status'], record['format'], record['width'], record['height']),
+                         ('ok', 'PNG', 2000, 1500))
+        self.assertEqual(PreflightScanner.scan_file(self.notes)['status'], 'unsupported')
+        record = PreflightScanner.scan_file(self.broken)
+        self.assertEqual(record['status'], 'unreadable')
+        self.assertTrue(record['error'])
+        self.assertEqual(PreflightScanner.scan_file(os.path.join(self.test_dir, "missing.jpg"))['status'],
+                         'unreadable')
+
+    def test_parallel_scan_keeps_order(self):
+        """测试分批并行扫描的结果与输入顺序一致"""
+        paths = (self.paths + [self.broken, self.notes]) * 3
+        original = preflight.SCAN_CHUNK_SIZE
+        preflight.SCAN_CHUNK_SIZE = 4
+        try:
+            records = PreflightScanner.scan(paths, workers=3)
+        finally:
+            preflight.SCAN_CHUNK_SIZE = original
+        self.assertEqual([record['path'] for record in records], paths)
+        self.assertEqual(records, PreflightScanner.scan(paths, workers=1))
+
+    def test_summary_counts_and_prediction(self):
+        """测试汇总各格式、尺寸区间、总像素数和失败的文件"""
+        summary = PreflightScanner.run(self.paths + [self.broken, self.notes], workers=2,
+                                       output_format='jpeg')
+        self.assertEqual((summary['files'], summary['images']), (6, 4))
+        self.assertEqual(summary['formats']['JPEG'], {'count': 2, 'megapixels': 1.0})
+        self.assertEqual(summary['formats']['PNG'], {'count': 1, 'megapixels': 3.0})
+        self.assertEqual(summary['sizes'], {'<1MP': 3, '1-4MP': 1})
+        self.assertEqual(summary['megapixels'], 4.06)
+        self.assertEqual(summary['largest']['path'], self.paths[1])
+        self.assertEqual(summary['unsupported'], [self.notes])
+        self.assertEqual([item['path'] for item in summary['unreadable']], [self.broken])
+
+        prediction = summary['prediction']
+        self.assertEqual((prediction['workers'], prediction['output_format']), (2, 'JPEG'))
+        self.assertGreater(prediction['cpu_seconds'], 0)
+        self.assertLess(prediction['wall_seconds'], prediction['cpu_seconds'])
+        self.assertGreaterEqual(summary['scan_seconds'], 0)
+
+        # 缩小输出减少保存耗时，PNG输出比JPEG慢
+        resized = PreflightScanner.run(self.paths, output_format='JPEG', resize_percentage=10)
+        png = PreflightScanner.run(self.paths, output_format='PNG')
+        self.assertGreater(png['prediction']['cpu_seconds'], prediction['cpu_seconds'])
+        self.assertNotEqual(resized['prediction']['cpu_seconds'], prediction['cpu_seconds'])
+
+    def test_image_above_decompression_bomb_limit(self):
+        """测试超过解压炸弹阈值的大图读取文件头，能分条带处理时计入预测，否则报告为过大"""
+        def chunk(chunk_type, data):
+            return (struct.pack('>I', len(data)) + chunk_type + data
+                    + struct.pack('>I', zlib.crc32(chunk_type + data)))
+        huge = os.path.join(self.test_dir, "huge.png")
+        with open(huge, 'wb') as f:
+            f.write(b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 20000, 10000, 8, 2, 0, 0, 0))
+                    + chunk(b'IDAT', zlib.compress(b'\x00' * 64)) + chunk(b'IEND', b''))
+
+        record = PreflightScanner.scan_file(huge)
+        self.assertEqual((record['status'], record['width'], record['height']), ('ok', 20000, 10000))
+
+        summary = PreflightScanner.run([huge, self.paths[0]], output_format='PNG')
+        self.assertEqual(summary['too_large'], [{'path': huge, 'megapixels': 200.0}])
+        self.assertEqual((summary['images'], summary['strip_images']), (1, 0))
+
+        summary = PreflightScanner.run([huge, self.paths[0]], output_format='PNG', strip_threshold=50000000)
+        self.assertEqual((summary['too_large'], summary['images'], summary['strip_images']), ([], 2, 1))
+        self.assertEqual(summary['largest']['path'], huge)
+        # JPEG输出不能分条带处理
+        summary = PreflightScanner.run([huge], output_format='JPEG', strip_threshold=50000000)
+        self.assertEqual(len(summary['too_large']), 1)
+
+    def test_size_bucket(self):
+        """测试尺寸区间边界"""
+        self.assertEqual(size_bucket(0.5), '<1MP')
+        self.assertEqual(size_bucket(1), '1-4MP')
+        self.assertEqual(size_bucket(99.9), '50-100MP')
+        self.assertEqual(size_bucket(150), '>=100MP')
+
+
+class TestCostModel(unittest.TestCase):
+    """测试类，用于验证耗时模型的校准和预测"""
+
+    def test_wall_seconds_largest_first(self):
+        """测试按从大到小分配给最先空闲的工作进程"""
+        self.assertEqual(CostModel.wall_seconds([5, 1, 1, 1, 1, 1], 2), 5)
+        self.assertEqual(CostModel.wall_seconds([3, 3, 2, 2, 2], 2), 7)
+        self.assertEqual(CostModel.wall_seconds([1, 2, 3], 1), 6)
+        self.assertEqual(CostModel.wall_seconds([], 4), 0)
+
+    def test_image_seconds(self):
+        """测试单张图片耗时按阶段累加"""
+        model = CostModel({'load': {'JPEG': 0.1}, 'save': {'PNG': 0.2}, 'watermark': 0.01,
+                           'resize': 0.05, 'overhead': 0.0})
+        self.assertAlmostEqual(model.image_seconds('JPEG', 10, 'PNG'), 10 * 0.11 + 10 * 0.2)
+        self.assertAlmostEqual(model.image_seconds('JPEG', 10, 'png', output_megapixels=2),
+                               10 * 0.11 + 2 * 0.05 + 2 * 0.2)
+        self.assertAlmostEqual(model.image_seconds('GIF', 1, 'PNG'), CostModel.FALLBACK_COST + 0.01 + 0.2)
+        # 未覆盖的格式保留默认值
+        self.assertEqual(model.costs['load']['PNG'], CostModel.DEFAULT_COSTS['load']['PNG'])
+
+    def test_calibration_from_benchmark_results(self):
+        """测试根据基准测试结果计算每百万像素耗时的中位数"""
+        results = {'results': [
+            {'name': 'load_image', 'format': 'JPEG', 'megapixels': 1, 'min_seconds': 0.02},
+            {'name': 'load_image', 'format': 'JPEG', 'megapixels': 4, 'min_seconds': 0.12},
+            {'name': 'load_image', 'format': 'JPEG', 'megapixels': 12, 'min_seconds': 0.48},
+            {'name': 'save_image', 'format': 'PNG', 'megapixels': 2, 'min_seconds': 1.0},
+            {'name': 'prepared_apply', 'format': '-', 'megapixels': 4, 'min_seconds': 0.008},
+            {'name': 'batch_thread', 'format': 'JPEG', 'megapixels': 1, 'min_seconds': 9.0}
+        ]}
+        test_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(test_dir, "results.json")
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(results, f)
+            model = CostModel.from_benchmark_results(path)
+            with self.assertRaises(Exception):
+                CostModel.from_benchmark_results(os.path.join(test_dir, "missing.json"))
+        finally:
+            shutil.rmtree(test_dir, ignore_errors=True)
+
+        self.assertEqual(model.costs['load']['JPEG'], 0.03)
+        self.assertEqual(model.costs['save']['PNG'], 0.5)
+        self.assertEqual(model.costs['watermark'], 0.002)
+        self.assertEqual(model.costs['resize'], CostModel.DEFAULT_COSTS['resize'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分条带处理测试脚本
+验证大图按条带读取、合成、写出的结果与整图处理一致
+"""
+
+import os
+import sys
+import tempfile
+import shutil
+import threading
+import unittest
+import numpy as np
+from PIL import Image
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from core.watermark import Watermark
+from core.image_processor import ImageProcessor
+from core.batch_processor import BatchProcessor
+from core.strip_processor import StripProcessor, PNGStripWriter, open_strip_reader
+
+
+class TestStripProcessor(unittest.TestCase):
+    """测试类，用于验证分条带读取、水印合成和PNG写出"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.test_dir, "output")
+        rng = np.random.default_rng(7)
+        self.pixels = rng.integers(0, 256, (403, 517, 4), dtype=np.uint8)
+        # 平坦区域使各种滤波都会被选中
+        self.pixels[:, :200] = (30, 60, 90, 255)
+
+        self.watermark = Watermark()
+        self.watermark.set_text_watermark("Strip", font_size=40, opacity=70)
+        self.watermark.set_position("center")
+
+    def tearDown(self):
+        """清理测试资源"""
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def save(self, name, mode='RGBA', **kwargs):
+        """保存测试图片并返回路径"""
+        channels = {'L': 1, 'LA': 2, 'RGB': 3, 'RGBA': 4}[mode]
+        data = self.pixels[:, :, :channels]
+        image = Image.fromarray(data[:, :, 0] if channels == 1 else data, mode)
+        path = os.path.join(self.test_dir, name)
+        image.save(path, **kwargs)
+        return path
+
+    def assert_bands_match(self, path, rows):
+        """按条带读取后拼接的图片与整图解码一致"""
+        reader = open_strip_reader(path)
+        with Image.open(path) as expected:
+            expected.load()
+            canvas = Image.new(expected.mode, expected.size)
+            tops = []
+            for top, band in reader.bands(rows):
+                self.assertEqual(band.mode, expected.mode)
+                canvas.paste(band, (0, top))
+                tops.append(top)
+            self.assertGreater(len(tops), 1)
+            self.assertEqual(canvas.tobytes(), expected.tobytes())
+
+    def test_png_bands(self):
+        """测试各颜色类型的PNG按条带读取"""
+        for mode in ('L', 'LA', 'RGB', 'RGBA'):
+            self.assert_bands_match(self.save(f"{mode}.png", mode), 37)
+        palette_path = os.path.join(self.test_dir, "palette.png")
+        Image.fromarray(self.pixels[:, :, :3]).convert('P').save(palette_path, transparency=0)
+        self.assert_bands_match(palette_path, 50)
+
+    def test_tiff_bands(self):
+        """测试不同压缩方式的TIFF按原始条带或按行读取"""
+        for compression in (None, 'tiff_lzw', 'tiff_adobe_deflate', 'packbits', 'jpeg'):
+            mode = 'RGB' if compression == 'jpeg' else 'RGBA'
+            path = self.save(f"{compression}.tif", mode, compression=compression, strip_size=8192)
+            self.assert_bands_match(path, 29)
+
+    def test_unsupported_inputs(self):
+        """测试隔行扫描PNG和JPEG不支持分条带读取"""
+        interlaced = os.path.join(self.test_dir, "interlaced.png")
+        with open(self.save("plain.png"), 'rb') as f:
+            data = bytearray(f.read())
+        # 构造隔行扫描的IHDR后只检查文件头，不需要合法的像素数据
+        data[28] = 1
+        with open(interlaced, 'wb') as f:
+            f.write(data)
+        with self.assertRaises(ValueError):
+            open_strip_reader(interlaced).check()
+        self.assertIsNone(open_strip_reader(self.save("photo.jpg", 'RGB')))
+
+    def test_writer_round_trip(self):
+        """测试分条带写出的PNG可以被完整读取"""
+        for mode in ('L', 'LA', 'RGB', 'RGBA'):
+            source = Image.open(self.save(f"{mode}.png", mode))
+            path = os.path.join(self.test_dir, f"written_{mode}.png")
+            writer = PNGStripWriter(path, source.size, mode)
+            for top in range(0, source.height, 100):
+                writer.write(source.crop((0, top, source.width, min(top + 100, source.height))))
+            writer.close()
+            self.assertFalse(os.path.exists(path + '.part'))
+            with Image.open(path) as result:
+                self.assertEqual(result.tobytes(), source.tobytes())
+
+        writer = PNGStripWriter(os.path.join(self.test_dir, "short.png"), (10, 10), 'RGB')
+        writer.write(Image.new('RGB', (10, 5)))
+        with self.assertRaises(ValueError):
+            writer.close()
+        writer.abort()
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, "short.png.part")))
+
+    def test_process_matches_whole_image(self):
+        """测试分条带处理的输出像素与整图添加水印一致"""
+        tiled = Watermark()
+        tiled.set_text_watermark("Tile", font_size=30, opacity=60)
+        tiled.set_rotation(30)
+        tiled.set_tiling(True, spacing=20)
+        relative = Watermark()
+        relative.set_text_watermark("Relative", font_size=30, opacity=60)
+        relative.set_position("bottom_right")
+        relative.set_relative_size(0.3)
+
+        for name, mode in (("rgba.png", 'RGBA'), ("rgb.tif", 'RGB'), ("gray.png", 'LA')):
+            path = self.save(name, mode, **({'compression': 'tiff_lzw'} if name.endswith('.tif') else {}))
+            for watermark in (self.watermark, tiled, relative):
+                for keep_native_mode in (False, True):
+                    image = ImageProcessor.load_image(path, keep_native_mode=keep_native_mode)
+                    expected = watermark.prepare().apply_watermark(image)
+
+                    output_path = os.path.join(self.test_dir, "strips.png")
+                    timings = {}
+                    StripProcessor.process(path, output_path, watermark, keep_native_mode=keep_native_mode,
+                                           strip_bytes=517 * 4 * 45, timings=timings)
+                    with Image.open(output_path) as result:
+                        self.assertEqual(result.mode, expected.mode)
+                        self.assertEqual(result.tobytes(), expected.tobytes())
+                    self.assertEqual(timings['pixels'], 517 * 403)
+                    self.assertGreater(timings['output_bytes'], 0)
+
+    def test_can_process(self):
+        """测试只有超过阈值且可以分条带读取和写出的图片才分条带处理"""
+        path = self.save("large.png")
+        pixels = 517 * 403
+        self.assertTrue(StripProcessor.can_process(path, pixels - 1, 'PNG'))
+        self.assertFalse(StripProcessor.can_process(path, pixels, 'PNG'))
+        self.assertFalse(StripProcessor.can_process(path, 0, 'JPEG'))
+        self.assertFalse(StripProcessor.can_process(path, 0, 'PNG', resizing=True))
+        self.assertFalse(StripProcessor.can_process(self.save("photo.jpg", 'RGB'), 0, 'PNG'))
+
+    def test_batch_processor_strip_threshold(self):
+        """测试批量处理在各执行模式下对大图分条带处理，输出与整图处理一致"""
+        image_paths = [self.save("scan.tif", 'RGB', compression='tiff_lzw'), self.save("small.jpg", 'RGB')]
+
+        def run(processor):
+            finished = threading.Event()
+            results = {'errors': [], 'complete': None}
+            processor.set_callbacks(complete_callback=lambda result: (results.update(complete=result),
+                                                                      finished.set()),
+                                    error_callback=lambda message, path=None: results['errors'].append(message))
+            processor.start_processing(image_paths, self.output_dir, self.watermark)
+            self.assertTrue(finished.wait(timeout=60), "批量处理超时")
+            self.assertEqual(results['errors'], [])
+            outputs = {}
+            for name in ("scan.png", "small.png"):
+                with Image.open(os.path.join(self.output_dir, name)) as image:
+                    outputs[name] = image.tobytes()
+            shutil.rmtree(self.output_dir)
+            return outputs, results['complete']
+
+        expected, _ = run(BatchProcessor())
+        for mode in BatchProcessor.EXECUTION_MODES:
+            processor = BatchProcessor(execution_mode=mode, max_workers=2)
+            processor.set_strip_processing(100000)
+            outputs, result = run(processor)
+            self.assertEqual(outputs, expected)
+            self.assertEqual(result['stats']['processed_images'], 2)
+
+        with self.assertRaises(ValueError):
+            BatchProcessor().set_strip_processing(-1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+水印渲染测试脚本
+验证预渲染、缓存等优化路径与原始渲染结果逐像素一致
+"""
+
+import os
+import sys
+import tempfile
+import shutil
+import unittest
+import numpy as np
+from PIL import Image, ImageDraw
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from core.image_processor import ImageProcessor
+from core.watermark import Watermark, PreparedWatermark
+
+
+class TestWatermarkRendering(unittest.TestCase):
+    """测试类，用于验证水印渲染优化的正确性"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.test_dir = tempfile.mkdtemp()
+        self.temp_watermark_path = os.path.join(self.test_dir, "test_watermark.png")
+
+        # 创建测试图片
+        self.image = Image.new('RGBA', (400, 260), color=(30, 90, 160, 255))
+        draw = ImageDraw.Draw(self.image)
+        draw.ellipse([(40, 30), (360, 230)], fill=(220, 200, 60, 255))
+
+        # 创建测试水印图片
+        logo = Image.new('RGBA', (80, 40), color=(255, 255, 255, 0))
+        draw = ImageDraw.Draw(logo)
+        draw.rectangle([(5, 5), (75, 35)], fill=(255, 0, 0, 160), outline='black', width=2)
+        logo.save(self.temp_watermark_path)
+
+    def tearDown(self):
+        """清理测试资源"""
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def assertImagesEqual(self, first, second):
+        """断言两张图片逐像素一致"""
+        self.assertEqual(first.mode, second.mode)
+        self.assertEqual(first.size, second.size)
+        self.assertEqual(first.tobytes(), second.tobytes())
+
+    def test_prepared_text_watermark_matches(self):
+        """测试预渲染文本水印与直接应用的结果一致"""
+        watermark = Watermark()
+        watermark.set_text_watermark("Prepared", font_size=32, opacity=80)
+        watermark.set_rotation(20)
+        watermark.set_style(has_shadow=True, has_stroke=True)
+
+        prepared = watermark.prepare()
+        self.assertIsInstance(prepared, PreparedWatermark)
+        for position in ('top-left', 'center', 'bottom-right', (15, 25)):
+            watermark.set_position(position)
+            prepared = watermark.prepare()
+            self.assertImagesEqual(prepared.apply_watermark(self.image),
+                                   watermark.apply_watermark(self.image))
+
+    def test_prepared_image_watermark_matches(self):
+        """测试预渲染图片水印与直接应用的结果一致"""
+        watermark = Watermark()
+        watermark.set_image_watermark(self.temp_watermark_path, opacity=40, scale=1.5)
+        watermark.set_rotation(30)
+        watermark.set_position('center')
+
+        prepared = watermark.prepare()
+        self.assertImagesEqual(prepared.apply_watermark(self.image),
+                               watermark.apply_watermark(self.image))
+
+    def test_region_compositing_matches_full_copy(self):
+        """测试区域合成（原地、RGB）与整图复制合成的颜色结果一致"""
+        rgb_image = self.image.convert('RGB')
+        watermark = Watermark()
+        watermark.set_text_watermark("Region", font_size=28, opacity=60)
+        watermark.set_style(has_stroke=True)
+
+        for position in ('center', 'top-left', (-15, -8), (380, 245)):
+            watermark.set_position(position)
+            expected = watermark.apply_watermark(self.image).convert('RGB')
+            target = rgb_image.copy()
+            result = watermark.apply_watermark(target, in_place=True)
+            self.assertIs(result, target)
+            self.assertImagesEqual(result, expected)
+            self.assertImagesEqual(watermark.prepare().apply_watermark(rgb_image.copy(), in_place=True),
+                                   expected)
+
+        target = rgb_image.copy()
+        ImageProcessor.add_image_watermark(target, self.temp_watermark_path, 'bottom-left',
+                                           opacity=40, scale=1.2, rotation=10, in_place=True)
+        expected = ImageProcessor.add_image_watermark(self.image, self.temp_watermark_path, 'bottom-left',
+                                                      opacity=40, scale=1.2, rotation=10)
+        self.assertImagesEqual(target, expected.convert('RGB'))
+
+    def test_prepared_watermark_is_a_snapshot(self):
+        """测试预渲染水印不受原配置后续修改的影响"""
+        watermark = Watermark()
+        watermark.set_text_watermark("Snapshot", font_size=24)
+        prepared = watermark.prepare()
+        expected = prepared.apply_watermark(self.image)
+
+        watermark.set_text_watermark("Changed", font_size=40)
+        self.assertImagesEqual(prepared.apply_watermark(self.image), expected)
+        self.assertIs(prepared.prepare(), prepared)
+
+    def test_positioned_overlays_cached_per_size(self):
+        """测试已定位叠加层按 (宽, 高, 模式) 缓存复用"""
+        watermark = Watermark()
+        watermark.set_text_watermark("Bucket", font_size=26, opacity=70)
+        watermark.set_position('bottom-right')
+        prepared = watermark.prepare()
+
+        images = [self.image, self.image.copy(), self.image.convert('RGB'),
+                  self.image.crop((0, 0, 300, 200))]
+        for image in images:
+            self.assertImagesEqual(prepared.apply_watermark(image), watermark.apply_watermark(image))
+        self.assertEqual(len(prepared._overlays), 3)
+        self.assertIs(prepared.overlay_for(images[0]), prepared.overlay_for(images[1]))
+
+        # 水印完全落在图片之外
+        watermark.set_position((500, 500))
+        self.assertImagesEqual(watermark.prepare().apply_watermark(self.image), self.image)
+
+    def test_relative_size_watermark(self):
+        """测试按图片宽度比例缩放的水印"""
+        watermark = Watermark()
+        watermark.set_image_watermark(self.temp_watermark_path, opacity=60)
+        watermark.set_relative_size(0.25)
+        watermark.set_position('center')
+        self.assertEqual(watermark.render_layer(self.image.size).size, (100, 50))
+        self.assertEqual(watermark.render_layer((200, 130)).size, (50, 25))
+
+        prepared = watermark.prepare()
+        for image in (self.image, self.image.resize((200, 130)), self.image.convert('RGB')):
+            self.assertImagesEqual(prepared.apply_watermark(image), watermark.apply_watermark(image))
+            target = image.convert('RGB')
+            self.assertImagesEqual(prepared.apply_watermark(target.copy(), in_place=True),
+                                   watermark.apply_watermark(target.copy(), in_place=True))
+        self.assertEqual(len(prepared._scaled_layers), 2)
+
+        with self.assertRaises(ValueError):
+            watermark.set_relative_size(1.5)
+
+
+    def test_scaled_watermark_matches_downsized_result(self):
+        """测试在缩小后的图片上添加缩放水印与先加水印再缩小的效果一致"""
+        source = self.image.resize((1200, 780))
+        small_size = (300, 195)
+        for tiled in (False, True):
+            watermark = Watermark()
+            watermark.set_text_watermark("Scaled", font_size=90, opacity=80)
+            watermark.set_style(has_shadow=True, has_stroke=True)
+            watermark.set_rotation(15)
+            watermark.set_position('bottom-right')
+            watermark.set_tiling(tiled, spacing=60)
+            expected = np.asarray(watermark.apply_watermark(source).resize(small_size, Image.LANCZOS), dtype=float)
+
+            small = source.resize(small_size, Image.LANCZOS)
+            prepared = watermark.prepare()
+            results = [watermark.apply_watermark(small, source_size=source.size),
+                       prepared.apply_watermark(small, source_size=source.size),
+                       prepared.apply_watermark(small.convert('RGB'), in_place=True, source_size=source.size)]
+            for result in results:
+                difference = np.abs(np.asarray(result.convert('RGBA'), dtype=float) - expected)
+                self.assertLess(difference.mean(), 3)
+
+            # 原图尺寸与图片尺寸相同时与普通添加一致
+            self.assertImagesEqual(prepared.apply_watermark(source, source_size=source.size),
+                                   watermark.apply_watermark(source))
+
+    def test_scaled_tiled_watermark_matches_downsized_result(self):
+        """测试平铺文本和平铺图片水印按原图尺寸缩放后与先加水印再缩小的效果一致"""
+        source = self.image.resize((1200, 780))
+        small_size = (300, 195)
+        small = source.resize(small_size, Image.LANCZOS)
+        renders = [
+            lambda image, source_size=None: ImageProcessor.add_tiled_watermark(
+                image, "Tile", font_size=60, font_color=(255, 255, 255, 160), rotation=20, spacing=80,
+                source_size=source_size),
+            lambda image, source_size=None: ImageProcessor.add_tiled_image_watermark(
+                image, self.temp_watermark_path, opacity=70, scale=2.0, rotation=10, spacing=40,
+                source_size=source_size)
+        ]
+        for render in renders:
+            expected = np.asarray(render(source).resize(small_size, Image.LANCZOS), dtype=float)
+            difference = np.abs(np.asarray(render(small, source_size=source.size), dtype=float) - expected)
+            self.assertLess(difference.mean(), 3)
+            self.assertImagesEqual(render(source, source_size=source.size), render(source))
+
+    def test_load_image_for_output(self):
+        """测试按输出尺寸加载图片"""
+        jpeg_path = os.path.join(self.test_dir, "large.jpg")
+        png_path = os.path.join(self.test_dir, "large.png")
+        large = self.image.convert('RGB').resize((1600, 1040))
+        large.save(jpeg_path, quality=90)
+        large.save(png_path)
+
+        for path in (jpeg_path, png_path):
+            image, source_size = ImageProcessor.load_image_for_output(path, percentage=25)
+            self.assertEqual(source_size, (1600, 1040))
+            self.assertEqual((image.size, image.mode), ((400, 260), 'RGBA'))
+
+            image, _ = ImageProcessor.load_image_for_output(path, width=500, keep_native_mode=True)
+            self.assertEqual((image.size, image.mode), ((500, 325), 'RGB'))
+
+        # 不调整大小时与 load_image 相同
+        image, source_size = ImageProcessor.load_image_for_output(png_path)
+        self.assertEqual((image.size, source_size), ((1600, 1040), (1600, 1040)))
+        self.assertImagesEqual(image, ImageProcessor.load_image(png_path))
+
+
+class TestImageWatermarkCache(unittest.TestCase):
+    """测试类，用于验证图片水印资源缓存"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.test_dir = tempfile.mkdtemp()
+        self.temp_watermark_path = os.path.join(self.test_dir, "logo.png")
+        Image.new('RGBA', (60, 30), color=(255, 0, 0, 200)).save(self.temp_watermark_path)
+        ImageProcessor.clear_watermark_cache()
+
+    def tearDown(self):
+        """清理测试资源"""
+        ImageProcessor.clear_watermark_cache()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_cache_hit_and_parameters(self):
+        """测试相同参数命中缓存，不同参数分别缓存，不同透明度共用同一个图层"""
+        first = ImageProcessor.prepare_image_watermark(self.temp_watermark_path, 1.5, 30)
+        second = ImageProcessor.prepare_image_watermark(self.temp_watermark_path, 1.5, 30)
+        other = ImageProcessor.prepare_image_watermark(self.temp_watermark_path, 1.5, 45)
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+        self.assertEqual(first.tobytes(), ImageProcessor._render_image_watermark(
+            self.temp_watermark_path, 1.5, 30).tobytes())
+
+        # 透明度在合成时处理，图层保持原有的alpha
+        self.assertEqual(first.getpixel((first.width // 2, first.height // 2))[3], 200)
+        ImageProcessor.clear_watermark_cache()
+        base = Image.new('RGB', (200, 150), color=(0, 0, 255))
+        for opacity in (20, 50, 100):
+            ImageProcessor.add_image_watermark(base, self.temp_watermark_path, 'center', opacity)
+        self.assertEqual(len(ImageProcessor._watermark_cache), 1)
+
+    def test_cache_invalidated_when_file_changes(self):
+        """测试水印文件修改后缓存失效"""
+        first = ImageProcessor.prepare_image_watermark(self.temp_watermark_path)
+        Image.new('RGBA', (40, 40), color=(0, 0, 255, 255)).save(self.temp_watermark_path)
+        stat = os.stat(self.temp_watermark_path)
+        os.utime(self.temp_watermark_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        second = ImageProcessor.prepare_image_watermark(self.temp_watermark_path)
+        self.assertEqual(second.size, (40, 40))
+        self.assertNotEqual(first.size, second.size)
+
+    def test_cache_evicts_least_recently_used(self):
+        """测试缓存容量受限并按LRU淘汰"""
+        original_size = ImageProcessor.WATERMARK_CACHE_SIZE
+        ImageProcessor.WATERMARK_CACHE_SIZE = 2
+        try:
+            first = ImageProcessor.prepare_image_watermark(self.temp_watermark_path, 1.0, 10)
+            ImageProcessor.prepare_image_watermark(self.temp_watermark_path, 1.0, 20)
+            # 访问第一个条目，使第二个成为最久未使用的条目
+            ImageProcessor.prepare_image_watermark(self.temp_watermark_path, 1.0, 10)
+            ImageProcessor.prepare_image_watermark(self.temp_watermark_path, 1.0, 30)
+
+            self.assertEqual(len(ImageProcessor._watermark_cache), 2)
+            self.assertIs(ImageProcessor.prepare_image_watermark(self.temp_watermark_path, 1.0, 10), first)
+            rotations = [key[-1] for key in ImageProcessor._watermark_cache]
+            self.assertNotIn(20, rotations)
+        finally:
+            ImageProcessor.WATERMARK_CACHE_SIZE = original_size
+
+
+class TestTextStageCache(unittest.TestCase):
+    """测试类，用于验证文本水印分阶段渲染缓存"""
+
+    def setUp(self):
+        """设置测试环境"""
+        Watermark.clear_text_cache()
+        self.watermark = Watermark()
+        self.watermark.set_text_watermark("Stages", font_size=30, font_color=(200, 40, 90), opacity=60)
+
+    def tearDown(self):
+        """清理测试资源"""
+        Watermark.clear_text_cache()
+
+    def stage_sizes(self):
+        """返回各阶段缓存的条目数"""
+        return {stage: len(cache) for stage, cache in Watermark._text_stage_caches.items()}
+
+    def test_parameter_change_invalidates_downstream_stages(self):
+        """测试修改参数只重新渲染该参数所在阶段及其下游阶段"""
+        first = self.watermark.render_layer()
+        self.assertIs(self.watermark.render_layer(), first)
+
+        # 字形阶段缓存的是栅格化后的灰度蒙版
+        glyph = Watermark._text_stage_caches['glyph'][("Stages", None, 30)]
+        self.assertEqual(glyph.mode, 'L')
+        self.assertEqual(glyph.size, first.size)
+
+        # 修改位置不影响图层
+        self.watermark.set_position('top-left')
+        self.assertIs(self.watermark.render_layer(), first)
+        self.assertEqual(self.stage_sizes(), {'glyph': 1, 'styled': 1, 'rotated': 1})
+
+        # 修改透明度复用已栅格化的字形
+        self.watermark.set_text_watermark("Stages", font_size=30, font_color=(200, 40, 90), opacity=30)
+        self.watermark.render_layer()
+        self.assertEqual(self.stage_sizes(), {'glyph': 1, 'styled': 2, 'rotated': 2})
+
+        # 修改旋转
+        self.watermark.set_rotation(25)
+        self.watermark.render_layer()
+        self.assertEqual(self.stage_sizes(), {'glyph': 1, 'styled': 2, 'rotated': 3})
+
+        # 修改样式
+        self.watermark.set_style(has_stroke=True)
+        self.watermark.render_layer()
+        self.assertEqual(self.stage_sizes(), {'glyph': 1, 'styled': 3, 'rotated': 4})
+
+        # 修改文本才重新栅格化字形
+        self.watermark.set_text_watermark("Other", font_size=30, font_color=(200, 40, 90), opacity=30)
+        self.watermark.render_layer()
+        self.assertEqual(self.stage_sizes()['glyph'], 2)
+
+    def draw_directly(self, watermark):
+        """按分阶段缓存之前的方式直接用字体绘制文本、描边和阴影，然后旋转"""
+        font, text, text_width, text_height = watermark._measure_text(
+            watermark.text, watermark.font_name, watermark.font_size)
+        fill = watermark.font_color
+        shadow_color = (0, 0, 0, fill[3] // 2)
+        expected = Image.new('RGBA', (text_width + 20, text_height + 20), (255, 255, 255, 0))
+        draw = ImageDraw.Draw(expected)
+        if watermark.has_stroke:
+            for dx, dy in ((-2, 0), (2, 0), (0, -2), (0, 2), (-2, -2), (2, -2), (-2, 2), (2, 2)):
+                draw.text((10 + dx, 10 + dy), text, font=font, fill=shadow_color)
+        if watermark.has_shadow:
+            draw.text((12, 12), text, font=font, fill=shadow_color)
+        draw.text((10, 10), text, font=font, fill=fill)
+        if watermark.rotation != 0:
+            expected = expected.rotate(watermark.rotation, expand=True, resample=Image.BICUBIC)
+        return expected
+
+    def test_matches_direct_drawing(self):
+        """测试分阶段渲染与直接用字体绘制的结果逐像素一致"""
+        self.assertEqual(self.watermark.render_layer().tobytes(), self.draw_directly(self.watermark).tobytes())
+
+        # 描边、阴影和旋转的处理顺序与直接绘制相同
+        self.watermark.set_style(has_shadow=True, has_stroke=True)
+        self.watermark.set_rotation(20)
+        for opacity in (100, 60, 25):
+            self.watermark.set_text_watermark("Stages", font_size=30, font_color=(200, 40, 90), opacity=opacity)
+            self.assertEqual(self.watermark.render_layer().tobytes(), self.draw_directly(self.watermark).tobytes())
+
+        # 没有alpha通道的颜色按不透明处理
+        opaque = Watermark()
+        opaque.from_dict(self.watermark.to_dict())
+        opaque.font_color = (200, 40, 90)
+        self.assertIs(opaque.render_layer(), Watermark._text_stage_caches['rotated'][
+            ("Stages", None, 30, (200, 40, 90, 255), True, True, 20)])
+
+
+if __name__ == "__main__":
+    unittest.main()